@@ -0,0 +1,7 @@
+import sys
+
+from lib.cli import Cli
+
+
+if __name__ == '__main__':
+    sys.exit(Cli.main())
@@ -0,0 +1,229 @@
+# Index from address hashes to the wallet, chain and child index that own them
+#
+# Addresses of a set of xpubs are derived over configured ranges (see AddressRange) and their payloads (hash160,
+# P2SH script hash or the first 20 bytes of a taproot output key) are stored sorted in a file, looked up by binary
+# search through a read-only mmap. An optional Bloom filter in front answers most misses without touching the
+# records. The file keeps the xpubs and how far each chain was derived, so extend() only derives the new indexes.
+
+import bisect
+import heapq
+import itertools
+import json
+import mmap
+import struct
+
+from lib.address_range import AddressRange
+from lib.atomic_file import AtomicFile
+from lib.btc_address import BtcAddress
+from lib.parallel import Parallel
+
+
+class AddressIndex:
+
+    MAGIC = b'addrindx'
+    FORMAT_VERSION = 3
+    # magic | format version | metadata length | record count | Bloom filter length in bytes | Bloom hash count
+    HEADER = struct.Struct('>8sBIQQB')
+    # hash | wallet number | chain | index | kind number (in the kinds of the index)
+    RECORD = struct.Struct('>20sIIIB')
+    KEY_LENGTH = 20
+    CHUNK_SIZE = 4096
+    # Kind of a decoded address (see BtcAddress.decode_address) for each kind of address an index can hold
+    ADDRESS_KINDS = {'p2pkh': 'p2pkh', 'p2pkh-compressed': 'p2pkh', 'p2sh-p2wpkh': 'p2sh', 'p2wpkh': 'p2wpkh',
+                     'p2tr': 'p2tr'}
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) < AddressIndex.HEADER.size:
+            mm.close()
+            raise ValueError(f'Address index {path} has an unexpected format')
+        magic, format_version, metadata_len, count, bloom_len, bloom_hashes = AddressIndex.HEADER.unpack_from(mm)
+        metadata_start = AddressIndex.HEADER.size
+        bloom_start = metadata_start + metadata_len
+        records_start = bloom_start + bloom_len
+        if (magic != AddressIndex.MAGIC or format_version != AddressIndex.FORMAT_VERSION
+                or len(mm) != records_start + count * AddressIndex.RECORD.size):
+            mm.close()
+            raise ValueError(f'Address index {path} has an unexpected format')
+        metadata = json.loads(mm[metadata_start:bloom_start].decode('utf-8'))
+        self.path = path
+        self.wallets = metadata['wallets']
+        self.kinds = tuple(metadata['kinds'])
+        self.counts = {(wallet_id, chain): count for wallet_id, chain, count in metadata['counts']}
+        self.bloom_bits_per_key = metadata['bloom_bits_per_key']
+        self._wallet_ids = list(self.wallets)
+        # Decoded address kind -> numbers of the kinds of this index it can be
+        self._kind_numbers = {}
+        for number, kind in enumerate(self.kinds):
+            self._kind_numbers.setdefault(AddressIndex.ADDRESS_KINDS[kind], set()).add(number)
+        self._mm = mm
+        self._count = count
+        self._records_start = records_start
+        self._bloom = mm[bloom_start:records_start] if bloom_len else None
+        self._bloom_hashes = bloom_hashes
+        self._keys = _RecordKeys(mm, records_start, count)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __reduce__(self):
+        return AddressIndex, (self.path,)
+
+    def close(self):
+        self._mm.close()
+
+    @staticmethod
+    def bloom_positions(key: bytes, bits: int, hashes: int):
+        # Keys are hashes already: two 32-bit words of the key drive double hashing
+        h1, h2 = struct.unpack_from('>II', key)
+        return [(h1 + i * h2) % bits for i in range(hashes)]
+
+    @staticmethod
+    def lookup_key(address: str) -> tuple:
+        # Legacy, P2SH and segwit v0/v1 addresses to (address kind, the KEY_LENGTH bytes stored in the index)
+        kind, payload = BtcAddress.decode_address(address)
+        return kind, payload[:AddressIndex.KEY_LENGTH]
+
+    def lookup_hash(self, key: bytes, address_kind: str = None):
+        # Returns (wallet id, chain, index, kind) or None. Given the kind of the decoded address ('p2pkh', 'p2sh',
+        # 'p2wpkh' or 'p2tr'), only records of a compatible kind match, so kinds sharing a hash160 (p2wpkh and
+        # p2pkh-compressed) are told apart.
+        key = key[:AddressIndex.KEY_LENGTH]
+        kind_numbers = None if address_kind is None else self._kind_numbers.get(address_kind, ())
+        if kind_numbers == ():
+            return None
+        if self._bloom is not None:
+            bloom = self._bloom
+            for position in AddressIndex.bloom_positions(key, len(bloom) * 8, self._bloom_hashes):
+                if not bloom[position >> 3] & (1 << (position & 7)):
+                    return None
+        # Records with equal keys are adjacent: scan them for a matching kind
+        i = bisect.bisect_left(self._keys, key)
+        while i < self._count and self._keys[i] == key:
+            _, wallet, chain, index, kind = AddressIndex.RECORD.unpack_from(
+                self._mm, self._records_start + i * AddressIndex.RECORD.size)
+            if kind_numbers is None or kind in kind_numbers:
+                return self._wallet_ids[wallet], chain, index, self.kinds[kind]
+            i += 1
+        return None
+
+    def lookup(self, address: str):
+        try:
+            address_kind, key = AddressIndex.lookup_key(address)
+        except ValueError:
+            return None
+        return self.lookup_hash(key, address_kind)
+
+    def records(self):
+        # Raw records in key order
+        view = memoryview(self._mm)[self._records_start:self._records_start + self._count * AddressIndex.RECORD.size]
+        return AddressIndex.RECORD.iter_unpack(view)
+
+    @staticmethod
+    def build(path: str, wallets: dict, chains: dict, kinds=('p2wpkh',), bloom_bits_per_key: int = 10,
+              workers: int = 1) -> 'AddressIndex':
+        # wallets maps a wallet id to its account xpub (an xprv or ExtendedKey is reduced to its xpub: the index file
+        # only ever holds public keys); chains maps a chain to the number of indexes to derive on it, e.g.
+        # {0: 1000, 1: 100}. bloom_bits_per_key=0 leaves the Bloom filter out.
+        counts = {(wallet_id, chain): count for wallet_id in wallets for chain, count in chains.items()}
+        return AddressIndex._write(path, AddressIndex.public_wallets(wallets), tuple(kinds), counts, {}, [],
+                                   bloom_bits_per_key, workers)
+
+    @staticmethod
+    def public_wallets(wallets: dict) -> dict:
+        return {wallet_id: AddressRange.parse_extended_key(key).neuter().serialize_xpub()
+                for wallet_id, key in wallets.items()}
+
+    def extend(self, counts: dict, wallets: dict = None, bloom_bits_per_key: int = None,
+               workers: int = 1) -> 'AddressIndex':
+        # Raises the derived count of (wallet id, chain) pairs, e.g. when the gap limit of a chain advances, and adds
+        # new wallets. Only the new indexes are derived; the existing sorted records are merged with them. Returns
+        # the rewritten index and closes this one.
+        all_wallets = dict(self.wallets)
+        for wallet_id, xpub in AddressIndex.public_wallets(wallets or {}).items():
+            if all_wallets.get(wallet_id, xpub) != xpub:
+                raise ValueError(f'Wallet {wallet_id} is already indexed with a different key')
+            all_wallets[wallet_id] = xpub
+        new_counts = dict(self.counts)
+        for (wallet_id, chain), count in counts.items():
+            if wallet_id not in all_wallets:
+                raise ValueError(f'Unknown wallet {wallet_id}')
+            new_counts[(wallet_id, chain)] = max(count, new_counts.get((wallet_id, chain), 0))
+        if bloom_bits_per_key is None:
+            bloom_bits_per_key = self.bloom_bits_per_key
+        # Existing records refer to wallets by number: keep that numbering and append new wallets after it
+        existing = list(self.records())
+        self.close()
+        return AddressIndex._write(self.path, all_wallets, self.kinds, new_counts, self.counts, existing,
+                                   bloom_bits_per_key, workers)
+
+    @staticmethod
+    def _write(path: str, wallets: dict, kinds: tuple, counts: dict, derived: dict, existing: list,
+               bloom_bits_per_key: int, workers: int) -> 'AddressIndex':
+        for kind in kinds:
+            if kind not in AddressRange.KINDS:
+                raise ValueError(f'Unknown address kind {kind}, must be one of {", ".join(AddressRange.KINDS)}')
+        wallet_numbers = {wallet_id: i for i, wallet_id in enumerate(wallets)}
+        kind_numbers = tuple(range(len(kinds)))
+        tasks = []
+        for (wallet_id, chain), count in counts.items():
+            start = derived.get((wallet_id, chain), 0)
+            for chunk_start in range(start, count, AddressIndex.CHUNK_SIZE):
+                tasks.append((wallets[wallet_id], wallet_numbers[wallet_id], chain, chunk_start,
+                              min(AddressIndex.CHUNK_SIZE, count - chunk_start), kinds, kind_numbers))
+        new_records = sorted(itertools.chain.from_iterable(
+            Parallel.ordered_map(_index_records, tasks, workers=workers)))
+        records = list(heapq.merge(existing, new_records))
+
+        bloom = b''
+        bloom_hashes = 0
+        if bloom_bits_per_key and records:
+            bits = max(64, len(records) * bloom_bits_per_key)
+            bloom_hashes = max(1, min(16, round(bloom_bits_per_key * 0.69)))
+            bloom_array = bytearray((bits + 7) // 8)
+            bits = len(bloom_array) * 8
+            for record in records:
+                for position in AddressIndex.bloom_positions(record[0], bits, bloom_hashes):
+                    bloom_array[position >> 3] |= 1 << (position & 7)
+            bloom = bytes(bloom_array)
+
+        metadata = json.dumps({
+            'wallets': wallets,
+            'kinds': list(kinds),
+            'counts': [[wallet_id, chain, count] for (wallet_id, chain), count in counts.items()],
+            'bloom_bits_per_key': bloom_bits_per_key,
+        }).encode('utf-8')
+        header = AddressIndex.HEADER.pack(AddressIndex.MAGIC, AddressIndex.FORMAT_VERSION, len(metadata),
+                                          len(records), len(bloom), bloom_hashes)
+        # Readers never see a partial index
+        pack = AddressIndex.RECORD.pack
+        AtomicFile.write(path, (header + metadata + bloom, b''.join(pack(*record) for record in records)))
+        return AddressIndex(path)
+
+
+class _RecordKeys:
+    # Sequence of the record keys for bisect, read from the mmap on demand
+
+    __slots__ = ('_mm', '_start', '_count')
+
+    def __init__(self, mm: mmap.mmap, start: int, count: int):
+        self._mm = mm
+        self._start = start
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        offset = self._start + i * AddressIndex.RECORD.size
+        return self._mm[offset:offset + AddressIndex.KEY_LENGTH]
+
+
+def _index_records(task):
+    xpub, wallet_number, chain, start, count, kinds, kind_numbers = task
+    records = []
+    for index, _, _, payloads in AddressRange.derive_payload_range(xpub, chain, start, count, kinds):
+        for kind_number, payload in zip(kind_numbers, payloads):
+            records.append((payload[:AddressIndex.KEY_LENGTH], wallet_number, chain, index, kind_number))
+    return records
@@ -0,0 +1,139 @@
+# Bulk derivation of consecutive addresses on a BIP32 chain (e.g. m/84'/0'/0'/0/start..start+count-1)
+
+import struct
+
+from lib import secp256k1
+from lib.bip32 import Bip32, ExtendedKey
+from lib.btc_address import BtcAddress
+from lib.hashing import Hashing
+from lib.secp256k1 import Secp256k1
+
+
+class AddressRange:
+
+    KINDS = BtcAddress.KINDS
+    BATCH_SIZE = 256
+
+    @staticmethod
+    def address_payload(kind: str, point, hashed_compressed_pubkey: bytes, taproot_output_key: bytes = None) -> bytes:
+        # The hash (or taproot output key) an address of this kind commits to, as BtcAddress.decode_address() returns
+        if kind == 'p2pkh':
+            # Legacy addresses hash the uncompressed public key, as BtcAddress.derive_public_addresses() does
+            return Hashing.hash160(secp256k1.backend.uncompress(point))
+        if kind == 'p2sh-p2wpkh':
+            return Hashing.hash160_prefixed(b'\x00\x14', hashed_compressed_pubkey)
+        if kind == 'p2tr':
+            if taproot_output_key is None:
+                taproot_output_key = BtcAddress.taproot_output_key(secp256k1.backend.compress(point))
+            return taproot_output_key
+        return hashed_compressed_pubkey
+
+    @staticmethod
+    def encode_address(kind: str, point, hashed_compressed_pubkey: bytes, taproot_output_key: bytes = None) -> str:
+        payload = AddressRange.address_payload(kind, point, hashed_compressed_pubkey, taproot_output_key)
+        if kind in ('p2pkh', 'p2pkh-compressed'):
+            return BtcAddress.p2pkh_address(payload)
+        if kind == 'p2sh-p2wpkh':
+            return BtcAddress.p2sh_address(payload)
+        if kind == 'p2tr':
+            return BtcAddress.p2tr_address(payload)
+        return BtcAddress.p2wpkh_address(payload)
+
+    @staticmethod
+    def parse_extended_key(xpub_or_xprv) -> ExtendedKey:
+        if isinstance(xpub_or_xprv, ExtendedKey):
+            return xpub_or_xprv
+        return Bip32.deserialize(xpub_or_xprv)
+
+    @staticmethod
+    def derive_address_range(xpub_or_xprv, chain: int, start: int, count: int, kinds=('p2wpkh',),
+                             batch_size: int = BATCH_SIZE):
+        # Yields (index, compressed public key, hash160 of the compressed public key, addresses) for every index in
+        # start..start+count-1, where addresses is a tuple following the order of kinds.
+        for index, point, public_bytes, hashed_pubkey, output_key in AddressRange.derive_points(
+                xpub_or_xprv, chain, start, count, kinds, batch_size):
+            addresses = tuple(AddressRange.encode_address(kind, point, hashed_pubkey, output_key) for kind in kinds)
+            yield index, public_bytes, hashed_pubkey, addresses
+
+    @staticmethod
+    def derive_payload_range(xpub_or_xprv, chain: int, start: int, count: int, kinds=('p2wpkh',),
+                             batch_size: int = BATCH_SIZE):
+        # As derive_address_range(), with the address payloads (see address_payload()) instead of address strings
+        for index, point, public_bytes, hashed_pubkey, output_key in AddressRange.derive_points(
+                xpub_or_xprv, chain, start, count, kinds, batch_size):
+            payloads = tuple(AddressRange.address_payload(kind, point, hashed_pubkey, output_key) for kind in kinds)
+            yield index, public_bytes, hashed_pubkey, payloads
+
+    @staticmethod
+    def derive_points(xpub_or_xprv, chain: int, start: int, count: int, kinds, batch_size: int = BATCH_SIZE):
+        # Yields (index, backend point, compressed public key, its hash160, taproot output key or None).
+        #
+        # Every child costs one fixed-base multiplication in Jacobian coordinates (plus one mixed addition of the
+        # chain public key for xpubs); each batch is then brought back to affine coordinates with a single
+        # modular inversion. The HMAC of the chain code over the chain public key is keyed once and copied per
+        # index. With a native secp256k1 backend, points are computed one by one through the backend instead.
+        # P2TR output keys (BIP 86) get the same treatment: the tweaked points of a batch share one inversion.
+        for kind in kinds:
+            if kind not in AddressRange.KINDS:
+                raise ValueError(f'Unknown address kind {kind}, must be one of {", ".join(AddressRange.KINDS)}')
+        if start < 0 or count < 0 or start + count > 0x80000000:
+            raise ValueError('Address range must stay within non-hardened indexes')
+
+        backend = secp256k1.backend
+        native = backend is not secp256k1.PythonBackend
+        chain_node = AddressRange.parse_extended_key(xpub_or_xprv).child(chain)
+        hmac_state = Hashing.hmac_sha512_state(chain_node.chain_code, chain_node.public_bytes)
+        chain_private_int = chain_node.private_int
+        chain_point = None if chain_node.is_private else backend.decompress(chain_node.public_bytes)
+
+        taproot = 'p2tr' in kinds
+        N = Secp256k1.N
+        for batch_start in range(start, start + count, batch_size):
+            indexes = range(batch_start, min(batch_start + batch_size, start + count))
+            points = []
+            for index in indexes:
+                IL_int = Bip32.bytes_to_int(Hashing.hmac_sha512_from_state(hmac_state, struct.pack('>I', index))[:32])
+                if IL_int >= N:
+                    raise ValueError('Generated an invalid child key; very improbable. Please choose a different index')
+                if chain_point is None:
+                    child_private_int = (IL_int + chain_private_int) % N
+                    if child_private_int == 0:
+                        raise ValueError('Generated an invalid child key; very improbable. '
+                                         'Please choose a different index')
+                    if native:
+                        point = backend.point_from_scalar(child_private_int)
+                    else:
+                        point = Secp256k1.multiply_generator_jacobian(child_private_int)
+                elif native:
+                    point = backend.point_add(chain_point, backend.point_from_scalar(IL_int))
+                else:
+                    point = Secp256k1.jacobian_add_affine(Secp256k1.multiply_generator_jacobian(IL_int), chain_point)
+                    if point[2] == 0:
+                        raise ValueError('Generated an invalid child key; very improbable. '
+                                         'Please choose a different index')
+                points.append(point)
+            if not native:
+                points = Secp256k1.batch_to_affine(points)
+            output_keys = [None] * len(points)
+            if taproot and not native:
+                output_keys = AddressRange.taproot_output_keys(points)
+
+            for index, point, output_key in zip(indexes, points, output_keys):
+                public_bytes = backend.compress(point)
+                yield index, point, public_bytes, Hashing.hash160(public_bytes), output_key
+
+    @staticmethod
+    def taproot_output_keys(points) -> list:
+        # BtcAddress.taproot_output_key() for affine points of the Python backend, with a single inversion. The
+        # internal key is the point itself when y is even, its negation otherwise, so no square root is needed.
+        P = Secp256k1.P
+        tweaked = []
+        for x, y in points:
+            x_only_pubkey = x.to_bytes(32, 'big')
+            internal_point = (x, y) if y % 2 == 0 else (x, P - y)
+            tweak = BtcAddress.taproot_tweak(x_only_pubkey)
+            point = Secp256k1.jacobian_add_affine(Secp256k1.multiply_generator_jacobian(tweak), internal_point)
+            if point[2] == 0:
+                raise ValueError('Invalid taproot output key; very improbable')
+            tweaked.append(point)
+        return [x.to_bytes(32, 'big') for x, _ in Secp256k1.batch_to_affine(tweaked)]
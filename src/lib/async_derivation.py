@@ -0,0 +1,126 @@
+# asyncio front end for derivation services
+#
+# CPU work runs on an executor (a thread pool owned by the instance unless one is passed in; hashlib releases the
+# GIL during PBKDF2 and HMAC, and a ProcessPoolExecutor can be passed for EC-heavy loads) so the event loop never
+# blocks. Concurrent identical requests share one computation. address() requests are queued until the loop has run
+# every ready task, then the queued indexes of each (xpub, chain, kind) are grouped into runs of nearby indexes and
+# each run is derived with one AddressRange call: a burst of requests for the same next unused address costs one
+# derivation, and requests for consecutive indexes share the chain key and batched inversions.
+
+import asyncio
+import concurrent.futures
+
+from lib.address_range import AddressRange
+from lib.bip32 import Bip32, ExtendedKey
+from lib.bip39 import Bip39
+
+
+class AsyncDerivation:
+
+    def __init__(self, executor: concurrent.futures.Executor = None, workers: int = None, max_gap: int = 8,
+                 batch_delay: float = 0.0):
+        # max_gap: indexes at most this far apart are derived in the same range (the gap is derived and dropped).
+        # batch_delay: seconds to wait for more address() requests before deriving a batch.
+        self._owns_executor = executor is None
+        self._executor = executor or concurrent.futures.ThreadPoolExecutor(workers)
+        self.max_gap = max_gap
+        self.batch_delay = batch_delay
+        self._in_flight = {}
+        self._pending = {}              # (xpub, chain, kind) -> {index: future}
+        self._flush_handle = None
+        self.computations = 0           # executor jobs submitted
+        self.coalesced = 0              # requests answered by a computation already in flight
+
+    async def __aenter__(self) -> 'AsyncDerivation':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._owns_executor:
+            await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    async def seed(self, mnemonic: str, passphrase: str = '') -> bytes:
+        return await self._coalesce(('seed', mnemonic, passphrase), Bip39.mnemonic_and_passphrase_to_seed,
+                                    mnemonic, passphrase)
+
+    async def derive_from_path(self, seed_bytes: bytes, path: str):
+        # Same result as Bip32.derive_from_path()
+        return await self._coalesce(('path', seed_bytes, path), Bip32.derive_from_path, seed_bytes, path)
+
+    async def address(self, xpub_or_xprv, chain: int, index: int, kind: str = 'p2wpkh') -> str:
+        if isinstance(xpub_or_xprv, ExtendedKey):
+            xpub_or_xprv = xpub_or_xprv.serialize()
+        if kind not in AddressRange.KINDS:
+            raise ValueError(f'Unknown address kind {kind}, must be one of {", ".join(AddressRange.KINDS)}')
+        if not (0 <= index < 0x80000000):
+            raise ValueError('Address index must be non-hardened')
+        key = ('address', xpub_or_xprv, chain, index, kind)
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        loop = asyncio.get_running_loop()
+        future = self._in_flight[key] = loop.create_future()
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        self._pending.setdefault((xpub_or_xprv, chain, kind), {})[index] = future
+        if self._flush_handle is None:
+            if self.batch_delay > 0:
+                self._flush_handle = loop.call_later(self.batch_delay, self._flush)
+            else:
+                self._flush_handle = loop.call_soon(self._flush)
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def derive_range(xpub_or_xprv, chain: int, start: int, count: int, kind: str) -> list:
+        # Runs in the executor: the addresses of start..start+count-1
+        return [addresses[0] for _, _, _, addresses in AddressRange.derive_address_range(
+            xpub_or_xprv, chain, start, count, kinds=(kind,))]
+
+    @staticmethod
+    def index_runs(indexes, max_gap: int) -> list:
+        # Sorted indexes to (start, count) ranges covering them, splitting where the gap exceeds max_gap
+        runs = []
+        for index in sorted(indexes):
+            if runs and index - (runs[-1][0] + runs[-1][1]) <= max_gap:
+                runs[-1][1] = index - runs[-1][0] + 1
+            else:
+                runs.append([index, 1])
+        return [tuple(run) for run in runs]
+
+    def _flush(self):
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        loop = asyncio.get_running_loop()
+        for (xpub_or_xprv, chain, kind), futures in pending.items():
+            for start, count in AsyncDerivation.index_runs(futures, self.max_gap):
+                run_futures = {index: futures[index] for index in range(start, start + count) if index in futures}
+                self.computations += 1
+                job = loop.run_in_executor(self._executor, AsyncDerivation.derive_range, xpub_or_xprv, chain, start,
+                                           count, kind)
+                job.add_done_callback(lambda job, start=start, run_futures=run_futures:
+                                      AsyncDerivation._resolve(job, start, run_futures))
+
+    @staticmethod
+    def _resolve(job: asyncio.Future, start: int, futures: dict):
+        exception = None if job.cancelled() else job.exception()
+        for index, future in futures.items():
+            if future.done():
+                continue
+            if job.cancelled():
+                future.cancel()
+            elif exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(job.result()[index - start])
+
+    async def _coalesce(self, key, fn, *args):
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        self.computations += 1
+        future = self._in_flight[key] = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
@@ -0,0 +1,30 @@
+# Atomic file replacement: write to a unique temporary file in the target directory, then rename it over the target,
+# so readers (other processes, concurrent workers) see either the old file or the complete new one, never a partial one
+
+import os
+import tempfile
+
+
+class AtomicFile:
+
+    @staticmethod
+    def write(path: str, data, mode: int = 0o644, fsync: bool = False):
+        # data is bytes-like or an iterable of bytes-like chunks. mode is applied before the rename. fsync=True
+        # flushes the data to disk before the rename, so the new file also survives a crash of the machine.
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = (data,)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in data:
+                    f.write(chunk)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
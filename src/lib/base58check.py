@@ -0,0 +1,83 @@
+# Base58Check codec (https://en.bitcoin.it/wiki/Base58Check_encoding) used by WIF, legacy / P2SH addresses and
+# extended keys
+
+from lib.hashing import Hashing
+
+_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+# Digits are produced and consumed two at a time (58**2 = 3364), halving the number of big-int divisions
+_ENCODE_PAIRS = tuple(a + b for a in _ALPHABET for b in _ALPHABET)
+_DECODE_PAIRS = {pair: value for value, pair in enumerate(_ENCODE_PAIRS)}
+_DECODE_DIGITS = {c: value for value, c in enumerate(_ALPHABET)}
+
+
+class Base58Check:
+
+    ALPHABET = _ALPHABET
+
+    # Payload lengths (without the 4-byte checksum) of the strings we handle
+    ADDRESS_LENGTH = 21                 # version | hash160
+    WIF_LENGTH = 34                     # 0x80 | private key | 0x01 (compressed)
+    WIF_UNCOMPRESSED_LENGTH = 33        # 0x80 | private key
+    EXTENDED_KEY_LENGTH = 78            # version | depth | parent fingerprint | index | chain code | key data
+
+    checksum = staticmethod(Hashing.checksum)
+
+    @staticmethod
+    def encode(data: bytes) -> str:
+        n = int.from_bytes(data, 'big')
+        pairs = _ENCODE_PAIRS
+        chunks = []
+        while n:
+            n, r = divmod(n, 3364)
+            chunks.append(pairs[r])
+        chunks.reverse()
+        # The last pair may start with a padding zero digit; leading zero bytes are encoded as '1' each
+        encoded = ''.join(chunks).lstrip('1')
+        zeros = len(data) - len(data.lstrip(b'\x00'))
+        return '1' * zeros + encoded
+
+    @staticmethod
+    def decode(s: str, length: int = None) -> bytes:
+        # length, when given, is the expected number of decoded bytes
+        digits = s.lstrip('1')
+        zeros = len(s) - len(digits)
+        try:
+            if len(digits) % 2:
+                n = _DECODE_DIGITS[digits[0]]
+                start = 1
+            else:
+                n = 0
+                start = 0
+            pairs = _DECODE_PAIRS
+            for i in range(start, len(digits), 2):
+                n = n * 3364 + pairs[digits[i:i + 2]]
+        except KeyError:
+            raise ValueError(f'Invalid base58 string {s}')
+        size = zeros + (n.bit_length() + 7) // 8
+        if length is not None and size != length:
+            raise ValueError(f'Invalid base58 string length {s}, expected {length} bytes')
+        return n.to_bytes(size, 'big')
+
+    @staticmethod
+    def encode_check(payload: bytes, prefix: bytes = b'') -> str:
+        # Encodes prefix + payload; a constant prefix such as a version byte is hashed from a cached state
+        if prefix:
+            return Base58Check.encode(prefix + payload + Hashing.checksum_prefixed(prefix, payload))
+        return Base58Check.encode(payload + Hashing.checksum(payload))
+
+    @staticmethod
+    def decode_check(s: str, length: int = None) -> bytes:
+        # Returns the payload without its checksum; length is the expected payload length
+        data = Base58Check.decode(s, None if length is None else length + 4)
+        payload = data[:-4]
+        if len(data) < 4 or Hashing.checksum(payload) != data[-4:]:
+            raise ValueError(f'Invalid base58 checksum {s}')
+        return payload
+
+    @staticmethod
+    def encode_batch(payloads) -> list:
+        return [Base58Check.encode_check(payload) for payload in payloads]
+
+    @staticmethod
+    def decode_batch(strings, length: int = None) -> list:
+        return [Base58Check.decode_check(s, length) for s in strings]
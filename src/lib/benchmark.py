@@ -0,0 +1,185 @@
+# Benchmarks of the hot paths: python -m lib.benchmark --help
+#
+# Every case is timed for single operations and for batches, in ops/sec (best of a few rounds of at least min_time
+# seconds, so background noise only ever slows a round down), and traced once with tracemalloc for the peak bytes
+# allocated per operation. Results are saved as a JSON baseline; compare() flags cases slower (or allocating more)
+# than the baseline by more than a threshold. Baselines are specific to a machine and Python version, and results are
+# kept per secp256k1 backend: a run is only compared with the baseline of the backend it used.
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from lib import secp256k1
+from lib.address_range import AddressRange
+from lib.bip32 import Bip32, ExtendedKey
+from lib.bip39 import Bip39
+from lib.btc_address import BtcAddress
+
+
+class Benchmark:
+
+    DEFAULT_BASELINE = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                                     'benchmarks', 'baseline.json'))
+    DEFAULT_THRESHOLD = 0.25
+    BATCH_SIZE = 100
+
+    MNEMONIC = 'abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about'
+    SEED = bytes.fromhex('000102030405060708090a0b0c0d0e0f')
+    PRIVATE_KEY = bytes.fromhex('e8f32e723decf4051aefac8e2c93c9c5b214313817cdb01a1494b917c8436b35')
+    PATH = "m/84'/0'/0'/0/0"
+
+    @staticmethod
+    def cases() -> dict:
+        # name -> (function called with no arguments, operations per call)
+        n = Benchmark.BATCH_SIZE
+        # Distinct inputs, so batches cannot be served by caches or deduplication
+        mnemonics = [Bip39.entropy_to_mnemonic(i.to_bytes(16, 'big')) for i in range(n)]
+        pairs = [(mnemonic, 'TREZOR') for mnemonic in mnemonics[:10]]
+        private_keys = [(i + 1).to_bytes(32, 'big') for i in range(n)]
+        node = ExtendedKey.from_seed(Benchmark.SEED).derive(Benchmark.PATH)
+        account_xpub = ExtendedKey.from_seed(Benchmark.SEED).derive("m/84'/0'/0'").neuter()
+        depth, parent_fingerprint, index, chain_code, private_int = node.to_tuple()
+        wif = BtcAddress.convert_private_key_into_wif(Benchmark.PRIVATE_KEY)
+        wifs = [BtcAddress.convert_private_key_into_wif(private_key) for private_key in private_keys]
+        return {
+            'bip39.mnemonic_to_entropy': (lambda: Bip39.mnemonic_to_entropy(Benchmark.MNEMONIC), 1),
+            'bip39.mnemonic_to_entropy_batch': (lambda: Bip39.mnemonic_to_entropy_batch(mnemonics), n),
+            'bip39.mnemonic_and_passphrase_to_seed': (
+                lambda: Bip39.mnemonic_and_passphrase_to_seed(Benchmark.MNEMONIC, 'TREZOR'), 1),
+            'bip39.mnemonic_and_passphrase_to_seed_batch': (
+                lambda: list(Bip39.mnemonic_and_passphrase_to_seed_batch(pairs, workers=1)), 10),
+            'bip32.derive_from_path': (lambda: Bip32.derive_from_path(Benchmark.SEED, Benchmark.PATH), 1),
+            'bip32.derive_template_batch': (
+                lambda: [leaf.public_bytes for _, leaf in ExtendedKey.from_seed(Benchmark.SEED).derive_template(
+                    f"m/84'/0'/0'/0/0-{n - 1}")], n),
+            'bip32.serialize_xprv': (
+                lambda: Bip32.serialize_xprv(depth, parent_fingerprint, index, chain_code, private_int), 1),
+            'bip32.serialize_xpub': (
+                lambda: Bip32.serialize_xpub(depth, parent_fingerprint, index, chain_code, private_int), 1),
+            'btc_address.derive_public_addresses': (
+                lambda: BtcAddress.derive_public_addresses(Benchmark.PRIVATE_KEY), 1),
+            'btc_address.derive_public_addresses_batch': (
+                lambda: [BtcAddress.derive_public_addresses(private_key) for private_key in private_keys], n),
+            'address_range.derive_address_range_batch': (
+                lambda: list(AddressRange.derive_address_range(account_xpub, 0, 0, n, BtcAddress.KINDS)), n),
+            'btc_address.convert_private_key_into_wif': (
+                lambda: BtcAddress.convert_private_key_into_wif(Benchmark.PRIVATE_KEY), 1),
+            'btc_address.convert_private_key_into_wif_batch': (
+                lambda: [BtcAddress.convert_private_key_into_wif(private_key) for private_key in private_keys], n),
+            'btc_address.convert_wif_into_private_key': (lambda: BtcAddress.convert_wif_into_private_key(wif), 1),
+            'btc_address.convert_wif_into_private_key_batch': (
+                lambda: [BtcAddress.convert_wif_into_private_key(wif) for wif in wifs], n),
+        }
+
+    @staticmethod
+    def measure(fn, ops: int = 1, min_time: float = 0.2, rounds: int = 3) -> dict:
+        fn()                                    # warm up caches and lazy tables
+        best = 0.0
+        for _ in range(rounds):
+            calls = 0
+            start = time.perf_counter()
+            elapsed = 0.0
+            while elapsed < min_time:
+                fn()
+                calls += 1
+                elapsed = time.perf_counter() - start
+            best = max(best, calls * ops / elapsed)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+        return {'ops_per_sec': round(best, 1), 'peak_bytes_per_op': round((peak - before) / ops, 1)}
+
+    @staticmethod
+    def run(names=None, min_time: float = 0.2, rounds: int = 3) -> dict:
+        cases = Benchmark.cases()
+        for name in names or ():
+            if name not in cases:
+                raise ValueError(f'Unknown benchmark {name}')
+        return {name: Benchmark.measure(fn, ops, min_time, rounds)
+                for name, (fn, ops) in cases.items() if not names or name in names}
+
+    @staticmethod
+    def load_baseline(path: str, backend: str = None) -> dict:
+        # Results of the given secp256k1 backend (default: the active one); {} when it has none
+        with open(path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        return baseline.get('backends', {}).get(backend or secp256k1.backend.name, {})
+
+    @staticmethod
+    def save_baseline(path: str, results: dict, backend: str = None):
+        # Replaces the results of the given backend (default: the active one) and keeps those of the others
+        backend = backend or secp256k1.backend.name
+        backends = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                backends = json.load(f).get('backends', {})
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        baseline = {'python': sys.version.split()[0], 'backends': {**backends, backend: results}}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    @staticmethod
+    def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+        # Returns a message per regression; cases missing from the baseline are skipped
+        regressions = []
+        for name, result in results.items():
+            reference = baseline.get(name)
+            if reference is None:
+                continue
+            if result['ops_per_sec'] < reference['ops_per_sec'] * (1 - threshold):
+                regressions.append(f'{name}: {result["ops_per_sec"]:.1f} ops/sec, baseline '
+                                   f'{reference["ops_per_sec"]:.1f} ops/sec')
+            # A few hundred bytes of slack: the peak of tiny operations moves with interpreter internals
+            if result['peak_bytes_per_op'] > reference['peak_bytes_per_op'] * (1 + threshold) + 256:
+                regressions.append(f'{name}: {result["peak_bytes_per_op"]:.0f} bytes/op, baseline '
+                                   f'{reference["peak_bytes_per_op"]:.0f} bytes/op')
+        return regressions
+
+    @staticmethod
+    def main(argv=None, stdout=None) -> int:
+        stdout = stdout or sys.stdout
+        parser = argparse.ArgumentParser(prog='python -m lib.benchmark', description='Benchmark the hot paths.')
+        parser.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+        parser.add_argument('--baseline', default=Benchmark.DEFAULT_BASELINE, help='baseline JSON file')
+        parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+        parser.add_argument('--threshold', type=float, default=Benchmark.DEFAULT_THRESHOLD,
+                            help=f'allowed slowdown versus the baseline (default: {Benchmark.DEFAULT_THRESHOLD})')
+        parser.add_argument('--min-time', type=float, default=0.2, help='seconds per round (default: 0.2)')
+        parser.add_argument('--rounds', type=int, default=3, help='rounds per benchmark, best is kept (default: 3)')
+        args = parser.parse_args(argv)
+        try:
+            results = Benchmark.run(args.names, args.min_time, args.rounds)
+        except ValueError as e:
+            parser.error(str(e))
+        baseline = Benchmark.load_baseline(args.baseline) if os.path.exists(args.baseline) else {}
+        if not baseline:
+            stdout.write(f'No baseline for the {secp256k1.backend.name} secp256k1 backend in {args.baseline}\n')
+        for name, result in results.items():
+            reference = baseline.get(name)
+            change = f' ({result["ops_per_sec"] / reference["ops_per_sec"] - 1:+.0%})' if reference else ''
+            stdout.write(f'{name:50} {result["ops_per_sec"]:14.1f} ops/sec{change:8} '
+                         f'{result["peak_bytes_per_op"]:10.0f} bytes/op\n')
+        if args.save:
+            Benchmark.save_baseline(args.baseline, {**baseline, **results})
+            return 0
+        regressions = Benchmark.compare(results, baseline, args.threshold)
+        for regression in regressions:
+            stdout.write(f'REGRESSION {regression}\n')
+        return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(Benchmark.main())
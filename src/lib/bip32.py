@@ -1,25 +1,39 @@
 # BIP 0032 : HD Wallets
 # https://en.bitcoin.it/wiki/BIP_0032
 
-import hashlib
-import hmac
+import collections
+import itertools
 import struct
+import threading
 
-import base58
-import ecdsa
+from lib import secp256k1
+from lib.base58check import Base58Check
+from lib.hashing import Hashing
+from lib.secp256k1 import Secp256k1
 
 
 class Bip32:
 
-    N = ecdsa.SECP256k1.order
+    N = Secp256k1.N
 
-    @staticmethod
-    def sha256(b: bytes) -> bytes:
-        return hashlib.sha256(b).digest()
+    # Serialization versions by key type: (private version, public version, network). SLIP-132 y/z (and testnet u/v)
+    # keys mark BIP49 P2SH-P2WPKH and BIP84 P2WPKH accounts.
+    # Ref: https://github.com/satoshilabs/slips/blob/master/slip-0132.md
+    KEY_TYPES = {
+        'x': (bytes.fromhex('0488ADE4'), bytes.fromhex('0488B21E'), 'mainnet'),
+        'y': (bytes.fromhex('049D7878'), bytes.fromhex('049D7CB2'), 'mainnet'),
+        'z': (bytes.fromhex('04B2430C'), bytes.fromhex('04B24746'), 'mainnet'),
+        't': (bytes.fromhex('04358394'), bytes.fromhex('043587CF'), 'testnet'),
+        'u': (bytes.fromhex('044A4E28'), bytes.fromhex('044A5262'), 'testnet'),
+        'v': (bytes.fromhex('045F18BC'), bytes.fromhex('045F1CF6'), 'testnet'),
+    }
+    # Version bytes -> (key type, is private)
+    VERSIONS = {version: (key_type, i == 0) for key_type, versions in KEY_TYPES.items()
+                for i, version in enumerate(versions[:2])}
 
-    @staticmethod
-    def ripemd160(b: bytes) -> bytes:
-        return hashlib.new('ripemd160', b).digest()
+    # Aliases of lib.hashing, kept for existing callers
+    sha256 = staticmethod(Hashing.sha256)
+    ripemd160 = staticmethod(Hashing.ripemd160)
 
     @staticmethod
     def int_to_bytes(i: int, length: int) -> bytes:
@@ -29,18 +43,22 @@ class Bip32:
     def bytes_to_int(b: bytes) -> int:
         return int.from_bytes(b, 'big')
 
+    @staticmethod
+    def public_from_private(private_int: int) -> bytes:
+        backend = secp256k1.backend
+        return backend.compress(backend.point_from_scalar(private_int))
+
     @staticmethod
     def fingerprint_from_private(private_int: int):
-        public = ecdsa.SigningKey.from_secret_exponent(private_int, curve=ecdsa.SECP256k1).verifying_key
-        public_bytes = public.to_string('compressed')
-        fingerprint = Bip32.ripemd160(Bip32.sha256(public_bytes))[:4]
+        public_bytes = Bip32.public_from_private(private_int)
+        fingerprint = Hashing.hash160(public_bytes)[:4]
         return fingerprint
 
     @staticmethod
     def master_key_from_seed(seed_bytes: bytes):
         if not (16 <= len(seed_bytes) <= 64):
             raise ValueError('Seed length must be between 16 and 64 bytes for BIP32')
-        I = hmac.new(b'Bitcoin seed', seed_bytes, hashlib.sha512).digest()
+        I = Hashing.hmac_sha512(b'Bitcoin seed', seed_bytes)
         IL, IR = I[:32], I[32:]
         master_private_int = Bip32.bytes_to_int(IL)
         if master_private_int == 0 or master_private_int >= Bip32.N:
@@ -67,17 +85,64 @@ class Bip32:
         return result
 
     @staticmethod
-    def derive_child_key(parent_private_int: int, parent_chain_code: bytes, index: int):
+    def format_path(indexes) -> str:
+        return '/'.join(['m'] + [f"{index & 0x7fffffff}'" if index & 0x80000000 else str(index) for index in indexes])
+
+    @staticmethod
+    def parse_path_template(template: str):
+        # Path with sets and ranges of indexes, e.g. "m/84'/0'/{0,1}'/{0,1}/0-999" or "m/84'/0'/0'/0/*". Returns
+        # one tuple of ranges per level. A hardened mark applies to the whole range: {0-2}' and 0-2' are 0', 1', 2'.
+        # '*' is every non-hardened (or, as *', hardened) index, meant to be consumed lazily.
+        if template == 'm':
+            return []
+        if not template.startswith('m/'):
+            raise ValueError('Path must start with "m/"')
+        segments = []
+        for element in template[2:].split('/'):
+            hardened = 0
+            if element[-1:] in ("'", 'h', 'H') and (element.startswith('{') or element[:-1] == '*'):
+                hardened, element = 0x80000000, element[:-1]
+            if element.startswith('{') and element.endswith('}'):
+                items = element[1:-1].split(',')
+            else:
+                items = [element]
+            ranges = []
+            for item in items:
+                item_hardened = hardened
+                if item[-1:] in ("'", 'h', 'H'):
+                    item_hardened, item = 0x80000000, item[:-1]
+                if item == '*':
+                    first, last = 0, 0x7fffffff
+                elif '-' in item:
+                    first, last = item.split('-', 1)
+                    first, last = int(first.rstrip("'hH")), int(last)
+                else:
+                    first = last = int(item)
+                if not (0 <= first <= last <= 0x7fffffff):
+                    raise ValueError(f'Invalid path template element {element}')
+                ranges.append(range(item_hardened | first, (item_hardened | last) + 1))
+            segments.append(tuple(ranges))
+        return segments
+
+    @staticmethod
+    def expand_path_template(template):
+        # Every path of a template as a tuple of indexes, in depth-first order
+        segments = Bip32.parse_path_template(template) if isinstance(template, str) else template
+        return itertools.product(*[itertools.chain.from_iterable(ranges) for ranges in segments])
+
+    @staticmethod
+    def derive_child_key(parent_private_int: int, parent_chain_code: bytes, index: int,
+                         parent_public_bytes: bytes = None):
         assert 0 <= index < 2**32
         if index >= 0x80000000:
             # Hardened
             data = b'\x00' + Bip32.int_to_bytes(parent_private_int, 32) + struct.pack('>I', index)
         else:
             # Non-hardened
-            public = ecdsa.SigningKey.from_secret_exponent(parent_private_int, curve=ecdsa.SECP256k1).verifying_key
-            public_bytes = public.to_string('compressed')
-            data = public_bytes + struct.pack('>I', index)
-        I = hmac.new(parent_chain_code, data, hashlib.sha512).digest()
+            if parent_public_bytes is None:
+                parent_public_bytes = Bip32.public_from_private(parent_private_int)
+            data = parent_public_bytes + struct.pack('>I', index)
+        I = Hashing.hmac_sha512(parent_chain_code, data)
         IL, IR = I[:32], I[32:]
         child_private_int = (Bip32.bytes_to_int(IL) + parent_private_int) % Bip32.N
         if child_private_int == 0 or Bip32.bytes_to_int(IL) >= Bip32.N:
@@ -88,62 +153,329 @@ class Bip32:
         return child_private_int, child_chain_code
 
     @staticmethod
-    def derive_from_path(seed_bytes: bytes, path: str):
-        parent_fingerprint = b'\x00\x00\x00\x00'
-        private_int, chain_code = Bip32.master_key_from_seed(seed_bytes)
-        index = 0
-        depth = 0
-        for index in Bip32.parse_path(path):
-            parent_fingerprint = Bip32.fingerprint_from_private(private_int)
-            private_int, chain_code = Bip32.derive_child_key(private_int, chain_code, index)
-            depth += 1
-        return depth, parent_fingerprint, index, chain_code, private_int
+    def derive_public_child(parent_public_bytes: bytes, parent_chain_code: bytes, index: int):
+        # CKDpub: child = parent + IL*G. Only a fixed-base multiplication by IL is needed; the parent private key is
+        # never involved.
+        assert 0 <= index < 2**32
+        if index >= 0x80000000:
+            raise ValueError('Cannot derive a hardened child from a public key')
+        data = parent_public_bytes + struct.pack('>I', index)
+        I = Hashing.hmac_sha512(parent_chain_code, data)
+        IL, IR = I[:32], I[32:]
+        IL_int = Bip32.bytes_to_int(IL)
+        backend = secp256k1.backend
+        parent_point = backend.decompress(parent_public_bytes)
+        try:
+            child_point = backend.point_add(parent_point, backend.point_from_scalar(IL_int))
+        except ValueError:
+            # IL >= N, IL == 0 or child is the point at infinity
+            raise ValueError('Generated an invalid child key; very improbable. Please choose a different index')
+        child_public_bytes = backend.compress(child_point)
+        child_chain_code = IR
+        assert len(child_chain_code) == 32
+        return child_public_bytes, child_chain_code
 
     @staticmethod
-    def serialize_xprv(last_depth, parent_fingerprint, last_index, chain_code, private_int):
-        version = bytes.fromhex('0488ADE4')                 # xprv mainnet
+    def derive_from_path(seed_bytes: bytes, path: str, cache: 'DerivationCache' = None):
+        # Walk the path on ExtendedKey nodes so each parent public key is computed once and shared between
+        # its fingerprint and the non-hardened child derivation
+        if cache is not None:
+            return cache.derive(seed_bytes, path).to_tuple()
+        return ExtendedKey.from_seed(seed_bytes).derive(path).to_tuple()
+
+    @staticmethod
+    def serialize_extended_key(version: bytes, last_depth, parent_fingerprint, last_index, chain_code, key_data: bytes):
+        assert len(key_data) == 33
         data = (
             version +
             Bip32.int_to_bytes(last_depth, 1) +
             parent_fingerprint +
             struct.pack('>I', last_index) +
             chain_code +
-            b'\x00' + Bip32.int_to_bytes(private_int, 32)
+            key_data
         )
-        checksum = Bip32.sha256(Bip32.sha256(data))[:4]
-        return base58.b58encode(data + checksum).decode()
+        return Base58Check.encode_check(data)
 
     @staticmethod
-    def deserialize_xprv(xprv: str) -> bytes:
-        data = base58.b58decode_check(xprv)  # returns full payload without checksum
+    def serialize_xprv(last_depth, parent_fingerprint, last_index, chain_code, private_int):
+        version = bytes.fromhex('0488ADE4')                 # xprv mainnet
+        key_data = b'\x00' + Bip32.int_to_bytes(private_int, 32)
+        return Bip32.serialize_extended_key(version, last_depth, parent_fingerprint, last_index, chain_code, key_data)
+
+    @staticmethod
+    def deserialize_extended_key(extended_key: str):
         # structure: 4 version | 1 depth | 4 parent_fp | 4 child_index | 32 chain_code | 33 key_data
-        if len(data) != 78:
-            raise ValueError("Unexpected extended-key payload length: %d" % len(data))
+        data = Base58Check.decode_check(extended_key, Base58Check.EXTENDED_KEY_LENGTH)
         version = data[:4]
-        assert version == bytes.fromhex('0488ADE4')
         last_depth = data[4]
         parent_fingerprint = data[5:9]
         last_index = struct.unpack(">I", data[9:13])[0]
         chain_code = data[13:45]
-        private_data = data[45:78]                          # 33 bytes
+        key_data = data[45:78]                              # 33 bytes
+        return version, last_depth, parent_fingerprint, last_index, chain_code, key_data
+
+    @staticmethod
+    def deserialize(extended_key: str) -> 'ExtendedKey':
+        # Any of the KEY_TYPES, private or public, as a node that can be derived from directly. Rejects the
+        # invalid keys of BIP32 test vector 5.
+        version, last_depth, parent_fingerprint, last_index, chain_code, key_data = \
+            Bip32.deserialize_extended_key(extended_key)
+        if version not in Bip32.VERSIONS:
+            raise ValueError(f'Unknown extended key version {version.hex()}')
+        key_type, is_private = Bip32.VERSIONS[version]
+        if last_depth == 0 and (parent_fingerprint != b'\x00\x00\x00\x00' or last_index != 0):
+            raise ValueError('Invalid master extended key: non-zero parent fingerprint or index')
+        if is_private:
+            if key_data[0] != 0x00:
+                raise ValueError('Invalid extended private key: expected first byte of key_data to be 0x00')
+            private_int = Bip32.bytes_to_int(key_data[1:])
+            if not (1 <= private_int < Bip32.N):
+                raise ValueError('Invalid extended private key: must be between 1 and N - 1')
+            return ExtendedKey(last_depth, parent_fingerprint, last_index, chain_code, private_int=private_int,
+                               key_type=key_type)
+        if key_data[0] not in (0x02, 0x03):
+            raise ValueError('Invalid extended public key: expected a compressed public key')
+        secp256k1.backend.decompress(key_data)
+        return ExtendedKey(last_depth, parent_fingerprint, last_index, chain_code, public_bytes=key_data,
+                           key_type=key_type)
+
+    @staticmethod
+    def deserialize_xprv(xprv: str) -> bytes:
+        version, _, _, _, _, private_data = Bip32.deserialize_extended_key(xprv)
+        assert version == bytes.fromhex('0488ADE4')
         if private_data[0] != 0x00:
             raise ValueError("Not an xprv (expected first byte of key_data to be 0x00)")
         private_bytes = private_data[1:]
         assert len(private_bytes) == 32
         return private_bytes
 
+    @staticmethod
+    def deserialize_xpub(xpub: str):
+        version, last_depth, parent_fingerprint, last_index, chain_code, public_bytes = \
+            Bip32.deserialize_extended_key(xpub)
+        if version != bytes.fromhex('0488B21E'):
+            raise ValueError("Not an xpub (unexpected version bytes %s)" % version.hex())
+        if public_bytes[0] not in (0x02, 0x03):
+            raise ValueError("Not an xpub (expected a compressed public key)")
+        return last_depth, parent_fingerprint, last_index, chain_code, public_bytes
+
     @staticmethod
     def serialize_xpub(last_depth, parent_fingerprint, last_index, chain_code, private_int):
         version = bytes.fromhex('0488B21E')                 # xpub mainnet
-        public = ecdsa.SigningKey.from_secret_exponent(private_int, curve=ecdsa.SECP256k1).verifying_key
-        public_bytes = public.to_string('compressed')
-        data = (
-            version +
-            Bip32.int_to_bytes(last_depth, 1) +
-            parent_fingerprint +
-            struct.pack('>I', last_index) +
-            chain_code +
-            public_bytes
-        )
-        checksum = Bip32.sha256(Bip32.sha256(data))[:4]
-        return base58.b58encode(data + checksum).decode()
+        public_bytes = Bip32.public_from_private(private_int)
+        return Bip32.serialize_extended_key(version, last_depth, parent_fingerprint, last_index, chain_code,
+                                            public_bytes)
+
+
+class ExtendedKey:
+    # A node of the HD tree. The compressed public key, its hash160 (identifier) and fingerprint are computed on
+    # first use and kept, so walking a path costs one scalar multiplication per level and serializing the xpub
+    # of an already-walked node costs none.
+
+    # key_type selects the serialization versions (see Bip32.KEY_TYPES) and is inherited by children.
+
+    __slots__ = ('depth', 'parent_fingerprint', 'index', 'chain_code', 'private_int', 'key_type', '_public_bytes',
+                 '_identifier')
+
+    def __init__(self, depth: int, parent_fingerprint: bytes, index: int, chain_code: bytes,
+                 private_int: int = None, public_bytes: bytes = None, key_type: str = 'x'):
+        if private_int is None and public_bytes is None:
+            raise ValueError('Extended key needs either a private or a public key')
+        assert len(parent_fingerprint) == 4
+        assert len(chain_code) == 32
+        assert key_type in Bip32.KEY_TYPES
+        self.key_type = key_type
+        self.depth = depth
+        self.parent_fingerprint = parent_fingerprint
+        self.index = index
+        self.chain_code = chain_code
+        self.private_int = private_int
+        self._public_bytes = public_bytes
+        self._identifier = None
+
+    @staticmethod
+    def from_seed(seed_bytes: bytes) -> 'ExtendedKey':
+        private_int, chain_code = Bip32.master_key_from_seed(seed_bytes)
+        return ExtendedKey(0, b'\x00\x00\x00\x00', 0, chain_code, private_int=private_int)
+
+    @staticmethod
+    def from_xprv(xprv: str) -> 'ExtendedKey':
+        # Also accepts tprv, yprv, zprv, ...
+        node = Bip32.deserialize(xprv)
+        if not node.is_private:
+            raise ValueError('Not an extended private key')
+        return node
+
+    @staticmethod
+    def from_xpub(xpub: str) -> 'ExtendedKey':
+        # Also accepts tpub, ypub, zpub, ...
+        node = Bip32.deserialize(xpub)
+        if node.is_private:
+            raise ValueError('Not an extended public key')
+        return node
+
+    @property
+    def network(self) -> str:
+        return Bip32.KEY_TYPES[self.key_type][2]
+
+    @property
+    def is_private(self) -> bool:
+        return self.private_int is not None
+
+    @property
+    def public_bytes(self) -> bytes:
+        if self._public_bytes is None:
+            self._public_bytes = Bip32.public_from_private(self.private_int)
+        return self._public_bytes
+
+    @property
+    def identifier(self) -> bytes:
+        # hash160 of the compressed public key
+        if self._identifier is None:
+            self._identifier = Hashing.hash160(self.public_bytes)
+        return self._identifier
+
+    @property
+    def fingerprint(self) -> bytes:
+        return self.identifier[:4]
+
+    def child(self, index: int) -> 'ExtendedKey':
+        if not self.is_private:
+            public_bytes, chain_code = Bip32.derive_public_child(self.public_bytes, self.chain_code, index)
+            return ExtendedKey(self.depth + 1, self.fingerprint, index, chain_code, public_bytes=public_bytes,
+                               key_type=self.key_type)
+        if index >= 0x80000000:
+            private_int, chain_code = Bip32.derive_child_key(self.private_int, self.chain_code, index)
+        else:
+            private_int, chain_code = Bip32.derive_child_key(self.private_int, self.chain_code, index,
+                                                             self.public_bytes)
+        return ExtendedKey(self.depth + 1, self.fingerprint, index, chain_code, private_int=private_int,
+                           key_type=self.key_type)
+
+    def derive(self, path) -> 'ExtendedKey':
+        # path is either a string such as "m/84'/0'/0'" (relative to this node) or a sequence of indexes
+        if isinstance(path, str):
+            path = Bip32.parse_path(path)
+        node = self
+        for index in path:
+            node = node.child(index)
+        return node
+
+    def derive_template(self, template):
+        # Yields (indexes, node) for every path of a template (see Bip32.parse_path_template()), in the order of
+        # Bip32.expand_path_template(). The tree is walked depth first so every internal node is derived once and
+        # shared by all the leaves below it, and leaves are produced as they are derived.
+        segments = Bip32.parse_path_template(template) if isinstance(template, str) else template
+        if not segments:
+            yield (), self
+            return
+        last = len(segments) - 1
+
+        def walk(node, path, depth):
+            for ranges in segments[depth]:
+                for index in ranges:
+                    child = node.child(index)
+                    if depth == last:
+                        yield path + (index,), child
+                    else:
+                        yield from walk(child, path + (index,), depth + 1)
+
+        yield from walk(self, (), 0)
+
+    def neuter(self) -> 'ExtendedKey':
+        return ExtendedKey(self.depth, self.parent_fingerprint, self.index, self.chain_code,
+                           public_bytes=self.public_bytes, key_type=self.key_type)
+
+    def to_tuple(self):
+        # Same shape as Bip32.derive_from_path()
+        return self.depth, self.parent_fingerprint, self.index, self.chain_code, self.private_int
+
+    def serialize_xprv(self) -> str:
+        # With the versions of key_type: xprv, tprv, zprv, ...
+        if not self.is_private:
+            raise ValueError('Cannot serialize a public extended key as xprv')
+        version = Bip32.KEY_TYPES[self.key_type][0]
+        key_data = b'\x00' + Bip32.int_to_bytes(self.private_int, 32)
+        return Bip32.serialize_extended_key(version, self.depth, self.parent_fingerprint, self.index,
+                                            self.chain_code, key_data)
+
+    def serialize_xpub(self) -> str:
+        version = Bip32.KEY_TYPES[self.key_type][1]
+        return Bip32.serialize_extended_key(version, self.depth, self.parent_fingerprint, self.index,
+                                            self.chain_code, self.public_bytes)
+
+    def serialize(self) -> str:
+        return self.serialize_xprv() if self.is_private else self.serialize_xpub()
+
+
+class DerivationCache:
+    # Bounded LRU of derived ancestor nodes, keyed by (SHA256 of the seed, path prefix). Deriving m/84'/0'/0'/0/i
+    # for consecutive i then costs a single child derivation from the cached m/84'/0'/0'/0 node.
+    # A lookup counts as a hit when any ancestor (including the master key) was found in the cache.
+
+    def __init__(self, max_size: int = 1024):
+        if max_size < 1:
+            raise ValueError('Cache size must be at least 1')
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._nodes = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    @staticmethod
+    def seed_id(seed_bytes: bytes) -> bytes:
+        return Hashing.sha256(seed_bytes)
+
+    def _get(self, key):
+        node = self._nodes.get(key)
+        if node is not None:
+            self._nodes.move_to_end(key)
+        return node
+
+    def _put(self, key, node: ExtendedKey):
+        self._nodes[key] = node
+        self._nodes.move_to_end(key)
+        while len(self._nodes) > self.max_size:
+            self._nodes.popitem(last=False)
+
+    def derive(self, seed_bytes: bytes, path) -> ExtendedKey:
+        indexes = tuple(Bip32.parse_path(path) if isinstance(path, str) else path)
+        seed_id = DerivationCache.seed_id(seed_bytes)
+        with self._lock:
+            # Find the deepest cached ancestor; the leaf itself is not cached, unless it is the master key ('m')
+            for depth in range(max(len(indexes) - 1, 0), -1, -1):
+                node = self._get((seed_id, indexes[:depth]))
+                if node is not None:
+                    self.hits += 1
+                    break
+            else:
+                depth = 0
+                node = ExtendedKey.from_seed(seed_bytes)
+                self._put((seed_id, ()), node)
+                self.misses += 1
+        # Derive outside the lock; racing threads may derive the same ancestor twice, which is harmless
+        new_nodes = []
+        for i in range(depth, len(indexes)):
+            node = node.child(indexes[i])
+            if i + 1 < len(indexes):
+                new_nodes.append(((seed_id, indexes[:i + 1]), node))
+        with self._lock:
+            for key, new_node in new_nodes:
+                self._put(key, new_node)
+        return node
+
+    def evict(self, seed_bytes: bytes):
+        # Drop every cached node derived from the given seed
+        seed_id = DerivationCache.seed_id(seed_bytes)
+        with self._lock:
+            for key in [key for key in self._nodes if key[0] == seed_id]:
+                del self._nodes[key]
+
+    def clear(self):
+        with self._lock:
+            self._nodes.clear()
+            self.hits = 0
+            self.misses = 0
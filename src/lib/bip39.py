@@ -2,28 +2,83 @@
 # https://en.bitcoin.it/wiki/BIP_0039
 
 import hashlib
+import itertools
 import os
 import secrets
 import unicodedata
 
+from lib.hashing import Hashing
+from lib.parallel import Parallel
+
+try:
+    import numpy    # optional, pip3 install --break-system-packages numpy
+except ImportError:
+    numpy = None
+
+
+class Bip39Wordlist:
+    # Word list with O(1) lookups. BIP39 English words are uniquely identified by their first 4 letters, so
+    # prefixes maps word[:4] to the word index as well.
+
+    __slots__ = ('words', 'indexes', 'prefixes')
+
+    def __init__(self, words):
+        assert len(words) == 2048
+        self.words = tuple(words)
+        self.indexes = {word: index for index, word in enumerate(self.words)}
+        self.prefixes = {word[:4]: index for index, word in enumerate(self.words)}
+        assert len(self.indexes) == len(self.prefixes) == 2048
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __getitem__(self, index: int) -> str:
+        return self.words[index]
+
+    def index(self, word: str) -> int:
+        try:
+            return self.indexes[word]
+        except KeyError:
+            raise ValueError(f'Word {word} is not in BIP39 English wordlist')
+
+    def lookup(self, word: str) -> int:
+        # Accepts a full word or an abbreviation of at least its first 4 letters (e.g. "aban" or "aband")
+        index = self.indexes.get(word)
+        if index is None and len(word) >= 4:
+            index = self.prefixes.get(word[:4])
+            if index is not None and not self.words[index].startswith(word):
+                index = None
+        if index is None:
+            raise ValueError(f'Word {word} is not in BIP39 English wordlist')
+        return index
+
+
+_wordlist = None
+
 
 class Bip39:
 
     @staticmethod
-    def get_wordlist():
-        # https://raw.githubusercontent.com/bitcoin/bips/refs/heads/master/bip-0039/english.txt
-        wordlist = []
-        dir = os.path.dirname(__file__)
-        with open(os.path.join(dir, 'bip39_wordlist.txt'), 'rt') as f:
-            for line in f:
-                line = line.rstrip('\r\n')
-                wordlist.append(line)
-        assert len(wordlist) == 2048
-        return wordlist
+    def wordlist() -> Bip39Wordlist:
+        # Loaded from disk once per process
+        global _wordlist
+        if _wordlist is None:
+            # https://raw.githubusercontent.com/bitcoin/bips/refs/heads/master/bip-0039/english.txt
+            words = []
+            dir = os.path.dirname(__file__)
+            with open(os.path.join(dir, 'bip39_wordlist.txt'), 'rt') as f:
+                for line in f:
+                    line = line.rstrip('\r\n')
+                    words.append(line)
+            _wordlist = Bip39Wordlist(words)
+        return _wordlist
 
     @staticmethod
-    def sha256(b: bytes) -> bytes:
-        return hashlib.sha256(b).digest()
+    def get_wordlist():
+        return list(Bip39.wordlist().words)
+
+    # Alias of lib.hashing, kept for existing callers
+    sha256 = staticmethod(Hashing.sha256)
 
     @staticmethod
     def bits_to_bytes(bits: str) -> bytes:
@@ -43,26 +98,22 @@ class Bip39:
         return Bip39.entropy_to_mnemonic(entropy_bytes)
 
     @staticmethod
-    def mnemonic_to_entropy(mnemonic: str) -> bytes:
-        # Ref: https://en.bitcoin.it/wiki/BIP_0039
-        words = mnemonic.strip().split()
-        if len(words) not in [12, 15, 18, 21, 24]:
-            raise ValueError('Mnemonic must have 12, 15, 18, 21 or 24 words')
-
-        # Convert words into indexes
-        indexes = []
-        wordlist = Bip39.get_wordlist()
-        for word in words:
-            try:
-                index = wordlist.index(word)
-            except ValueError:
-                raise ValueError(f'Word {word} is not in BIP39 English wordlist')
-            indexes.append(index)
+    def generate_random_entropy_batch(count: int, entropy_len: int = 256) -> list:
+        # One CSPRNG call for the whole batch instead of one per mnemonic
+        if entropy_len not in [128, 160, 192, 224, 256]:
+            raise ValueError(f'Entropy length {entropy_len} must be one of 128, 160, 192, 224 or 256')
+        entropy_bytes_len = entropy_len // 8
+        pool = secrets.token_bytes(count * entropy_bytes_len)
+        return [pool[i:i + entropy_bytes_len] for i in range(0, len(pool), entropy_bytes_len)]
 
-        # Convert indexes into bits
-        bits = ''.join(f'{index:011b}' for index in indexes)
+    @staticmethod
+    def generate_random_mnemonic_batch(count: int, entropy_len: int = 256) -> list:
+        return Bip39.entropy_to_mnemonic_batch(Bip39.generate_random_entropy_batch(count, entropy_len))
 
-        # Calculate entropy and checksum
+    @staticmethod
+    def indexes_to_entropy(indexes) -> bytes:
+        # Ref: https://en.bitcoin.it/wiki/BIP_0039
+        # The word indexes are concatenated as 11-bit groups into a single integer: entropy bits then checksum bits
         # |  Entropy Len | Checksum Len | Total Len | Mnemonic Words |
         # +--------------+--------------+-----------+----------------+
         # |     128      |      4       |    132    |       12       |
@@ -70,45 +121,155 @@ class Bip39:
         # |     192      |      6       |    198    |       18       |
         # |     224      |      7       |    231    |       21       |
         # |     256      |      8       |    264    |       24       |
-        checksum_len = len(bits) // 33
-        entropy_len = len(bits) - checksum_len
+        value = 0
+        for index in indexes:
+            value = (value << 11) | index
+        total_len = 11 * len(indexes)
+        checksum_len = total_len // 33
+        entropy_len = total_len - checksum_len
         if entropy_len % 8 != 0:
             raise ValueError(f'Entropy length {entropy_len} must be multiple of 8')
-        entropy_bits = bits[:entropy_len]
-        entropy_bytes = Bip39.bits_to_bytes(entropy_bits)
-
-        # Validate checksum
-        hash_bits = Bip39.bytes_to_bits(Bip39.sha256(entropy_bytes))
-        checksum_bits = hash_bits[:checksum_len]
-        expected_checksum_bits = bits[entropy_len:]
-        if checksum_bits != expected_checksum_bits:
+        entropy_bytes = (value >> checksum_len).to_bytes(entropy_len // 8, 'big')
+
+        # Validate checksum: first checksum_len bits of SHA256(entropy)
+        checksum = value & ((1 << checksum_len) - 1)
+        if checksum != Hashing.sha256(entropy_bytes)[0] >> (8 - checksum_len):
             raise ValueError('Invalid checksum for mnemonics')
 
         return entropy_bytes
 
     @staticmethod
-    def entropy_to_mnemonic(entropy_bytes: bytes) -> str:
+    def entropy_to_indexes(entropy_bytes: bytes):
         entropy_len = len(entropy_bytes)
         if entropy_len not in [16, 20, 24, 28, 32]:
             raise ValueError(f'Entropy length {entropy_len} must be 16, 20, 24, 28 or 32 bytes')
+        checksum_len = entropy_len * 8 // 32
+        checksum = Hashing.sha256(entropy_bytes)[0] >> (8 - checksum_len)
+        value = (int.from_bytes(entropy_bytes, 'big') << checksum_len) | checksum
+
+        # Split into 11-bit words
+        words_len = (entropy_len * 8 + checksum_len) // 11
+        return [(value >> (11 * i)) & 0x7ff for i in range(words_len - 1, -1, -1)]
+
+    @staticmethod
+    def mnemonic_to_entropy(mnemonic: str) -> bytes:
+        words = mnemonic.strip().split()
+        if len(words) not in [12, 15, 18, 21, 24]:
+            raise ValueError('Mnemonic must have 12, 15, 18, 21 or 24 words')
+
+        # Convert words into indexes
+        wordlist = Bip39.wordlist()
+        indexes = [wordlist.index(word) for word in words]
+
+        return Bip39.indexes_to_entropy(indexes)
 
-        # Entropy
-        entropy_bits = Bip39.bytes_to_bits(entropy_bytes)
+    @staticmethod
+    def entropy_to_mnemonic(entropy_bytes: bytes) -> str:
+        words = Bip39.wordlist().words
+        return ' '.join([words[index] for index in Bip39.entropy_to_indexes(entropy_bytes)])
+
+    @staticmethod
+    def entropy_to_mnemonic_batch(entropies, strict: bool = True, use_numpy: bool = None):
+        # entropies is an iterable of bytes or a 2-D uint8 NumPy array (one entropy per row). Invalid entries raise
+        # ValueError, or give None when strict is False.
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        if use_numpy and numpy is None:
+            raise ValueError('NumPy is not installed')
+        if use_numpy:
+            if isinstance(entropies, numpy.ndarray):
+                array = entropies
+            else:
+                entropies = [bytes(entropy_bytes) for entropy_bytes in entropies]
+                array = None
+                if entropies and len(set(map(len, entropies))) == 1:
+                    array = numpy.frombuffer(b''.join(entropies), dtype=numpy.uint8).reshape(len(entropies), -1)
+            if array is not None and array.ndim == 2 and array.shape[1] in [16, 20, 24, 28, 32]:
+                return Bip39._entropy_to_mnemonic_numpy(numpy.ascontiguousarray(array, dtype=numpy.uint8))
 
-        # Checksum
-        hash_bits = Bip39.bytes_to_bits(Bip39.sha256(entropy_bytes))
+        words = Bip39.wordlist().words
+        mnemonics = []
+        for entropy_bytes in entropies:
+            try:
+                indexes = Bip39.entropy_to_indexes(bytes(entropy_bytes))
+            except ValueError:
+                if strict:
+                    raise
+                mnemonics.append(None)
+                continue
+            mnemonics.append(' '.join([words[index] for index in indexes]))
+        return mnemonics
+
+    @staticmethod
+    def _entropy_to_mnemonic_numpy(array):
+        rows, entropy_len = array.shape
         checksum_len = entropy_len * 8 // 32
-        checksum_bits = hash_bits[:checksum_len]
+        words_len = (entropy_len * 8 + checksum_len) // 11
+        first_hash_bytes = numpy.frombuffer(
+            bytes(Hashing.sha256(row)[0] for row in array), dtype=numpy.uint8).reshape(rows, 1)
+        bits = numpy.concatenate(
+            [numpy.unpackbits(array, axis=1), numpy.unpackbits(first_hash_bytes, axis=1)[:, :checksum_len]], axis=1)
+        weights = 1 << numpy.arange(10, -1, -1, dtype=numpy.uint16)
+        indexes = bits.reshape(rows, words_len, 11).astype(numpy.uint16) @ weights
+        words = Bip39.wordlist().words
+        return [' '.join([words[index] for index in row]) for row in indexes.tolist()]
 
-        bits = entropy_bits + checksum_bits
+    @staticmethod
+    def mnemonic_to_entropy_batch(mnemonics, strict: bool = True, use_numpy: bool = None):
+        # Invalid mnemonics raise ValueError, or give None when strict is False
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        if use_numpy and numpy is None:
+            raise ValueError('NumPy is not installed')
+        wordlist = Bip39.wordlist()
+        word_indexes = wordlist.indexes
+        entropies = []
+        pending = {}          # words count -> [(position, indexes)] for the NumPy path
+        for mnemonic in mnemonics:
+            try:
+                words = mnemonic.strip().split()
+                if len(words) not in [12, 15, 18, 21, 24]:
+                    raise ValueError('Mnemonic must have 12, 15, 18, 21 or 24 words')
+                try:
+                    indexes = [word_indexes[word] for word in words]
+                except KeyError:
+                    # Slow path only to report the offending word
+                    indexes = [wordlist.index(word) for word in words]
+                if use_numpy:
+                    pending.setdefault(len(indexes), []).append((len(entropies), indexes))
+                    entropies.append(None)
+                else:
+                    entropies.append(Bip39.indexes_to_entropy(indexes))
+            except ValueError:
+                if strict:
+                    raise
+                entropies.append(None)
+        for words_len, items in pending.items():
+            results = Bip39._indexes_to_entropy_numpy(words_len, [indexes for _, indexes in items])
+            for (position, _), entropy_bytes in zip(items, results):
+                if entropy_bytes is None and strict:
+                    raise ValueError('Invalid checksum for mnemonics')
+                entropies[position] = entropy_bytes
+        return entropies
 
-        # Split into 11-bit words
-        words = []
-        wordlist = Bip39.get_wordlist()
-        for i in range(0, len(bits), 11):
-            index = int(bits[i: i+11], 2)
-            words.append(wordlist[index])
-        return ' '.join(words)
+    @staticmethod
+    def _indexes_to_entropy_numpy(words_len: int, indexes_rows):
+        # Returns the entropy of each row, None when its checksum does not match
+        indexes = numpy.array(indexes_rows, dtype=numpy.uint16)
+        rows = indexes.shape[0]
+        shifts = numpy.arange(10, -1, -1, dtype=numpy.uint16)
+        bits = ((indexes[:, :, None] >> shifts) & 1).astype(numpy.uint8).reshape(rows, words_len * 11)
+        checksum_len = words_len * 11 // 33
+        entropy_len = words_len * 11 - checksum_len
+        entropy_array = numpy.packbits(bits[:, :entropy_len], axis=1)
+        checksums = numpy.packbits(bits[:, entropy_len:], axis=1)[:, 0].tolist()
+        results = []
+        for row, checksum in zip(entropy_array, checksums):
+            entropy_bytes = row.tobytes()
+            # packbits left-aligns the checksum bits in the byte, like the first byte of the hash
+            mask = (0xff << (8 - checksum_len)) & 0xff
+            results.append(entropy_bytes if Hashing.sha256(entropy_bytes)[0] & mask == checksum else None)
+        return results
 
     @staticmethod
     def mnemonic_and_passphrase_to_seed(mnemonic: str, passphrase: str = '') -> bytes:
@@ -127,3 +288,21 @@ class Bip39:
         seed_bytes = hashlib.pbkdf2_hmac('sha512', mnemonic_bytes, salt_bytes, 2048, dklen=64)
         assert (len(seed_bytes) == 64)
         return seed_bytes
+
+    @staticmethod
+    def mnemonic_and_passphrase_to_seed_batch(pairs, workers: int = None, executor: str = 'thread',
+                                              chunk_size: int = 32):
+        """
+        Derive seeds for an iterable of (mnemonic, passphrase) pairs, in input order.
+        Pairs are grouped in chunks of chunk_size, so each task amortizes its scheduling (and, for processes, IPC)
+        over chunk_size PBKDF2 runs. hashlib releases the GIL during PBKDF2, so threads scale with cores too.
+        Yields 64-byte seeds lazily.
+        """
+        pairs = iter(pairs)
+        chunks = iter(lambda: list(itertools.islice(pairs, chunk_size)), [])
+        for seeds in Parallel.ordered_map(_seeds_for_pairs, chunks, workers=workers, executor=executor):
+            yield from seeds
+
+
+def _seeds_for_pairs(pairs):
+    return [Bip39.mnemonic_and_passphrase_to_seed(mnemonic, passphrase) for mnemonic, passphrase in pairs]
@@ -1,100 +1,280 @@
-import hashlib
-
-import base58           # pip3 install --break-system-packages base58
-import bech32           # pip3 install --break-system-packages bech32
-import ecdsa            # pip3 install --break-system-packages ecdsa
+from lib import secp256k1
+from lib.base58check import Base58Check
+from lib.hashing import Hashing
+from lib.secp256k1 import Secp256k1
+from lib.segwit import SegwitAddress
 
 
 class BtcAddress:
+
+    # 'p2pkh' hashes the uncompressed public key, as derive_public_addresses() does; BIP 44 wallets use
+    # 'p2pkh-compressed'
+    KINDS = ('p2pkh', 'p2sh-p2wpkh', 'p2wpkh', 'p2tr', 'p2pkh-compressed')
+
+    # Aliases of lib.hashing, kept for existing callers
+    sha256 = staticmethod(Hashing.sha256)
+    ripemd160 = staticmethod(Hashing.ripemd160)
+    hash160 = staticmethod(Hashing.hash160)
+    tagged_hash = staticmethod(Hashing.tagged_hash)
+
+    @staticmethod
+    def p2pkh_address(hashed_pubkey: bytes) -> str:
+        # Legacy address from the hash160 of a public key (version byte 0x00 for mainnet)
+        return Base58Check.encode_check(hashed_pubkey, b'\x00')
+
+    @staticmethod
+    def p2sh_p2wpkh_address(hashed_compressed_pubkey: bytes) -> str:
+        # P2SH address wrapping the P2WPKH redeem script of a compressed public key hash (version byte 0x05)
+        redeem_script_hash = Hashing.hash160_prefixed(b'\x00\x14', hashed_compressed_pubkey)
+        return BtcAddress.p2sh_address(redeem_script_hash)
+
+    @staticmethod
+    def p2sh_address(script_hash: bytes) -> str:
+        return Base58Check.encode_check(script_hash, b'\x05')
+
+    @staticmethod
+    def p2wpkh_address(hashed_compressed_pubkey: bytes) -> str:
+        # Native segwit v0 address of a compressed public key hash
+        return SegwitAddress.encode(SegwitAddress.MAINNET, 0, hashed_compressed_pubkey)
+
+    @staticmethod
+    def taproot_tweak(x_only_pubkey: bytes) -> int:
+        # BIP 86 key-path only output: the tweak commits to the internal key and no script tree
+        t = int.from_bytes(Hashing.tagged_hash('TapTweak', x_only_pubkey), 'big')
+        if t >= Secp256k1.N:
+            raise ValueError('Invalid taproot tweak; very improbable')
+        return t
+
     @staticmethod
-    def sha256(b: bytes) -> bytes:
-        return hashlib.sha256(b).digest()
+    def taproot_output_key(public_key_bytes: bytes) -> bytes:
+        # Ref: https://github.com/bitcoin/bips/blob/master/bip-0086.mediawiki
+        # Q = lift_x(P) + tweak * G, where lift_x picks the even y; the output key is the x coordinate of Q
+        x_only_pubkey = public_key_bytes[1:33]
+        backend = secp256k1.backend
+        internal_point = backend.decompress(b'\x02' + x_only_pubkey)
+        tweak_point = backend.point_from_scalar(BtcAddress.taproot_tweak(x_only_pubkey))
+        output_point = backend.point_add(internal_point, tweak_point)
+        return backend.compress(output_point)[1:]
 
     @staticmethod
-    def ripemd160(b: bytes) -> bytes:
-        return hashlib.new('ripemd160', b).digest()
+    def p2tr_address(output_key: bytes) -> str:
+        # Segwit v1 (bech32m) address of a 32-byte x-only taproot output key
+        return SegwitAddress.encode(SegwitAddress.MAINNET, 1, output_key)
 
     @staticmethod
-    def convert_private_key_into_wif(private_key_bytes: bytes) -> str:
+    def decode_address(address: str):
+        # Returns (kind, hash) where hash is the hash160 of the public key ('p2pkh', 'p2wpkh') or of the redeem
+        # script ('p2sh'), or the taproot output key ('p2tr')
+        if address[:3].lower() == 'bc1':
+            witness_version, witness_program = SegwitAddress.decode(SegwitAddress.MAINNET, address)
+            if witness_version == 0 and len(witness_program) == 20:
+                return 'p2wpkh', witness_program
+            if witness_version == 1 and len(witness_program) == 32:
+                return 'p2tr', witness_program
+            raise ValueError(f'Unsupported segwit address {address}')
+        try:
+            payload = Base58Check.decode_check(address, Base58Check.ADDRESS_LENGTH)
+        except ValueError:
+            raise ValueError(f'Invalid base58 address {address}')
+        if payload[0] == 0x00:
+            return 'p2pkh', payload[1:]
+        if payload[0] == 0x05:
+            return 'p2sh', payload[1:]
+        raise ValueError(f'Unsupported address {address}')
+
+    @staticmethod
+    def convert_private_key_into_wif(private_key_bytes: bytes, verbose: bool = False) -> str:
+        # verbose prints the key material, keep it for interactive use
         assert len(private_key_bytes) == 32
-        private_key_int = int.from_bytes(private_key_bytes, 'big')
-        print(f'Private Key (decimal): {private_key_int}')
-        private_key_hex = private_key_bytes.hex()
-        print(f'Private Key (hex): {private_key_hex}')
-        # https://en.bitcoin.it/wiki/Wallet_import_format (0x80 for mainnet)
-        checksum = BtcAddress.sha256(BtcAddress.sha256(b'\x80' + private_key_bytes + b'\x01'))[:4]
-        # 0x01 suffix for WIF compressed
-        wif_str = base58.b58encode(b'\x80' + private_key_bytes + b'\x01' + checksum).decode()
-        print(f'Private Key (WIF compressed): {wif_str}')
-        print()
+        if verbose:
+            private_key_int = int.from_bytes(private_key_bytes, 'big')
+            print(f'Private Key (decimal): {private_key_int}')
+            private_key_hex = private_key_bytes.hex()
+            print(f'Private Key (hex): {private_key_hex}')
+        # https://en.bitcoin.it/wiki/Wallet_import_format (0x80 for mainnet, 0x01 suffix for WIF compressed)
+        wif_str = Base58Check.encode_check(b'\x80' + private_key_bytes + b'\x01')
+        if verbose:
+            print(f'Private Key (WIF compressed): {wif_str}')
+            print()
         return wif_str
 
     @staticmethod
     def convert_wif_into_private_key(wif_str: str) -> bytes:
-        wif_bytes = base58.b58decode(wif_str)
-        assert wif_bytes[0] == 0x80
-        checksum = BtcAddress.sha256(BtcAddress.sha256(wif_bytes[:-4]))[:4]
-        assert checksum == wif_bytes[-4:]
-        private_key_bytes = wif_bytes[1:32+1]
-        assert len(private_key_bytes) == 32
-        return private_key_bytes
+        # Compressed (0x01 suffix) and uncompressed WIF
+        wif_bytes = Base58Check.decode_check(wif_str)
+        if len(wif_bytes) == Base58Check.WIF_LENGTH and wif_bytes[-1] != 0x01 or \
+                len(wif_bytes) not in (Base58Check.WIF_LENGTH, Base58Check.WIF_UNCOMPRESSED_LENGTH):
+            raise ValueError(f'Invalid WIF length {wif_str}')
+        if wif_bytes[0] != 0x80:
+            raise ValueError(f'Invalid WIF version {wif_str}')
+        return wif_bytes[1:32+1]
 
     @staticmethod
-    def derive_public_addresses(private_key_bytes: bytes):
+    def derive_public_addresses(private_key_bytes: bytes, verbose: bool = False):
         # You can use https://www.blockchain.com/explorer/addresses/btc/<address> to verify
+        # Always computes the three addresses; use derive_addresses() to compute only the ones needed
 
         # 1. 256-bit private key
         assert len(private_key_bytes) == 32
 
         # 2. Generate public key using secp256k1
-        sk = ecdsa.SigningKey.from_string(private_key_bytes, curve=ecdsa.SECP256k1)
-        vk = sk.get_verifying_key()
-        public_key_bytes = b'\x04' + vk.to_string()
-        public_key_int = int.from_bytes(public_key_bytes)
-        print(f'Public Key (decimal): {public_key_int}')
-        public_key_hex = public_key_bytes.hex()
-        print(f'Public Key (hex): {public_key_hex}')
-        print()
+        backend = secp256k1.backend
+        point = backend.point_from_scalar(int.from_bytes(private_key_bytes, 'big'))
+        public_key_bytes = backend.uncompress(point)
+        if verbose:
+            public_key_int = int.from_bytes(public_key_bytes)
+            print(f'Public Key (decimal): {public_key_int}')
+            public_key_hex = public_key_bytes.hex()
+            print(f'Public Key (hex): {public_key_hex}')
+            print()
 
         # 3. Create P2PKH / Pay-to-Public-Key-Hash / Legacy Bitcoin address
         #       - Step 1: Hash of the public key (SHA-256 then RIPEMD-160)
-        hashed_pubkey = BtcAddress.ripemd160(BtcAddress.sha256(public_key_bytes))
+        hashed_pubkey = BtcAddress.hash160(public_key_bytes)
         #       - Step 2: Add version byte (0x00 for mainnet)
-        versioned_payload = b'\x00' + hashed_pubkey
         #       - Step 3: Create checksum (double SHA-256)
-        checksum = BtcAddress.sha256(BtcAddress.sha256(versioned_payload))[:4]
-        #       - Step 4: Combine and encode with base58
+        #       - Step 4: Combine and encode with base58 (steps 2 to 4 are done by p2pkh_address)
         #    Ref: https://learnmeabitcoin.com/technical/script/p2pkh/
-        btc_address_1 = base58.b58encode(versioned_payload + checksum).decode()
+        btc_address_1 = BtcAddress.p2pkh_address(hashed_pubkey)
         assert btc_address_1.startswith('1')
-        print(f'Bitcoin Address 1 (legacy): {btc_address_1}')
-        print()
+        if verbose:
+            print(f'Bitcoin Address 1 (legacy): {btc_address_1}')
+            print()
 
         # 4. Compress the public key
-        pubkey_bytes = vk.to_string()
+        pubkey_bytes = public_key_bytes[1:]
         x = pubkey_bytes[:32]
         y = pubkey_bytes[32:]
         prefix = b'\x02' if int.from_bytes(y, 'big') % 2 == 0 else b'\x03'
         compressed_pubkey = prefix + x
-        print(f'Compressed Public Key (hex): {compressed_pubkey.hex()}')
-        hashed_compressed_pubkey = BtcAddress.ripemd160(BtcAddress.sha256(compressed_pubkey))
+        if verbose:
+            print(f'Compressed Public Key (hex): {compressed_pubkey.hex()}')
+        hashed_compressed_pubkey = BtcAddress.hash160(compressed_pubkey)
 
         # 5. Create P2SH / Pay-to-Script-Hash Bitcoin address
-        redeem_script = b'\x00\x14' + hashed_compressed_pubkey
-        redeem_script_hash = BtcAddress.ripemd160(BtcAddress.sha256(redeem_script))
-        versioned_payload = b'\x05' + redeem_script_hash
-        checksum = BtcAddress.sha256(BtcAddress.sha256(versioned_payload))[:4]
-        btc_address_3 = base58.b58encode(versioned_payload + checksum).decode()
+        btc_address_3 = BtcAddress.p2sh_p2wpkh_address(hashed_compressed_pubkey)
         assert len(btc_address_3) == 34
         assert btc_address_3.startswith('3')
-        print(f'Bitcoin Address 3: {btc_address_3}')
+        if verbose:
+            print(f'Bitcoin Address 3: {btc_address_3}')
 
         # 6. Create P2WPKH / Pay-to-Witness-Public-Key-Hash / Native Segwit Bitcoin address
-        witness_version = 0
-        witness_program = bech32.convertbits(hashed_compressed_pubkey, 8, 5, True)
-        btc_address_bc1q = bech32.bech32_encode('bc', [witness_version] + witness_program)
+        btc_address_bc1q = BtcAddress.p2wpkh_address(hashed_compressed_pubkey)
         assert len(btc_address_bc1q) == 42
         assert btc_address_bc1q.startswith('bc1q')
-        print(f'Bitcoin Address bc1q: {btc_address_bc1q}')
+        if verbose:
+            print(f'Bitcoin Address bc1q: {btc_address_bc1q}')
 
         return btc_address_1, btc_address_3, btc_address_bc1q
+
+    @staticmethod
+    def derive_addresses(private_key_bytes: bytes, kinds=KINDS):
+        # Only the requested kinds are computed, e.g. derive_addresses(key, ('p2wpkh',)) never builds the uncompressed
+        # public key
+        addresses = PublicAddresses(private_key_bytes=private_key_bytes)
+        return tuple(addresses.get(kind) for kind in kinds)
+
+
+class PublicAddresses:
+    # Addresses of one key. Every attribute is computed on first access and cached; nothing is printed.
+    # Built from a 32-byte private key or from a compressed / uncompressed public key.
+
+    __slots__ = ('_private_key_bytes', '_point', '_public_key', '_compressed_public_key', '_hash160',
+                 '_uncompressed_hash160', '_p2pkh', '_p2pkh_compressed', '_p2sh_p2wpkh', '_p2wpkh', '_p2tr')
+
+    def __init__(self, private_key_bytes: bytes = None, public_key_bytes: bytes = None):
+        if (private_key_bytes is None) == (public_key_bytes is None):
+            raise ValueError('Addresses need either a private or a public key')
+        if private_key_bytes is not None:
+            assert len(private_key_bytes) == 32
+        self._private_key_bytes = private_key_bytes
+        self._point = None
+        self._public_key = public_key_bytes if public_key_bytes is not None and len(public_key_bytes) == 65 else None
+        self._compressed_public_key = public_key_bytes if public_key_bytes is not None and len(public_key_bytes) == 33 \
+            else None
+        self._hash160 = None
+        self._uncompressed_hash160 = None
+        self._p2pkh = None
+        self._p2pkh_compressed = None
+        self._p2sh_p2wpkh = None
+        self._p2wpkh = None
+        self._p2tr = None
+
+    @property
+    def point(self):
+        if self._point is None:
+            backend = secp256k1.backend
+            if self._private_key_bytes is not None:
+                self._point = backend.point_from_scalar(int.from_bytes(self._private_key_bytes, 'big'))
+            else:
+                self._point = backend.decompress(self._compressed_public_key or self._public_key)
+        return self._point
+
+    @property
+    def public_key(self) -> bytes:
+        # Uncompressed, 0x04 | x | y
+        if self._public_key is None:
+            self._public_key = secp256k1.backend.uncompress(self.point)
+        return self._public_key
+
+    @property
+    def compressed_public_key(self) -> bytes:
+        if self._compressed_public_key is None:
+            self._compressed_public_key = secp256k1.backend.compress(self.point)
+        return self._compressed_public_key
+
+    @property
+    def hash160(self) -> bytes:
+        # Of the compressed public key, as used by segwit outputs
+        if self._hash160 is None:
+            self._hash160 = Hashing.hash160(self.compressed_public_key)
+        return self._hash160
+
+    @property
+    def uncompressed_hash160(self) -> bytes:
+        if self._uncompressed_hash160 is None:
+            self._uncompressed_hash160 = Hashing.hash160(self.public_key)
+        return self._uncompressed_hash160
+
+    @property
+    def redeem_script(self) -> bytes:
+        # P2WPKH script (OP_0 PUSH20 hash160), the redeem script of the P2SH-P2WPKH address
+        return b'\x00\x14' + self.hash160
+
+    @property
+    def p2pkh(self) -> str:
+        # Legacy address of the uncompressed public key, as derive_public_addresses() returns
+        if self._p2pkh is None:
+            self._p2pkh = BtcAddress.p2pkh_address(self.uncompressed_hash160)
+        return self._p2pkh
+
+    @property
+    def p2pkh_compressed(self) -> str:
+        # Legacy address of the compressed public key, as BIP 44 wallets use
+        if self._p2pkh_compressed is None:
+            self._p2pkh_compressed = BtcAddress.p2pkh_address(self.hash160)
+        return self._p2pkh_compressed
+
+    @property
+    def p2sh_p2wpkh(self) -> str:
+        if self._p2sh_p2wpkh is None:
+            self._p2sh_p2wpkh = BtcAddress.p2sh_p2wpkh_address(self.hash160)
+        return self._p2sh_p2wpkh
+
+    @property
+    def p2wpkh(self) -> str:
+        if self._p2wpkh is None:
+            self._p2wpkh = BtcAddress.p2wpkh_address(self.hash160)
+        return self._p2wpkh
+
+    @property
+    def p2tr(self) -> str:
+        # BIP 86 key-path taproot address, with the public key as internal key
+        if self._p2tr is None:
+            self._p2tr = BtcAddress.p2tr_address(BtcAddress.taproot_output_key(self.compressed_public_key))
+        return self._p2tr
+
+    def get(self, kind: str) -> str:
+        if kind not in BtcAddress.KINDS:
+            raise ValueError(f'Unknown address kind {kind}, must be one of {", ".join(BtcAddress.KINDS)}')
+        return getattr(self, kind.replace('-', '_'))
@@ -0,0 +1,201 @@
+# Bulk derivation command line: python -m lib --help
+#
+# Reads one mnemonic, hex seed, extended private key or extended public key per line (from a file or stdin) and
+# writes one JSONL or CSV row per derived path. Lines are read lazily and processed in chunks on a worker pool with a
+# bounded number of chunks in flight (see Parallel.ordered_map), so memory stays flat on inputs of any size and rows
+# come out in input order.
+
+import argparse
+import csv
+import getpass
+import io
+import itertools
+import json
+import os
+import sys
+
+from lib.address_range import AddressRange
+from lib.bip32 import Bip32, ExtendedKey
+from lib.bip39 import Bip39
+from lib.btc_address import BtcAddress, PublicAddresses
+from lib.parallel import Parallel
+
+
+class Cli:
+
+    INPUT_TYPES = ('auto', 'mnemonic', 'seed', 'xprv', 'xpub')
+    FORMATS = ('jsonl', 'csv')
+    DEFAULT_PATH = "m/84'/0'/0'/0/0-19"
+
+    @staticmethod
+    def parser() -> argparse.ArgumentParser:
+        parser = argparse.ArgumentParser(
+            prog='python -m lib', description='Derive addresses from mnemonics, seeds or extended keys in bulk.')
+        parser.add_argument('input', nargs='?', default='-', help='input file, one key per line (default: stdin)')
+        parser.add_argument('--input-type', choices=Cli.INPUT_TYPES, default='auto',
+                            help='type of the input lines (default: detected per line)')
+        passphrase = parser.add_mutually_exclusive_group()
+        passphrase.add_argument('--passphrase', default='',
+                                help='BIP39 passphrase for mnemonic inputs (visible in ps and shell history, prefer '
+                                     '--passphrase-env or --passphrase-prompt)')
+        passphrase.add_argument('--passphrase-env', metavar='VARIABLE',
+                                help='read the BIP39 passphrase from this environment variable')
+        passphrase.add_argument('--passphrase-prompt', action='store_true',
+                                help='prompt for the BIP39 passphrase on the terminal')
+        parser.add_argument('--path', default=Cli.DEFAULT_PATH,
+                            help="path template with explicit ranges, relative to the input key, e.g. "
+                                 "\"m/84'/0'/0'/{0,1}/0-999\" "
+                                 f'(default: {Cli.DEFAULT_PATH})')
+        parser.add_argument('--kinds', default='p2wpkh',
+                            help=f'comma-separated address kinds among {", ".join(BtcAddress.KINDS)} (default: p2wpkh)')
+        parser.add_argument('--format', choices=Cli.FORMATS, default='jsonl', help='output format (default: jsonl)')
+        parser.add_argument('--public-key', action='store_true', help='include the compressed public key')
+        parser.add_argument('--wif', action='store_true', help='include the private key (WIF) of private inputs')
+        parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+        parser.add_argument('--executor', choices=('process', 'thread'), default='process')
+        parser.add_argument('--chunk-size', type=int, default=16, help='input lines per task (default: 16)')
+        parser.add_argument('--max-in-flight', type=int, default=None,
+                            help='tasks queued or running at once (default: 2 per worker)')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='report invalid lines on stderr and continue instead of stopping')
+        return parser
+
+    @staticmethod
+    def detect_input_type(line: str) -> str:
+        if line[1:4] in ('prv', 'pub') and line[:4].isalpha():
+            return 'xprv' if line[1:4] == 'prv' else 'xpub'
+        try:
+            bytes.fromhex(line)
+            return 'seed'
+        except ValueError:
+            return 'mnemonic'
+
+    @staticmethod
+    def parse_key(line: str, input_type: str, passphrase: str) -> ExtendedKey:
+        if input_type == 'auto':
+            input_type = Cli.detect_input_type(line)
+        if input_type == 'mnemonic':
+            mnemonic = ' '.join(line.split())
+            # Word list and checksum validation
+            Bip39.mnemonic_to_entropy(mnemonic)
+            return ExtendedKey.from_seed(Bip39.mnemonic_and_passphrase_to_seed(mnemonic, passphrase))
+        if input_type == 'seed':
+            return ExtendedKey.from_seed(bytes.fromhex(line))
+        if input_type == 'xprv':
+            return ExtendedKey.from_xprv(line)
+        return ExtendedKey.from_xpub(line)
+
+    @staticmethod
+    def columns(options: dict) -> list:
+        columns = ['line', 'path']
+        if options['public_key']:
+            columns.append('public_key')
+        columns += options['kinds']
+        if options['wif']:
+            columns.append('wif')
+        return columns
+
+    @staticmethod
+    def derive_rows(node: ExtendedKey, segments, kinds, private: bool = False):
+        # Yields (indexes, public key, addresses, private key int or None). When the last two levels of the template
+        # are non-hardened (chain/index) and private keys are not needed, addresses come from AddressRange in batches.
+        bulk = len(segments) >= 2 and all(r.stop <= 0x80000000 for ranges in segments[-2:] for r in ranges)
+        if not bulk or private:
+            for indexes, leaf in node.derive_template(segments):
+                addresses = PublicAddresses(public_key_bytes=leaf.public_bytes)
+                yield indexes, leaf.public_bytes, tuple(addresses.get(kind) for kind in kinds), leaf.private_int
+            return
+        for prefix, parent in node.derive_template(segments[:-2]):
+            for chain in itertools.chain.from_iterable(segments[-2]):
+                for r in segments[-1]:
+                    for index, public_bytes, _, addresses in AddressRange.derive_address_range(
+                            parent, chain, r.start, len(r), kinds):
+                        yield prefix + (chain, index), public_bytes, addresses, None
+
+    @staticmethod
+    def format_rows(rows, options: dict) -> str:
+        columns = Cli.columns(options)
+        if options['format'] == 'jsonl':
+            return ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+        out = io.StringIO()
+        csv.writer(out, lineterminator='\n').writerows(rows)
+        return out.getvalue()
+
+    @staticmethod
+    def process_chunk(task):
+        # Runs in a worker: returns (formatted rows, [(line number, error)])
+        numbered_lines, options = task
+        segments = Bip32.parse_path_template(options['path'])
+        kinds = options['kinds']
+        rows = []
+        errors = []
+        for line_number, line in numbered_lines:
+            try:
+                node = Cli.parse_key(line, options['input_type'], options['passphrase'])
+                if options['wif'] and not node.is_private:
+                    raise ValueError('--wif needs a private input')
+                rows_of_key = Cli.derive_rows(node, segments, kinds, options['wif'])
+                for indexes, public_bytes, addresses, private_int in rows_of_key:
+                    row = [line_number, Bip32.format_path(indexes)]
+                    if options['public_key']:
+                        row.append(public_bytes.hex())
+                    row += addresses
+                    if options['wif']:
+                        row.append(BtcAddress.convert_private_key_into_wif(private_int.to_bytes(32, 'big')))
+                    rows.append(row)
+            except ValueError as e:
+                errors.append((line_number, str(e)))
+                if not options['skip_invalid']:
+                    break
+        return Cli.format_rows(rows, options), errors
+
+    @staticmethod
+    def main(argv=None, stdin=None, stdout=None, stderr=None) -> int:
+        stdin = stdin or sys.stdin
+        stdout = stdout or sys.stdout
+        stderr = stderr or sys.stderr
+        parser = Cli.parser()
+        args = parser.parse_args(argv)
+        kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+        for kind in kinds:
+            if kind not in BtcAddress.KINDS:
+                parser.error(f'unknown address kind {kind}, must be one of {", ".join(BtcAddress.KINDS)}')
+        try:
+            Bip32.parse_path_template(args.path)
+        except ValueError as e:
+            parser.error(f'invalid path template {args.path}: {e}')
+        if '*' in args.path:
+            # Every row of an input line is kept until the line is done: an open range would never finish
+            parser.error(f'invalid path template {args.path}: open ranges (*) are not supported, '
+                         f'give explicit ranges such as 0-999')
+        passphrase = args.passphrase
+        if args.passphrase_env is not None:
+            if args.passphrase_env not in os.environ:
+                parser.error(f'environment variable {args.passphrase_env} is not set')
+            passphrase = os.environ[args.passphrase_env]
+        elif args.passphrase_prompt:
+            passphrase = getpass.getpass('BIP39 passphrase: ')
+        if args.chunk_size < 1:
+            parser.error('--chunk-size must be at least 1')
+        options = {
+            'input_type': args.input_type, 'passphrase': passphrase, 'path': args.path, 'kinds': kinds,
+            'format': args.format, 'public_key': args.public_key, 'wif': args.wif, 'skip_invalid': args.skip_invalid,
+        }
+
+        f = stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+        try:
+            lines = ((i, line.strip()) for i, line in enumerate(f, 1) if line.strip() and not line.startswith('#'))
+            chunks = iter(lambda: (list(itertools.islice(lines, args.chunk_size)), options), ([], options))
+            if args.format == 'csv':
+                stdout.write(','.join(Cli.columns(options)) + '\n')
+            for output, errors in Parallel.ordered_map(Cli.process_chunk, chunks, workers=args.workers,
+                                                       executor=args.executor, max_in_flight=args.max_in_flight):
+                stdout.write(output)
+                for line_number, error in errors:
+                    stderr.write(f'line {line_number}: {error}\n')
+                if errors and not args.skip_invalid:
+                    return 1
+        finally:
+            if f is not stdin:
+                f.close()
+        return 0
@@ -0,0 +1,151 @@
+# BIP44-style account discovery (https://github.com/bitcoin/bips/blob/master/bip-0044.mediawiki#account-discovery)
+#
+# Accounts m/purpose'/coin'/account' are scanned in order; on each chain, addresses are derived in batches of
+# consecutive indexes (see AddressRange) and checked with one history lookup per batch, until gap_limit consecutive
+# addresses without history follow the last used one. Discovery stops at the first account whose external chain has
+# no history. (account, chain) scans run on a thread pool a few accounts ahead, so lookup latency overlaps; results
+# past the first unused account are discarded.
+
+import collections
+import itertools
+import sqlite3
+import threading
+
+from lib.address_range import AddressRange
+from lib.bip32 import ExtendedKey
+from lib.parallel import Parallel
+
+
+DiscoveredAccount = collections.namedtuple('DiscoveredAccount', ['index', 'xpub', 'used', 'next_index'])
+# used: {chain: [indexes with history]}, next_index: {chain: first index after the last used one}
+
+
+class MemoryHistory:
+    # History backend over a set of addresses known to have transactions
+
+    def __init__(self, addresses=()):
+        self.addresses = set(addresses)
+
+    def has_history(self, addresses) -> list:
+        return [address in self.addresses for address in addresses]
+
+
+class SqliteHistory:
+    # Local stand-in for an address history service: a SQLite table of addresses that have transactions. Each
+    # thread opens its own connection, so concurrent lookups do not serialize on one connection.
+
+    MAX_VARIABLES = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS history (address TEXT PRIMARY KEY)')
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path)
+        return connection
+
+    def add(self, addresses):
+        with self._connection() as connection:
+            connection.executemany('INSERT OR IGNORE INTO history (address) VALUES (?)',
+                                   [(address,) for address in addresses])
+
+    def has_history(self, addresses) -> list:
+        addresses = list(addresses)
+        found = set()
+        connection = self._connection()
+        for i in range(0, len(addresses), SqliteHistory.MAX_VARIABLES):
+            chunk = addresses[i:i + SqliteHistory.MAX_VARIABLES]
+            query = f'SELECT address FROM history WHERE address IN ({",".join("?" * len(chunk))})'
+            found.update(address for address, in connection.execute(query, chunk))
+        return [address in found for address in addresses]
+
+
+class AccountDiscovery:
+
+    PURPOSE_KINDS = {44: 'p2pkh-compressed', 49: 'p2sh-p2wpkh', 84: 'p2wpkh', 86: 'p2tr'}
+    CHAINS = (0, 1)                     # external (receive), internal (change)
+
+    def __init__(self, history, purpose: int = 84, coin: int = 0, gap_limit: int = 20, batch_size: int = None,
+                 workers: int = 4, account_lookahead: int = 1):
+        # history has has_history(addresses) -> [bool], called with batch_size addresses (default gap_limit)
+        if purpose not in AccountDiscovery.PURPOSE_KINDS:
+            raise ValueError(f'Unsupported purpose {purpose}, must be one of '
+                             f'{", ".join(str(purpose) for purpose in AccountDiscovery.PURPOSE_KINDS)}')
+        if gap_limit < 1:
+            raise ValueError('Gap limit must be at least 1')
+        self.history = history
+        self.purpose = purpose
+        self.coin = coin
+        self.kind = AccountDiscovery.PURPOSE_KINDS[purpose]
+        self.gap_limit = gap_limit
+        self.batch_size = batch_size or gap_limit
+        self.workers = workers
+        self.account_lookahead = account_lookahead
+        self.lookups = 0
+        self._lock = threading.Lock()
+
+    def account_path(self, account: int) -> str:
+        return f"m/{self.purpose}'/{self.coin}'/{account}'"
+
+    def scan_chain(self, account_node: ExtendedKey, chain: int):
+        # Returns the indexes with history on one chain of an account (xpub or xprv node)
+        used = []
+        start = 0
+        last_used = -1
+        while start - last_used - 1 < self.gap_limit:
+            results = list(AddressRange.derive_address_range(account_node, chain, start, self.batch_size,
+                                                             kinds=(self.kind,)))
+            flags = self.history.has_history([addresses[0] for _, _, _, addresses in results])
+            with self._lock:
+                self.lookups += 1
+            for (index, _, _, _), has_history in zip(results, flags):
+                if has_history:
+                    used.append(index)
+                    last_used = index
+            start += self.batch_size
+        return used
+
+    def scan_account(self, account_node: ExtendedKey, account: int = None) -> DiscoveredAccount:
+        # Scans both chains of one account, e.g. from a stored account xpub (see Bip32.deserialize())
+        used = {chain: self.scan_chain(account_node, chain) for chain in AccountDiscovery.CHAINS}
+        return self._account(account_node, account, used)
+
+    def discover(self, master: ExtendedKey) -> list:
+        # master must be private: account keys are hardened
+        if not master.is_private:
+            raise ValueError('Account discovery needs a private master key')
+        account_nodes = {}
+
+        def scan(task):
+            account, chain = task
+            node = account_nodes.get(account)
+            if node is None:
+                node = account_nodes.setdefault(account, master.derive(self.account_path(account)))
+            return account, chain, self.scan_chain(node, chain)
+
+        tasks = ((account, chain) for account in itertools.count() for chain in AccountDiscovery.CHAINS)
+        in_flight = len(AccountDiscovery.CHAINS) * (1 + self.account_lookahead)
+        accounts = []
+        used = {}
+        for account, chain, indexes in Parallel.ordered_map(scan, tasks, workers=self.workers, executor='thread',
+                                                             max_in_flight=in_flight):
+            if chain == AccountDiscovery.CHAINS[0] and not indexes:
+                break
+            used[chain] = indexes
+            if len(used) == len(AccountDiscovery.CHAINS):
+                accounts.append(self._account(account_nodes.pop(account), account, used))
+                used = {}
+        return accounts
+
+    def discover_from_seed(self, seed_bytes: bytes) -> list:
+        return self.discover(ExtendedKey.from_seed(seed_bytes))
+
+    def _account(self, account_node: ExtendedKey, account: int, used: dict) -> DiscoveredAccount:
+        if account is None:
+            account = account_node.index & 0x7fffffff
+        next_index = {chain: indexes[-1] + 1 if indexes else 0 for chain, indexes in used.items()}
+        return DiscoveredAccount(account, account_node.neuter().serialize_xpub(), used, next_index)
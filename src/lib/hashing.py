@@ -0,0 +1,200 @@
+# Hash functions shared by keys, addresses and mnemonics
+#
+# hashlib constructors are looked up once and hash states for constant prefixes (version bytes, redeem script
+# header, HMAC keys, BIP 340 tags) are fed once and copied per call. RIPEMD-160 falls back to a pure-Python
+# implementation when OpenSSL does not provide it (OpenSSL 3 without the legacy provider).
+
+import hashlib
+import hmac
+import struct
+
+try:
+    _RIPEMD160_STATE = hashlib.new('ripemd160')
+except ValueError:
+    _RIPEMD160_STATE = None
+
+_sha256 = hashlib.sha256
+
+
+class Ripemd160:
+    # Pure-Python RIPEMD-160. Ref: https://homes.esat.kuleuven.be/~bosselae/ripemd160.html
+
+    # Message word selection and rotation amounts of the left and right lines, 5 rounds of 16 steps
+    R_LEFT = (
+        0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,
+        7, 4, 13, 1, 10, 6, 15, 3, 12, 0, 9, 5, 2, 14, 11, 8,
+        3, 10, 14, 4, 9, 15, 8, 1, 2, 7, 0, 6, 13, 11, 5, 12,
+        1, 9, 11, 10, 0, 8, 12, 4, 13, 3, 7, 15, 14, 5, 6, 2,
+        4, 0, 5, 9, 7, 12, 2, 10, 14, 1, 3, 8, 11, 6, 15, 13,
+    )
+    R_RIGHT = (
+        5, 14, 7, 0, 9, 2, 11, 4, 13, 6, 15, 8, 1, 10, 3, 12,
+        6, 11, 3, 7, 0, 13, 5, 10, 14, 15, 8, 12, 4, 9, 1, 2,
+        15, 5, 1, 3, 7, 14, 6, 9, 11, 8, 12, 2, 10, 0, 4, 13,
+        8, 6, 4, 1, 3, 11, 15, 0, 5, 12, 2, 13, 9, 7, 10, 14,
+        12, 15, 10, 4, 1, 5, 8, 7, 6, 2, 13, 14, 0, 3, 9, 11,
+    )
+    S_LEFT = (
+        11, 14, 15, 12, 5, 8, 7, 9, 11, 13, 14, 15, 6, 7, 9, 8,
+        7, 6, 8, 13, 11, 9, 7, 15, 7, 12, 15, 9, 11, 7, 13, 12,
+        11, 13, 6, 7, 14, 9, 13, 15, 14, 8, 13, 6, 5, 12, 7, 5,
+        11, 12, 14, 15, 14, 15, 9, 8, 9, 14, 5, 6, 8, 6, 5, 12,
+        9, 15, 5, 11, 6, 8, 13, 12, 5, 12, 13, 14, 11, 8, 5, 6,
+    )
+    S_RIGHT = (
+        8, 9, 9, 11, 13, 15, 15, 5, 7, 7, 8, 11, 14, 14, 12, 6,
+        9, 13, 15, 7, 12, 8, 9, 11, 7, 7, 12, 7, 6, 15, 13, 11,
+        9, 7, 15, 11, 8, 6, 6, 14, 12, 13, 5, 14, 13, 13, 7, 5,
+        15, 5, 8, 11, 14, 14, 6, 14, 6, 9, 12, 9, 12, 5, 15, 8,
+        8, 5, 12, 9, 12, 5, 14, 6, 8, 13, 6, 5, 15, 13, 11, 11,
+    )
+    K_LEFT = (0x00000000, 0x5a827999, 0x6ed9eba1, 0x8f1bbcdc, 0xa953fd4e)
+    K_RIGHT = (0x50a28be6, 0x5c4dd124, 0x6d703ef3, 0x7a6d76e9, 0x00000000)
+    INITIAL_STATE = (0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476, 0xc3d2e1f0)
+
+    @staticmethod
+    def f(j: int, x: int, y: int, z: int) -> int:
+        if j == 0:
+            return x ^ y ^ z
+        if j == 1:
+            return (x & y) | (~x & z)
+        if j == 2:
+            return (x | ~y) ^ z
+        if j == 3:
+            return (x & z) | (y & ~z)
+        return x ^ (y | ~z)
+
+    @staticmethod
+    def compress(state, block: bytes):
+        X = struct.unpack('<16I', block)
+        f = Ripemd160.f
+        R_LEFT, R_RIGHT, S_LEFT, S_RIGHT = Ripemd160.R_LEFT, Ripemd160.R_RIGHT, Ripemd160.S_LEFT, Ripemd160.S_RIGHT
+        K_LEFT, K_RIGHT = Ripemd160.K_LEFT, Ripemd160.K_RIGHT
+        al, bl, cl, dl, el = state
+        ar, br, cr, dr, er = state
+        for i in range(80):
+            j = i >> 4
+            t = (al + (f(j, bl, cl, dl) & 0xffffffff) + X[R_LEFT[i]] + K_LEFT[j]) & 0xffffffff
+            s = S_LEFT[i]
+            t = ((t << s | t >> (32 - s)) + el) & 0xffffffff
+            al, el, dl, cl, bl = el, dl, (cl << 10 | cl >> 22) & 0xffffffff, bl, t
+            t = (ar + (f(4 - j, br, cr, dr) & 0xffffffff) + X[R_RIGHT[i]] + K_RIGHT[j]) & 0xffffffff
+            s = S_RIGHT[i]
+            t = ((t << s | t >> (32 - s)) + er) & 0xffffffff
+            ar, er, dr, cr, br = er, dr, (cr << 10 | cr >> 22) & 0xffffffff, br, t
+        h0, h1, h2, h3, h4 = state
+        return ((h1 + cl + dr) & 0xffffffff, (h2 + dl + er) & 0xffffffff, (h3 + el + ar) & 0xffffffff,
+                (h4 + al + br) & 0xffffffff, (h0 + bl + cr) & 0xffffffff)
+
+    @staticmethod
+    def digest(b: bytes) -> bytes:
+        padded = b + b'\x80' + b'\x00' * ((55 - len(b)) % 64) + struct.pack('<Q', 8 * len(b))
+        state = Ripemd160.INITIAL_STATE
+        for i in range(0, len(padded), 64):
+            state = Ripemd160.compress(state, padded[i:i + 64])
+        return struct.pack('<5I', *state)
+
+
+class Hashing:
+
+    # Pre-fed states, see sha256_prefixed(), tagged_hash() and hmac_sha512()
+    _sha256_states = {}
+    _hmac_states = {}
+    _tag_states = {}
+
+    @staticmethod
+    def sha256(b: bytes) -> bytes:
+        return _sha256(b).digest()
+
+    @staticmethod
+    def hash256(b: bytes) -> bytes:
+        # Double SHA-256
+        return _sha256(_sha256(b).digest()).digest()
+
+    if _RIPEMD160_STATE is not None:
+        @staticmethod
+        def ripemd160(b: bytes) -> bytes:
+            h = _RIPEMD160_STATE.copy()
+            h.update(b)
+            return h.digest()
+    else:
+        ripemd160 = staticmethod(Ripemd160.digest)
+
+    @staticmethod
+    def hash160(b: bytes) -> bytes:
+        return Hashing.ripemd160(_sha256(b).digest())
+
+    @staticmethod
+    def sha256_prefixed(prefix: bytes, b: bytes):
+        # sha256(prefix + b) as a hash object, from a state fed with the constant prefix once
+        state = Hashing._sha256_states.get(prefix)
+        if state is None:
+            state = Hashing._sha256_states[prefix] = _sha256(prefix)
+        h = state.copy()
+        h.update(b)
+        return h
+
+    @staticmethod
+    def hash160_prefixed(prefix: bytes, b: bytes) -> bytes:
+        # hash160(prefix + b), e.g. of the P2WPKH redeem script b'\x00\x14' + hash160
+        return Hashing.ripemd160(Hashing.sha256_prefixed(prefix, b).digest())
+
+    @staticmethod
+    def checksum(b: bytes) -> bytes:
+        # Base58Check checksum
+        return _sha256(_sha256(b).digest()).digest()[:4]
+
+    @staticmethod
+    def checksum_prefixed(prefix: bytes, b: bytes) -> bytes:
+        # Base58Check checksum of prefix + b, e.g. a version byte and a hash160
+        return _sha256(Hashing.sha256_prefixed(prefix, b).digest()).digest()[:4]
+
+    @staticmethod
+    def tagged_hash(tag: str, msg: bytes) -> bytes:
+        # BIP 340 tagged hash: sha256(sha256(tag) || sha256(tag) || msg)
+        state = Hashing._tag_states.get(tag)
+        if state is None:
+            tag_hash = _sha256(tag.encode()).digest()
+            state = Hashing._tag_states[tag] = _sha256(tag_hash + tag_hash)
+        h = state.copy()
+        h.update(msg)
+        return h.digest()
+
+    @staticmethod
+    def hmac_sha512(key: bytes, msg: bytes) -> bytes:
+        # Keys registered with cache_hmac_key() are padded and hashed once; other keys go through hmac.digest()
+        state = Hashing._hmac_states.get(key)
+        if state is None:
+            return hmac.digest(key, msg, 'sha512')
+        h = state.copy()
+        h.update(msg)
+        return h.digest()
+
+    @staticmethod
+    def hmac_sha512_state(key: bytes, prefix: bytes = b''):
+        # HMAC-SHA512 state keyed once and fed with a constant message prefix, for hmac_sha512_from_state()
+        return hmac.new(key, prefix, hashlib.sha512)
+
+    @staticmethod
+    def hmac_sha512_from_state(state, msg: bytes) -> bytes:
+        # HMAC-SHA512 of the state's key over its prefix + msg, e.g. over a parent public key + child index
+        h = state.copy()
+        h.update(msg)
+        return h.digest()
+
+    @staticmethod
+    def cache_hmac_key(key: bytes):
+        Hashing._hmac_states[key] = hmac.new(key, digestmod=hashlib.sha512)
+
+    @staticmethod
+    def hash160_batch(items) -> list:
+        ripemd160 = Hashing.ripemd160
+        return [ripemd160(_sha256(b).digest()) for b in items]
+
+    @staticmethod
+    def hash256_batch(items) -> list:
+        return [_sha256(_sha256(b).digest()).digest() for b in items]
+
+
+# BIP 32 master key derivation
+Hashing.cache_hmac_key(b'Bitcoin seed')
@@ -0,0 +1,185 @@
+# Opt-in counters and timers for the hot paths: EC operations, HMAC-SHA512, PBKDF2, hashing and address encoding
+#
+# Disabled, nothing is wrapped and the library runs untouched. enable() replaces the instrumented functions on their
+# classes (and the aliases of them other classes keep, such as BtcAddress.sha256) with wrappers that count calls and
+# accumulate wall time; disable() puts back exactly the originals it replaced. Every lib module is imported by enable()
+# first: one imported later would alias the wrappers and keep them after disable(). Timings are inclusive: hash160
+# includes its ripemd160.
+# Only the calling process is measured, so work sent to process pools (see Parallel.ordered_map) is not counted.
+#
+#   with Instrumentation.record() as recording:
+#       Bip32.derive_from_path(seed, "m/84'/0'/0'/0/0")
+#   recording.snapshot()['ec.multiply'].count
+
+import collections
+import contextlib
+import functools
+import importlib
+import pkgutil
+import sys
+import threading
+import time
+
+
+OperationStats = collections.namedtuple('OperationStats', ['count', 'seconds'])
+
+
+class Instrumentation:
+
+    # (module, class, function, operation)
+    TARGETS = (
+        ('lib.secp256k1', 'Secp256k1', 'multiply_generator_jacobian', 'ec.multiply'),
+        ('lib.secp256k1', 'CoincurveBackend', 'point_from_scalar', 'ec.multiply'),
+        ('lib.secp256k1', 'PythonBackend', 'point_add', 'ec.add'),
+        ('lib.secp256k1', 'CoincurveBackend', 'point_add', 'ec.add'),
+        ('lib.secp256k1', 'PythonBackend', 'decompress', 'ec.decompress'),
+        ('lib.secp256k1', 'CoincurveBackend', 'decompress', 'ec.decompress'),
+        ('lib.hashing', 'Hashing', 'hmac_sha512', 'hmac.sha512'),
+        ('lib.hashing', 'Hashing', 'hmac_sha512_from_state', 'hmac.sha512'),
+        ('lib.bip39', 'Bip39', 'mnemonic_and_passphrase_to_seed', 'pbkdf2.sha512'),
+        ('lib.hashing', 'Hashing', 'sha256', 'hash.sha256'),
+        ('lib.hashing', 'Hashing', 'sha256_prefixed', 'hash.sha256'),
+        ('lib.hashing', 'Hashing', 'hash256', 'hash.hash256'),
+        ('lib.hashing', 'Hashing', 'checksum', 'hash.hash256'),
+        ('lib.hashing', 'Hashing', 'checksum_prefixed', 'hash.hash256'),
+        ('lib.hashing', 'Hashing', 'ripemd160', 'hash.ripemd160'),
+        ('lib.hashing', 'Hashing', 'hash160', 'hash.hash160'),
+        ('lib.hashing', 'Hashing', 'hash160_prefixed', 'hash.hash160'),
+        ('lib.hashing', 'Hashing', 'tagged_hash', 'hash.tagged'),
+        ('lib.bip32', 'ExtendedKey', 'child', 'bip32.child'),
+        ('lib.base58check', 'Base58Check', 'encode', 'base58.encode'),
+        ('lib.base58check', 'Base58Check', 'decode', 'base58.decode'),
+        ('lib.segwit', 'SegwitAddress', 'encode', 'bech32.encode'),
+        ('lib.segwit', 'SegwitAddress', 'decode', 'bech32.decode'),
+    )
+
+    _lock = threading.Lock()
+    _enabled = 0                        # nesting depth of enable()
+    _patched = []                       # (owner, attribute, original descriptor) of every attribute replaced
+    _counts = collections.Counter()
+    _seconds = collections.Counter()
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return Instrumentation._enabled > 0
+
+    @staticmethod
+    def enable():
+        # Nested calls are counted: the functions are restored by the matching last disable()
+        with Instrumentation._lock:
+            Instrumentation._enabled += 1
+            if Instrumentation._enabled == 1:
+                Instrumentation._patch()
+
+    @staticmethod
+    def disable():
+        with Instrumentation._lock:
+            if Instrumentation._enabled == 0:
+                return
+            Instrumentation._enabled -= 1
+            if Instrumentation._enabled == 0:
+                for owner, attribute, descriptor in reversed(Instrumentation._patched):
+                    setattr(owner, attribute, descriptor)
+                Instrumentation._patched = []
+
+    @staticmethod
+    def reset():
+        with Instrumentation._lock:
+            Instrumentation._counts.clear()
+            Instrumentation._seconds.clear()
+
+    @staticmethod
+    def snapshot() -> dict:
+        # {operation: OperationStats(count, seconds)}, cumulative since the last reset()
+        with Instrumentation._lock:
+            return {operation: OperationStats(count, Instrumentation._seconds[operation])
+                    for operation, count in sorted(Instrumentation._counts.items())}
+
+    @staticmethod
+    @contextlib.contextmanager
+    def record():
+        # Enables instrumentation for the block; the yielded Recording reports what happened since it started
+        Instrumentation.enable()
+        try:
+            yield Recording(Instrumentation.snapshot())
+        finally:
+            Instrumentation.disable()
+
+    @staticmethod
+    def prometheus(snapshot: dict = None, prefix: str = 'bitcoin') -> str:
+        # Prometheus text exposition format
+        if snapshot is None:
+            snapshot = Instrumentation.snapshot()
+        lines = [f'# HELP {prefix}_operations_total Calls of instrumented operations.',
+                 f'# TYPE {prefix}_operations_total counter']
+        lines += [f'{prefix}_operations_total{{operation="{operation}"}} {stats.count}'
+                  for operation, stats in snapshot.items()]
+        lines += [f'# HELP {prefix}_operation_seconds_total Cumulative wall time of instrumented operations.',
+                  f'# TYPE {prefix}_operation_seconds_total counter']
+        lines += [f'{prefix}_operation_seconds_total{{operation="{operation}"}} {stats.seconds:.9f}'
+                  for operation, stats in snapshot.items()]
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _wrap(function, operation: str):
+        counts = Instrumentation._counts
+        seconds = Instrumentation._seconds
+        lock = Instrumentation._lock
+        perf_counter = time.perf_counter
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                with lock:
+                    counts[operation] += 1
+                    seconds[operation] += elapsed
+        return wrapper
+
+    @staticmethod
+    def _patch():
+        for module_info in pkgutil.iter_modules(importlib.import_module('lib').__path__, 'lib.'):
+            if module_info.name != 'lib.__main__':
+                importlib.import_module(module_info.name)
+        operations = {}
+        for module_name, class_name, attribute, operation in Instrumentation.TARGETS:
+            owner = getattr(importlib.import_module(module_name), class_name)
+            descriptor = owner.__dict__[attribute]
+            function = descriptor.__func__ if isinstance(descriptor, staticmethod) else descriptor
+            operations[function] = operation
+        # Patch the targets and every alias of them kept as a staticmethod by the classes of lib modules
+        for module in list(sys.modules.values()):
+            if not getattr(module, '__name__', '').startswith('lib.'):
+                continue
+            for owner in vars(module).values():
+                if not isinstance(owner, type) or owner.__module__ != module.__name__:
+                    continue
+                for attribute, descriptor in list(vars(owner).items()):
+                    is_static = isinstance(descriptor, staticmethod)
+                    function = descriptor.__func__ if is_static else descriptor
+                    if not callable(function) or function not in operations:
+                        continue
+                    wrapper = Instrumentation._wrap(function, operations[function])
+                    Instrumentation._patched.append((owner, attribute, descriptor))
+                    setattr(owner, attribute, staticmethod(wrapper) if is_static else wrapper)
+
+
+class Recording:
+
+    def __init__(self, start: dict):
+        self._start = start
+
+    def snapshot(self) -> dict:
+        # Operations since the recording started
+        result = {}
+        for operation, stats in Instrumentation.snapshot().items():
+            start = self._start.get(operation, OperationStats(0, 0.0))
+            if stats.count > start.count:
+                result[operation] = OperationStats(stats.count - start.count, stats.seconds - start.seconds)
+        return result
+
+    def prometheus(self, prefix: str = 'bitcoin') -> str:
+        return Instrumentation.prometheus(self.snapshot(), prefix)
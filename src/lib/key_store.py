@@ -0,0 +1,131 @@
+# Packed store of derived keys: fixed-width records of child index, compressed public key, hash160 and optionally
+# chain code (57 or 89 bytes each, against 300+ bytes for the equivalent Python tuple). Saved stores are loaded
+# through a read-only mmap, so worker processes opening the same file share one copy in the page cache.
+
+import mmap
+import struct
+
+from lib.atomic_file import AtomicFile
+
+try:
+    import numpy    # optional, pip3 install --break-system-packages numpy
+except ImportError:
+    numpy = None
+
+
+class KeyStore:
+
+    MAGIC = b'keystore'
+    FORMAT_VERSION = 1
+    # magic | format version | flags | record count
+    HEADER = struct.Struct('>8sBBQ')
+    FLAG_CHAIN_CODE = 0x01
+    # index | compressed public key | hash160 [| chain code]
+    RECORD = struct.Struct('>I33s20s')
+    RECORD_WITH_CHAIN_CODE = struct.Struct('>I33s20s32s')
+
+    def __init__(self, with_chain_code: bool = False):
+        self.with_chain_code = with_chain_code
+        self.record = KeyStore.RECORD_WITH_CHAIN_CODE if with_chain_code else KeyStore.RECORD
+        self.path = None
+        self._buffer = bytearray()
+        self._offset = 0
+        self._count = 0
+        self._mm = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int):
+        # (index, public key, hash160[, chain code])
+        if i < 0:
+            i += self._count
+        if not (0 <= i < self._count):
+            raise IndexError('KeyStore index out of range')
+        return self.record.unpack_from(self._buffer, self._offset + i * self.record.size)
+
+    def __iter__(self):
+        view = memoryview(self._buffer)[self._offset:self._offset + self._count * self.record.size]
+        return self.record.iter_unpack(view)
+
+    def __reduce__(self):
+        # A loaded store is sent to worker processes as its path and mapped again there instead of being copied
+        if self._mm is not None:
+            return KeyStore.load, (self.path,)
+        return super().__reduce__()
+
+    @property
+    def read_only(self) -> bool:
+        return self._mm is not None
+
+    def append(self, index: int, public_key: bytes, hash160: bytes, chain_code: bytes = None):
+        if self.read_only:
+            raise ValueError('KeyStore loaded from a file is read-only')
+        if len(public_key) != 33 or len(hash160) != 20:
+            raise ValueError('Expected a 33-byte compressed public key and a 20-byte hash160')
+        if self.with_chain_code:
+            if chain_code is None or len(chain_code) != 32:
+                raise ValueError('Expected a 32-byte chain code')
+            self._buffer += self.record.pack(index, public_key, hash160, chain_code)
+        else:
+            self._buffer += self.record.pack(index, public_key, hash160)
+        self._count += 1
+
+    def extend(self, records):
+        # records of (index, public key, hash160[, chain code]), e.g.
+        # store.extend(result[:3] for result in AddressRange.derive_address_range(...))
+        for record in records:
+            self.append(*record)
+
+    def indexes(self) -> list:
+        return [record[0] for record in self]
+
+    def hash160s(self) -> list:
+        return [record[2] for record in self]
+
+    def to_numpy(self):
+        # Structured array viewing the records without copying (read-only for a loaded store). Byte fields are
+        # uint8 sub-arrays rather than 'S' strings, which would drop trailing zero bytes.
+        if numpy is None:
+            raise ValueError('NumPy is not installed')
+        fields = [('index', '>u4'), ('public_key', 'u1', (33,)), ('hash160', 'u1', (20,))]
+        if self.with_chain_code:
+            fields.append(('chain_code', 'u1', (32,)))
+        return numpy.frombuffer(self._buffer, dtype=numpy.dtype(fields), count=self._count, offset=self._offset)
+
+    def save(self, path: str):
+        flags = KeyStore.FLAG_CHAIN_CODE if self.with_chain_code else 0
+        header = KeyStore.HEADER.pack(KeyStore.MAGIC, KeyStore.FORMAT_VERSION, flags, self._count)
+        # Readers never see a partial store
+        records = memoryview(self._buffer)[self._offset:self._offset + self._count * self.record.size]
+        AtomicFile.write(path, (header, records))
+
+    @staticmethod
+    def load(path: str) -> 'KeyStore':
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) < KeyStore.HEADER.size:
+            mm.close()
+            raise ValueError(f'Key store {path} has an unexpected format')
+        magic, format_version, flags, count = KeyStore.HEADER.unpack_from(mm)
+        store = KeyStore(with_chain_code=bool(flags & KeyStore.FLAG_CHAIN_CODE))
+        if (magic != KeyStore.MAGIC or format_version != KeyStore.FORMAT_VERSION
+                or len(mm) != KeyStore.HEADER.size + count * store.record.size):
+            mm.close()
+            raise ValueError(f'Key store {path} has an unexpected format')
+        store.path = path
+        store._buffer = mm
+        store._mm = mm
+        store._offset = KeyStore.HEADER.size
+        store._count = count
+        return store
+
+    def close(self):
+        # NumPy views from to_numpy() must be released first. The store is empty afterwards.
+        if self._mm is not None:
+            self._mm.close()
+        self.path = None
+        self._buffer = bytearray()
+        self._offset = 0
+        self._count = 0
+        self._mm = None
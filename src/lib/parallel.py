@@ -0,0 +1,44 @@
+# Order-preserving parallel map with a bounded number of in-flight tasks
+
+import collections
+import concurrent.futures
+import os
+
+
+class Parallel:
+
+    @staticmethod
+    def default_workers() -> int:
+        return os.cpu_count() or 1
+
+    @staticmethod
+    def ordered_map(fn, iterable, workers: int = None, executor: str = 'process', max_in_flight: int = None):
+        # Lazy counterpart of Executor.map(): the input is consumed only as results are taken, so at most
+        # max_in_flight tasks (default 2 per worker) are queued or running at once and memory stays flat on huge
+        # inputs. Results are yielded in input order. workers=1 runs in the calling thread without a pool.
+        if workers is None:
+            workers = Parallel.default_workers()
+        if workers <= 1:
+            yield from map(fn, iterable)
+            return
+        if executor == 'process':
+            pool = concurrent.futures.ProcessPoolExecutor(workers)
+        elif executor == 'thread':
+            pool = concurrent.futures.ThreadPoolExecutor(workers)
+        else:
+            raise ValueError(f'Unknown executor {executor}, must be "process" or "thread"')
+        if max_in_flight is None:
+            max_in_flight = 2 * workers
+        pending = collections.deque()
+        try:
+            for item in iterable:
+                pending.append(pool.submit(fn, item))
+                if len(pending) >= max_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Reached early when the consumer stops iterating or a task failed
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
@@ -0,0 +1,137 @@
+# Bulk wallet provisioning: random mnemonic -> seed -> account xprv/xpub -> first receive addresses
+#
+# Wallets are produced in chunks. The parent draws the entropy of a whole chunk with one CSPRNG call and hands the
+# chunk to a worker process, which runs every stage on it (mnemonics, PBKDF2 seeds, account keys, addresses); with
+# a bounded number of chunks in flight (see Parallel.ordered_map), the stages of consecutive chunks overlap across
+# processes. Finished chunks are written in order, each to its own JSONL file, then recorded in a checkpoint file.
+# After a crash, run() resumes after the last recorded chunk: a chunk file written but not recorded is discarded and
+# regenerated with new entropy, so no wallet is handed out twice.
+
+import json
+import os
+
+from lib.address_range import AddressRange
+from lib.atomic_file import AtomicFile
+from lib.bip32 import Bip32, ExtendedKey
+from lib.bip39 import Bip39
+from lib.discovery import AccountDiscovery
+from lib.parallel import Parallel
+
+
+class WalletProvisioning:
+
+    CHECKPOINT = 'checkpoint.json'
+    CHUNK_FILE = 'wallets-{:06d}.jsonl'
+
+    def __init__(self, directory: str, purpose: int = 84, coin: int = 0, account: int = 0, receive_count: int = 20,
+                 entropy_len: int = 256, passphrase: str = '', chunk_size: int = 256, workers: int = None,
+                 max_in_flight: int = None):
+        if purpose not in AccountDiscovery.PURPOSE_KINDS:
+            raise ValueError(f'Unsupported purpose {purpose}, must be one of '
+                             f'{", ".join(str(purpose) for purpose in AccountDiscovery.PURPOSE_KINDS)}')
+        if chunk_size < 1:
+            raise ValueError('Chunk size must be at least 1')
+        self.directory = directory
+        self.config = {
+            'purpose': purpose, 'coin': coin, 'account': account, 'receive_count': receive_count,
+            'entropy_len': entropy_len,
+        }
+        # The passphrase is not written to the checkpoint
+        self.passphrase = passphrase
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.committed_chunks = 0
+        self.committed_wallets = 0
+        checkpoint_path = os.path.join(directory, WalletProvisioning.CHECKPOINT)
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint['config'] != self.config:
+                raise ValueError(f'Provisioning directory {directory} was started with a different configuration')
+            self.committed_chunks = checkpoint['chunks']
+            self.committed_wallets = checkpoint['wallets']
+
+    @property
+    def account_path(self) -> str:
+        return f"m/{self.config['purpose']}'/{self.config['coin']}'/{self.config['account']}'"
+
+    # Stages, each over a whole chunk
+
+    @staticmethod
+    def mnemonics(entropies) -> list:
+        return Bip39.entropy_to_mnemonic_batch(entropies)
+
+    @staticmethod
+    def seeds(mnemonics, passphrase: str = '') -> list:
+        return [Bip39.mnemonic_and_passphrase_to_seed(mnemonic, passphrase) for mnemonic in mnemonics]
+
+    @staticmethod
+    def accounts(seeds, account_path: str) -> list:
+        path = Bip32.parse_path(account_path)
+        return [ExtendedKey.from_seed(seed_bytes).derive(path) for seed_bytes in seeds]
+
+    @staticmethod
+    def receive_addresses(account_node: ExtendedKey, count: int, kind: str) -> list:
+        return [addresses[0] for _, _, _, addresses in AddressRange.derive_address_range(
+            account_node, 0, 0, count, kinds=(kind,))]
+
+    @staticmethod
+    def provision_chunk(task) -> list:
+        # Runs in a worker: all stages of one chunk, returns its records
+        first_wallet, entropies, config, passphrase, account_path = task
+        mnemonics = WalletProvisioning.mnemonics(entropies)
+        seeds = WalletProvisioning.seeds(mnemonics, passphrase)
+        kind = AccountDiscovery.PURPOSE_KINDS[config['purpose']]
+        records = []
+        for i, (mnemonic, account_node) in enumerate(zip(mnemonics, WalletProvisioning.accounts(seeds, account_path))):
+            records.append({
+                'wallet': first_wallet + i,
+                'mnemonic': mnemonic,
+                'path': account_path,
+                'xprv': account_node.serialize_xprv(),
+                'xpub': account_node.serialize_xpub(),
+                'addresses': WalletProvisioning.receive_addresses(account_node, config['receive_count'], kind),
+            })
+        return records
+
+    def run(self, total: int) -> int:
+        # Provisions wallets until total have been committed; returns the number of wallets committed by this call
+        os.makedirs(self.directory, exist_ok=True)
+        # Chunks written after the last checkpoint were never handed out
+        for name in os.listdir(self.directory):
+            number = name[len('wallets-'):-len('.jsonl')]
+            if name.startswith('wallets-') and name.endswith('.jsonl') and number.isdigit() and \
+                    int(number) >= self.committed_chunks:
+                os.unlink(os.path.join(self.directory, name))
+        start_wallets = self.committed_wallets
+
+        def tasks():
+            first_wallet = self.committed_wallets
+            while first_wallet < total:
+                count = min(self.chunk_size, total - first_wallet)
+                entropies = Bip39.generate_random_entropy_batch(count, self.config['entropy_len'])
+                yield first_wallet, entropies, self.config, self.passphrase, self.account_path
+                first_wallet += count
+
+        for records in Parallel.ordered_map(WalletProvisioning.provision_chunk, tasks(), workers=self.workers,
+                                            max_in_flight=self.max_in_flight):
+            chunk_path = os.path.join(self.directory, WalletProvisioning.CHUNK_FILE.format(self.committed_chunks))
+            # Private to the owner (chunks hold mnemonics and xprvs); fsync so a recorded chunk survives a crash of
+            # the machine too
+            AtomicFile.write(chunk_path, ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8'),
+                             mode=0o600, fsync=True)
+            self.committed_chunks += 1
+            self.committed_wallets += len(records)
+            checkpoint = {'config': self.config, 'chunks': self.committed_chunks, 'wallets': self.committed_wallets}
+            AtomicFile.write(os.path.join(self.directory, WalletProvisioning.CHECKPOINT),
+                             json.dumps(checkpoint).encode('utf-8'), mode=0o600, fsync=True)
+        return self.committed_wallets - start_wallets
+
+    def wallets(self):
+        # Yields the committed records in wallet order
+        for chunk in range(self.committed_chunks):
+            with open(os.path.join(self.directory, WalletProvisioning.CHUNK_FILE.format(chunk)), 'r',
+                      encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
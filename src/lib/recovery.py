@@ -0,0 +1,492 @@
+# Recovery of BIP39 mnemonics with missing, misspelled or swapped words, and of forgotten BIP39 passphrases
+#
+# Candidates are numbered 0..total-1 so the search space can be split into chunks, run on a process pool and
+# resumed from a checkpoint. For mnemonics, the BIP39 checksum rejects most candidates (15 out of 16 for 12 words)
+# before the expensive PBKDF2 seed derivation. Seeds are confirmed against a known master key fingerprint or a known
+# address at a derivation path, deriving only that path and comparing hashes.
+
+import collections
+import copy
+import hashlib
+import json
+import os
+import string
+import threading
+import time
+
+from lib import secp256k1
+from lib.atomic_file import AtomicFile
+from lib.bip32 import Bip32, ExtendedKey
+from lib.bip39 import Bip39
+from lib.btc_address import BtcAddress
+from lib.hashing import Hashing
+from lib.parallel import Parallel
+
+
+# done/total count candidate numbers consumed; tested counts candidates actually tried, which is larger when a search
+# expands each number into variants; derived counts those that went through seed derivation (PBKDF2); rate is in
+# tested candidates per second
+RecoveryProgress = collections.namedtuple('RecoveryProgress', ['done', 'total', 'tested', 'derived', 'found', 'rate'])
+
+
+class RecoveryTarget:
+    # What a recovered seed must match: the 4-byte master key fingerprint (as displayed by wallets, e.g. '3442193e'),
+    # or an address derived at path
+
+    __slots__ = ('fingerprint', 'path', 'kind', 'hash')
+
+    def __init__(self, fingerprint: str = None, address: str = None, path: str = None):
+        if (fingerprint is None) == (address is None):
+            raise ValueError('Recovery target needs either a fingerprint or an address')
+        if address is not None and path is None:
+            raise ValueError('Recovery target address needs a derivation path')
+        self.fingerprint = bytes.fromhex(fingerprint) if fingerprint is not None else None
+        self.path = Bip32.parse_path(path) if path is not None else None
+        self.kind, self.hash = BtcAddress.decode_address(address) if address is not None else (None, None)
+
+    def describe(self) -> str:
+        if self.fingerprint is not None:
+            return f'fingerprint:{self.fingerprint.hex()}'
+        return f'{self.kind}:{self.hash.hex()}@{self.path}'
+
+    def matches_seed(self, seed_bytes: bytes) -> bool:
+        private_int, chain_code = Bip32.master_key_from_seed(seed_bytes)
+        if self.fingerprint is not None:
+            return Bip32.fingerprint_from_private(private_int) == self.fingerprint
+        # Only (private key, chain code) pairs are walked: no fingerprint of the intermediate keys is computed, and
+        # public keys only where a non-hardened child needs its parent's
+        for index in self.path:
+            private_int, chain_code = Bip32.derive_child_key(private_int, chain_code, index)
+        return self.matches_public_key(Bip32.public_from_private(private_int))
+
+    def matches_key(self, node: ExtendedKey) -> bool:
+        return self.matches_public_key(node.public_bytes, node.identifier)
+
+    def matches_public_key(self, public_bytes: bytes, identifier: bytes = None) -> bool:
+        # public_bytes is compressed, identifier its hash160 when already known. Compares hashes only; no address
+        # string is built.
+        if self.kind == 'p2tr':
+            return BtcAddress.taproot_output_key(public_bytes) == self.hash
+        if identifier is None:
+            identifier = Hashing.hash160(public_bytes)
+        if self.kind == 'p2wpkh':
+            return identifier == self.hash
+        if self.kind == 'p2sh':
+            return Hashing.hash160_prefixed(b'\x00\x14', identifier) == self.hash
+        # Legacy addresses may hash the compressed or, as BtcAddress.derive_public_addresses() does, the uncompressed
+        # public key
+        if identifier == self.hash:
+            return True
+        backend = secp256k1.backend
+        return Hashing.hash160(backend.uncompress(backend.decompress(public_bytes))) == self.hash
+
+
+class MnemonicRecovery:
+    # words: the mnemonic as remembered, '?' marking an unknown word. Words not in the wordlist are replaced by
+    # the wordlist words one edit away (or matching a 4-letter abbreviation). If exactly one word is missing at an
+    # unknown position, every position is tried. swaps=True additionally tries every pair of words swapped.
+
+    UNKNOWN = '?'
+
+    def __init__(self, words, target: RecoveryTarget, passphrase: str = '', swaps: bool = False):
+        if isinstance(words, str):
+            words = words.strip().split()
+        self.target = target
+        self.passphrase = passphrase
+
+        choices = [self.word_candidates(word) for word in words]
+        if len(choices) in [12, 15, 18, 21, 24]:
+            templates = [choices]
+            inserted = [None]
+        elif len(choices) + 1 in [12, 15, 18, 21, 24]:
+            # Inserting word w after word v gives the same mnemonic as inserting v before v when w == v: the word
+            # inserted at i excludes the candidates of the word before it, so no mnemonic is tried twice
+            templates = [choices[:i] + [sorted(set(range(2048)).difference(choices[i - 1]) if i else range(2048))]
+                         + choices[i:] for i in range(len(choices) + 1)]
+            inserted = list(range(len(choices) + 1))
+        else:
+            raise ValueError('Mnemonic must have 12, 15, 18, 21 or 24 words, or one less')
+        if swaps:
+            # Swapping the inserted word with another one is already an insertion at another position
+            for template, k in list(zip(templates, inserted)):
+                for i in range(len(template)):
+                    for j in range(i + 1, len(template)):
+                        if k not in (i, j) and template[i] != template[j]:
+                            swapped = list(template)
+                            swapped[i], swapped[j] = template[j], template[i]
+                            templates.append(swapped)
+        self.templates = MnemonicRecovery.disjoint_templates(templates)
+        self.sizes = []
+        for template in self.templates:
+            size = 1
+            for candidates in template:
+                size *= len(candidates)
+            self.sizes.append(size)
+        self.total = sum(self.sizes)
+
+    @staticmethod
+    def disjoint_templates(templates) -> list:
+        # Templates (one candidate list per word) to templates covering the same mnemonics, none of them twice: every
+        # template loses the mnemonics of the earlier ones it overlaps, which are few and found through a trie
+        result = []
+        trie = _TemplateTrie()
+        for template in templates:
+            template = [list(candidates) for candidates in template]
+            if not all(template):
+                continue
+            pieces = [template]
+            for other in trie.overlapping(template):
+                pieces = [rest for piece in pieces for rest in MnemonicRecovery.template_difference(piece, other)]
+            for piece in pieces:
+                result.append(piece)
+                trie.add(piece)
+        return result
+
+    @staticmethod
+    def template_difference(template: list, other) -> list:
+        # The mnemonics of template not in other (a candidate set per word), as disjoint templates: the one for word i
+        # keeps the candidates of word i other lacks, those in both for the words before it, all of them after it
+        if any(other_candidates.isdisjoint(candidates) for candidates, other_candidates in zip(template, other)):
+            return [template]
+        pieces = []
+        for i, other_candidates in enumerate(other):
+            rest = [candidate for candidate in template[i] if candidate not in other_candidates]
+            if rest:
+                common = [candidate for candidate in template[i] if candidate in other_candidates]
+                pieces.append(template[:i] + [rest] + template[i + 1:])
+                template = template[:i] + [common] + template[i + 1:]
+        return pieces
+
+    @staticmethod
+    def word_candidates(word: str):
+        wordlist = Bip39.wordlist()
+        if word == MnemonicRecovery.UNKNOWN:
+            return list(range(2048))
+        word = word.lower()
+        if word in wordlist.indexes:
+            return [wordlist.indexes[word]]
+        candidates = set()
+        try:
+            candidates.add(wordlist.lookup(word))
+        except ValueError:
+            pass
+        # Damerau-Levenshtein distance 1: deletion, adjacent transposition, substitution, insertion
+        splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+        edits = set()
+        for left, right in splits:
+            if right:
+                edits.add(left + right[1:])
+            if len(right) > 1:
+                edits.add(left + right[1] + right[0] + right[2:])
+            for c in string.ascii_lowercase:
+                if right:
+                    edits.add(left + c + right[1:])
+                edits.add(left + c + right)
+        candidates.update(wordlist.indexes[edit] for edit in edits if edit in wordlist.indexes)
+        if not candidates:
+            raise ValueError(f'Word {word} is not in BIP39 English wordlist and has no close match')
+        return sorted(candidates)
+
+    def search_id(self) -> str:
+        # Identifies the search space and target so a checkpoint is never resumed against a different search
+        description = json.dumps([self.templates, self.target.describe(),
+                                  hashlib.sha256(self.passphrase.encode('utf-8')).hexdigest()])
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def part(self, start: int, end: int):
+        # (search, start, end) for the candidates start..end-1, with only the templates they come from
+        part = copy.copy(self)
+        part.templates = []
+        part.sizes = []
+        offset = None
+        position = 0
+        for template, size in zip(self.templates, self.sizes):
+            if position < end and position + size > start:
+                offset = position if offset is None else offset
+                part.templates.append(template)
+                part.sizes.append(size)
+            position += size
+        part.total = sum(part.sizes)
+        return part, start - offset, end - offset
+
+    def candidate(self, n: int):
+        for template, size in zip(self.templates, self.sizes):
+            if n < size:
+                break
+            n -= size
+        indexes = []
+        for candidates in reversed(template):
+            n, r = divmod(n, len(candidates))
+            indexes.append(candidates[r])
+        indexes.reverse()
+        return indexes
+
+    def search_chunk(self, start: int, end: int):
+        # Returns (tested, derived, found mnemonics)
+        words = Bip39.wordlist().words
+        derived = 0
+        found = []
+        for n in range(start, end):
+            indexes = self.candidate(n)
+            try:
+                Bip39.indexes_to_entropy(indexes)
+            except ValueError:
+                continue
+            derived += 1
+            mnemonic = ' '.join([words[index] for index in indexes])
+            seed_bytes = Bip39.mnemonic_and_passphrase_to_seed(mnemonic, self.passphrase)
+            if self.target.matches_seed(seed_bytes):
+                found.append(mnemonic)
+        return end - start, derived, found
+
+
+class PassphraseRecovery:
+    # Candidate passphrases for a known mnemonic come from words (an iterable of strings, e.g. a wordlist) and
+    # masks in hashcat syntax: ?l lowercase, ?u uppercase, ?d digit, ?s symbol, ?a any of these, ?? a literal '?'.
+    # For example 'Summer?d?d' tries Summer00 to Summer99. Each candidate is further expanded by mutations:
+    # 'case' (lower, upper, capitalized, swapped case) and 'typo' (every edit at distance 1 over letters, digits
+    # and symbols, which multiplies the work by about 200 per character).
+
+    CHARSETS = {
+        'l': string.ascii_lowercase,
+        'u': string.ascii_uppercase,
+        'd': string.digits,
+        's': ' ' + string.punctuation,
+    }
+    CHARSETS['a'] = CHARSETS['l'] + CHARSETS['u'] + CHARSETS['d'] + CHARSETS['s']
+    MUTATIONS = ('case', 'typo')
+
+    def __init__(self, mnemonic: str, target: RecoveryTarget, words=(), masks=(), mutations=()):
+        # Raises ValueError on an invalid mnemonic, as there would be nothing to recover
+        Bip39.mnemonic_to_entropy(mnemonic)
+        for mutation in mutations:
+            if mutation not in PassphraseRecovery.MUTATIONS:
+                raise ValueError(f'Unknown mutation {mutation}, '
+                                 f'must be one of {", ".join(PassphraseRecovery.MUTATIONS)}')
+        self.mnemonic = mnemonic
+        self.target = target
+        self.words = list(words)
+        self.masks = [PassphraseRecovery.parse_mask(mask) for mask in masks]
+        self.mutations = tuple(mutations)
+        self.sizes = [len(self.words)]
+        for mask in self.masks:
+            size = 1
+            for charset in mask:
+                size *= len(charset)
+            self.sizes.append(size)
+        self.total = sum(self.sizes)
+
+    @staticmethod
+    def parse_mask(mask: str):
+        # Returns one charset per character position
+        charsets = []
+        i = 0
+        while i < len(mask):
+            if mask[i] == '?':
+                if i + 1 == len(mask):
+                    raise ValueError(f'Mask {mask} ends with an incomplete placeholder')
+                placeholder = mask[i + 1]
+                if placeholder == '?':
+                    charsets.append('?')
+                elif placeholder in PassphraseRecovery.CHARSETS:
+                    charsets.append(PassphraseRecovery.CHARSETS[placeholder])
+                else:
+                    raise ValueError(f'Unknown mask placeholder ?{placeholder} in {mask}')
+                i += 2
+            else:
+                charsets.append(mask[i])
+                i += 1
+        return charsets
+
+    def search_id(self) -> str:
+        description = json.dumps([hashlib.sha256(self.mnemonic.encode('utf-8')).hexdigest(), self.target.describe(),
+                                  hashlib.sha256('\n'.join(self.words).encode('utf-8')).hexdigest(), self.masks,
+                                  self.mutations])
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def part(self, start: int, end: int):
+        # (search, start, end) for the candidates start..end-1, with only the words and masks they come from
+        part = copy.copy(self)
+        part.words = self.words[start:end]
+        part.masks = []
+        part.sizes = [len(part.words)]
+        offset = min(start, self.sizes[0])
+        position = self.sizes[0]
+        for mask, size in zip(self.masks, self.sizes[1:]):
+            if position < end and position + size > start:
+                part.masks.append(mask)
+                part.sizes.append(size)
+            elif position < start:
+                offset += size
+            position += size
+        part.total = sum(part.sizes)
+        return part, start - offset, end - offset
+
+    def candidate(self, n: int) -> str:
+        if n < self.sizes[0]:
+            return self.words[n]
+        n -= self.sizes[0]
+        for mask, size in zip(self.masks, self.sizes[1:]):
+            if n < size:
+                break
+            n -= size
+        chars = []
+        for charset in reversed(mask):
+            n, r = divmod(n, len(charset))
+            chars.append(charset[r])
+        return ''.join(reversed(chars))
+
+    def variants(self, passphrase: str):
+        variants = {passphrase}
+        if 'case' in self.mutations:
+            variants.update([passphrase.lower(), passphrase.upper(), passphrase.capitalize(), passphrase.swapcase()])
+        if 'typo' in self.mutations:
+            alphabet = PassphraseRecovery.CHARSETS['a']
+            for base in list(variants):
+                for i in range(len(base) + 1):
+                    left, right = base[:i], base[i:]
+                    if right:
+                        variants.add(left + right[1:])
+                    if len(right) > 1:
+                        variants.add(left + right[1] + right[0] + right[2:])
+                    for c in alphabet:
+                        if right:
+                            variants.add(left + c + right[1:])
+                        variants.add(left + c + right)
+        # Sorted so a resumed run tries the same candidates in the same order
+        return sorted(variants)
+
+    def search_chunk(self, start: int, end: int):
+        # Returns (tested, derived, found passphrases); every candidate needs its own PBKDF2
+        tested = 0
+        found = []
+        for n in range(start, end):
+            for passphrase in self.variants(self.candidate(n)):
+                tested += 1
+                seed_bytes = Bip39.mnemonic_and_passphrase_to_seed(self.mnemonic, passphrase)
+                if self.target.matches_seed(seed_bytes):
+                    found.append(passphrase)
+        return tested, tested, found
+
+
+class _TemplateTrie:
+    # Templates as one candidate set per word position, to find those sharing a mnemonic with another template. A
+    # node maps a single candidate, or a set of several, to the node of the next position.
+
+    __slots__ = ('singles', 'sets', 'templates')
+
+    def __init__(self):
+        self.singles = {}
+        self.sets = {}
+        self.templates = []
+
+    def add(self, template: list):
+        template = tuple(frozenset(candidates) for candidates in template)
+        node = self
+        for candidates in template:
+            children = node.singles if len(candidates) == 1 else node.sets
+            key = next(iter(candidates)) if len(candidates) == 1 else candidates
+            child = children.get(key)
+            if child is None:
+                child = children[key] = _TemplateTrie()
+            node = child
+        node.templates.append(template)
+
+    def overlapping(self, template: list) -> list:
+        # The stored templates (as tuples of candidate sets) sharing at least one mnemonic with template
+        nodes = [self]
+        for candidates in template:
+            candidate_set = frozenset(candidates)
+            next_nodes = []
+            for node in nodes:
+                if len(candidates) < len(node.singles):
+                    next_nodes += [node.singles[candidate] for candidate in candidates if candidate in node.singles]
+                else:
+                    next_nodes += [child for candidate, child in node.singles.items() if candidate in candidate_set]
+                next_nodes += [child for stored, child in node.sets.items() if not stored.isdisjoint(candidate_set)]
+            nodes = next_nodes
+        return [stored for node in nodes for stored in node.templates]
+
+
+def _search_chunk(args):
+    search, start, end = args
+    return search.search_chunk(start, end)
+
+
+class RecoveryRunner:
+    # Runs a search (MnemonicRecovery, PassphraseRecovery) exposing total, search_id(), part(start, end) and
+    # search_chunk(start, end) over a process pool. After every chunk finished in order, progress is reported and the
+    # checkpoint file is rewritten, so an interrupted run resumes at the first chunk not yet accounted for. stop() may
+    # be called from another thread (or a signal handler) to end the run after the chunks in flight.
+
+    def __init__(self, search, chunk_size: int = 4096, workers: int = None, checkpoint_path: str = None,
+                 progress=None, stop_on_found: bool = True):
+        self.search = search
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.checkpoint_path = checkpoint_path
+        self.progress = progress
+        self.stop_on_found = stop_on_found
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def load_checkpoint(self):
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return 0, 0, 0, []
+        with open(self.checkpoint_path, 'rt') as f:
+            checkpoint = json.load(f)
+        if checkpoint['search_id'] != self.search.search_id() or checkpoint['chunk_size'] != self.chunk_size:
+            raise ValueError(f'Checkpoint {self.checkpoint_path} belongs to a different search')
+        return checkpoint['next_chunk'], checkpoint['tested'], checkpoint['derived'], checkpoint['found']
+
+    def save_checkpoint(self, next_chunk: int, tested: int, derived: int, found):
+        checkpoint = {
+            'search_id': self.search.search_id(),
+            'chunk_size': self.chunk_size,
+            'next_chunk': next_chunk,
+            'tested': tested,
+            'derived': derived,
+            'found': found,
+        }
+        # Private to the owner (found holds recovered secrets); fsync so the checkpoint survives a crash of the machine
+        AtomicFile.write(self.checkpoint_path, json.dumps(checkpoint).encode('utf-8'), mode=0o600, fsync=True)
+
+    def run(self):
+        next_chunk, tested, derived, found = self.load_checkpoint()
+        total = self.search.total
+        chunks_count = (total + self.chunk_size - 1) // self.chunk_size
+        if self.stop_on_found and found:
+            return found
+
+        def tasks():
+            for chunk in range(next_chunk, chunks_count):
+                if self._stop.is_set():
+                    return
+                # Workers only receive the part of the search the chunk needs, not every template or word
+                yield self.search.part(chunk * self.chunk_size, min((chunk + 1) * self.chunk_size, total))
+
+        started = time.monotonic()
+        tested_at_start = tested
+        results = Parallel.ordered_map(_search_chunk, tasks(), workers=self.workers)
+        try:
+            for chunk_tested, chunk_derived, chunk_found in results:
+                next_chunk += 1
+                tested += chunk_tested
+                derived += chunk_derived
+                found.extend(item for item in chunk_found if item not in found)
+                if self.checkpoint_path is not None:
+                    self.save_checkpoint(next_chunk, tested, derived, found)
+                if self.progress is not None:
+                    elapsed = time.monotonic() - started
+                    rate = (tested - tested_at_start) / elapsed if elapsed > 0 else 0.0
+                    done = min(next_chunk * self.chunk_size, total)
+                    self.progress(RecoveryProgress(done, total, tested, derived, list(found), rate))
+                if self.stop_on_found and found:
+                    self.stop()
+                if self._stop.is_set():
+                    break
+        finally:
+            results.close()
+        return found
@@ -0,0 +1,397 @@
+# secp256k1 elliptic curve arithmetic
+# https://en.bitcoin.it/wiki/Secp256k1
+# https://hyperelliptic.org/EFD/g1p/auto-shortw-jacobian-0.html
+
+# Affine points are (x, y) tuples, None being the point at infinity.
+# Jacobian points are (X, Y, Z) tuples representing (X/Z^2, Y/Z^3); Z == 0 is the point at infinity.
+
+import hashlib
+import mmap
+import os
+
+from lib.atomic_file import AtomicFile
+
+try:
+    import coincurve    # optional, pip3 install --break-system-packages coincurve
+except ImportError:
+    coincurve = None
+
+
+class Secp256k1:
+
+    P = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F
+    N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+    G = (0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+         0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8)
+    INFINITY = (0, 1, 0)
+
+    # Fixed-base table: G_TABLE[i][j] = j * 2^(8*i) * G in affine coordinates, for i in 0..31 and j in 0..255
+    # (j = 0 is unused). A multiplication by the generator is then 32 mixed additions and no doublings.
+    WINDOW_BITS = 8
+    _g_table = None
+
+    # The table is persisted so short-lived processes can mmap it instead of rebuilding it. File layout:
+    # 16 magic | 1 window bits | 32 SHA256 of payload | payload of 32 * 255 points as 32-byte big-endian x | y
+    TABLE_MAGIC = b'secp256k1-gtable'
+    TABLE_FILENAME = 'secp256k1_gtable.bin'
+
+    @staticmethod
+    def jacobian_double(p):
+        X1, Y1, Z1 = p
+        if Z1 == 0 or Y1 == 0:
+            return Secp256k1.INFINITY
+        P = Secp256k1.P
+        YY = Y1 * Y1 % P
+        S = 4 * X1 * YY % P
+        M = 3 * X1 * X1 % P
+        X3 = (M * M - 2 * S) % P
+        Y3 = (M * (S - X3) - 8 * YY * YY) % P
+        Z3 = 2 * Y1 * Z1 % P
+        return X3, Y3, Z3
+
+    @staticmethod
+    def jacobian_add_affine(p, q):
+        # Mixed addition: Jacobian p + affine q
+        if q is None:
+            return p
+        X1, Y1, Z1 = p
+        x2, y2 = q
+        if Z1 == 0:
+            return x2, y2, 1
+        P = Secp256k1.P
+        Z1Z1 = Z1 * Z1 % P
+        U2 = x2 * Z1Z1 % P
+        S2 = y2 * Z1 * Z1Z1 % P
+        H = (U2 - X1) % P
+        r = (S2 - Y1) % P
+        if H == 0:
+            if r == 0:
+                return Secp256k1.jacobian_double(p)
+            return Secp256k1.INFINITY
+        HH = H * H % P
+        HHH = H * HH % P
+        V = X1 * HH % P
+        X3 = (r * r - HHH - 2 * V) % P
+        Y3 = (r * (V - X3) - Y1 * HHH) % P
+        Z3 = Z1 * H % P
+        return X3, Y3, Z3
+
+    @staticmethod
+    def jacobian_add(p, q):
+        X1, Y1, Z1 = p
+        X2, Y2, Z2 = q
+        if Z1 == 0:
+            return q
+        if Z2 == 0:
+            return p
+        P = Secp256k1.P
+        Z1Z1 = Z1 * Z1 % P
+        Z2Z2 = Z2 * Z2 % P
+        U1 = X1 * Z2Z2 % P
+        U2 = X2 * Z1Z1 % P
+        S1 = Y1 * Z2 * Z2Z2 % P
+        S2 = Y2 * Z1 * Z1Z1 % P
+        H = (U2 - U1) % P
+        r = (S2 - S1) % P
+        if H == 0:
+            if r == 0:
+                return Secp256k1.jacobian_double(p)
+            return Secp256k1.INFINITY
+        HH = H * H % P
+        HHH = H * HH % P
+        V = U1 * HH % P
+        X3 = (r * r - HHH - 2 * V) % P
+        Y3 = (r * (V - X3) - S1 * HHH) % P
+        Z3 = Z1 * Z2 * H % P
+        return X3, Y3, Z3
+
+    @staticmethod
+    def to_affine(p):
+        X, Y, Z = p
+        if Z == 0:
+            return None
+        P = Secp256k1.P
+        z_inv = pow(Z, -1, P)
+        z_inv2 = z_inv * z_inv % P
+        return X * z_inv2 % P, Y * z_inv2 * z_inv % P
+
+    @staticmethod
+    def batch_to_affine(points):
+        # Montgomery's trick: one modular inversion for the whole batch plus 3 multiplications per point
+        P = Secp256k1.P
+        prefix = []
+        acc = 1
+        for X, Y, Z in points:
+            prefix.append(acc)
+            if Z != 0:
+                acc = acc * Z % P
+        acc_inv = pow(acc, -1, P)
+        result = [None] * len(points)
+        for i in range(len(points) - 1, -1, -1):
+            X, Y, Z = points[i]
+            if Z == 0:
+                continue
+            z_inv = acc_inv * prefix[i] % P
+            acc_inv = acc_inv * Z % P
+            z_inv2 = z_inv * z_inv % P
+            result[i] = (X * z_inv2 % P, Y * z_inv2 * z_inv % P)
+        return result
+
+    @staticmethod
+    def build_generator_table():
+        windows = 256 // Secp256k1.WINDOW_BITS
+        size = 1 << Secp256k1.WINDOW_BITS
+        jacobian_points = []
+        base = Secp256k1.G
+        for _ in range(windows):
+            # base = 2^(8*i) * G; row = [1*base, 2*base, ..., 255*base]
+            point = (base[0], base[1], 1)
+            row = [point]
+            for _ in range(size - 2):
+                point = Secp256k1.jacobian_add_affine(point, base)
+                row.append(point)
+            jacobian_points.extend(row)
+            base = Secp256k1.to_affine(Secp256k1.jacobian_add_affine(point, base))
+        affine_points = Secp256k1.batch_to_affine(jacobian_points)
+        table = []
+        for i in range(windows):
+            table.append([None] + affine_points[i * (size - 1): (i + 1) * (size - 1)])
+        return table
+
+    @staticmethod
+    def table_path() -> str:
+        # SECP256K1_TABLE_PATH, else next to this module when writable, else the user cache directory
+        path = os.environ.get('SECP256K1_TABLE_PATH')
+        if path:
+            return path
+        dir = os.path.dirname(__file__)
+        path = os.path.join(dir, Secp256k1.TABLE_FILENAME)
+        if os.path.exists(path) or os.access(dir, os.W_OK):
+            return path
+        cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(cache_dir, 'crypto-bitcoin', Secp256k1.TABLE_FILENAME)
+
+    @staticmethod
+    def save_generator_table(path: str, table=None):
+        if table is None:
+            table = Secp256k1.generator_table()
+        payload = b''.join(x.to_bytes(32, 'big') + y.to_bytes(32, 'big') for row in table for x, y in row[1:])
+        header = Secp256k1.TABLE_MAGIC + bytes([Secp256k1.WINDOW_BITS]) + hashlib.sha256(payload).digest()
+        # Concurrent workers never see a partial table
+        AtomicFile.write(path, header + payload)
+
+    @staticmethod
+    def load_generator_table(path: str) -> 'MappedGeneratorTable':
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_len = len(Secp256k1.TABLE_MAGIC) + 1 + 32
+        windows = 256 // Secp256k1.WINDOW_BITS
+        size = 1 << Secp256k1.WINDOW_BITS
+        if (len(mm) != header_len + windows * (size - 1) * 64
+                or mm[:len(Secp256k1.TABLE_MAGIC)] != Secp256k1.TABLE_MAGIC
+                or mm[len(Secp256k1.TABLE_MAGIC)] != Secp256k1.WINDOW_BITS):
+            mm.close()
+            raise ValueError(f'Generator table {path} has an unexpected format')
+        if hashlib.sha256(mm[header_len:]).digest() != mm[header_len - 32:header_len]:
+            mm.close()
+            raise ValueError(f'Generator table {path} is corrupted')
+        table = MappedGeneratorTable(mm, header_len)
+        if table[0][1] != Secp256k1.G:
+            mm.close()
+            raise ValueError(f'Generator table {path} does not start with the generator')
+        return table
+
+    @staticmethod
+    def generator_table():
+        # Loaded on the first multiplication: mmap the persisted table, or build it (~100 ms) and try to persist it
+        if Secp256k1._g_table is None:
+            path = Secp256k1.table_path()
+            try:
+                Secp256k1._g_table = Secp256k1.load_generator_table(path)
+            except (OSError, ValueError):
+                table = Secp256k1.build_generator_table()
+                try:
+                    Secp256k1.save_generator_table(path, table)
+                except OSError:
+                    pass
+                Secp256k1._g_table = table
+        return Secp256k1._g_table
+
+    @staticmethod
+    def multiply_generator_jacobian(k: int):
+        # Hot path: the mixed addition of jacobian_add_affine() is inlined
+        k %= Secp256k1.N
+        if k == 0:
+            return Secp256k1.INFINITY
+        P = Secp256k1.P
+        table = Secp256k1.generator_table()
+        i = 0
+        while not k & 0xff:
+            k >>= 8
+            i += 1
+        X1, Y1 = table[i][k & 0xff]
+        Z1 = 1
+        k >>= 8
+        i += 1
+        while k:
+            digit = k & 0xff
+            k >>= 8
+            if digit:
+                x2, y2 = table[i][digit]
+                Z1Z1 = Z1 * Z1 % P
+                H = (x2 * Z1Z1 - X1) % P
+                r = (y2 * Z1 * Z1Z1 - Y1) % P
+                if H == 0:
+                    X1, Y1, Z1 = Secp256k1.jacobian_add_affine((X1, Y1, Z1), (x2, y2))
+                    if Z1 == 0:
+                        # Only reachable through an intermediate sum of 0, impossible for k < N
+                        raise ValueError('Unexpected point at infinity')
+                else:
+                    HH = H * H % P
+                    HHH = H * HH % P
+                    V = X1 * HH % P
+                    X3 = (r * r - HHH - 2 * V) % P
+                    Y1 = (r * (V - X3) - Y1 * HHH) % P
+                    X1 = X3
+                    Z1 = Z1 * H % P
+            i += 1
+        return X1, Y1, Z1
+
+    @staticmethod
+    def multiply_generator(k: int):
+        return Secp256k1.to_affine(Secp256k1.multiply_generator_jacobian(k))
+
+    @staticmethod
+    def compress(point) -> bytes:
+        x, y = point
+        return (b'\x03' if y & 1 else b'\x02') + x.to_bytes(32, 'big')
+
+    @staticmethod
+    def decompress(public_bytes: bytes):
+        if len(public_bytes) == 65 and public_bytes[0] == 0x04:
+            x = int.from_bytes(public_bytes[1:33], 'big')
+            y = int.from_bytes(public_bytes[33:], 'big')
+        elif len(public_bytes) == 33 and public_bytes[0] in (0x02, 0x03):
+            P = Secp256k1.P
+            x = int.from_bytes(public_bytes[1:], 'big')
+            if x >= P:
+                raise ValueError('Invalid public key: x coordinate out of range')
+            # P % 4 == 3, so the square root is a single exponentiation
+            y = pow((x * x * x + 7) % P, (P + 1) // 4, P)
+            if (y & 1) != (public_bytes[0] & 1):
+                y = P - y
+        else:
+            raise ValueError('Invalid public key encoding')
+        if (y * y - x * x * x - 7) % Secp256k1.P != 0:
+            raise ValueError('Invalid public key: point is not on the curve')
+        return x, y
+
+
+class MappedGeneratorTable:
+    # Read-only view of a persisted generator table. Rows are decoded from the mmap on first access and kept, so a
+    # cold process only pays for the windows its scalars actually touch.
+
+    __slots__ = ('_mm', '_offset', '_rows')
+
+    def __init__(self, mm: mmap.mmap, offset: int):
+        self._mm = mm
+        self._offset = offset
+        self._rows = [None] * (256 // Secp256k1.WINDOW_BITS)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, i: int):
+        row = self._rows[i]
+        if row is None:
+            size = (1 << Secp256k1.WINDOW_BITS) - 1
+            start = self._offset + i * size * 64
+            data = self._mm[start:start + size * 64]
+            row = [None]
+            for j in range(0, size * 64, 64):
+                row.append((int.from_bytes(data[j:j + 32], 'big'), int.from_bytes(data[j + 32:j + 64], 'big')))
+            self._rows[i] = row
+        return row
+
+
+class PythonBackend:
+    # Default backend: Jacobian arithmetic above with the precomputed generator table. Points are affine tuples.
+
+    name = 'python'
+
+    @staticmethod
+    def point_from_scalar(k: int):
+        if not (1 <= k < Secp256k1.N):
+            raise ValueError('Invalid private key: must be between 1 and N - 1')
+        return Secp256k1.multiply_generator(k)
+
+    @staticmethod
+    def point_add(p, q):
+        point = Secp256k1.to_affine(Secp256k1.jacobian_add_affine((p[0], p[1], 1), q))
+        if point is None:
+            raise ValueError('Point addition resulted in the point at infinity')
+        return point
+
+    @staticmethod
+    def compress(point) -> bytes:
+        return Secp256k1.compress(point)
+
+    @staticmethod
+    def uncompress(point) -> bytes:
+        x, y = point
+        return b'\x04' + x.to_bytes(32, 'big') + y.to_bytes(32, 'big')
+
+    @staticmethod
+    def decompress(public_bytes: bytes):
+        return Secp256k1.decompress(public_bytes)
+
+
+class CoincurveBackend:
+    # libsecp256k1 through coincurve, used automatically when it is installed. Points are coincurve.PublicKey.
+
+    name = 'coincurve'
+
+    @staticmethod
+    def point_from_scalar(k: int):
+        if not (1 <= k < Secp256k1.N):
+            raise ValueError('Invalid private key: must be between 1 and N - 1')
+        return coincurve.PublicKey.from_secret(k.to_bytes(32, 'big'))
+
+    @staticmethod
+    def point_add(p, q):
+        return coincurve.PublicKey.combine_keys([p, q])
+
+    @staticmethod
+    def compress(point) -> bytes:
+        return point.format(compressed=True)
+
+    @staticmethod
+    def uncompress(point) -> bytes:
+        return point.format(compressed=False)
+
+    @staticmethod
+    def decompress(public_bytes: bytes):
+        try:
+            return coincurve.PublicKey(public_bytes)
+        except Exception as e:
+            raise ValueError(f'Invalid public key: {e}') from e
+
+
+BACKENDS = {
+    PythonBackend.name: PythonBackend,
+    CoincurveBackend.name: CoincurveBackend,
+}
+
+
+def set_backend(name: str):
+    global backend
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown secp256k1 backend {name}, must be one of {", ".join(BACKENDS)}')
+    if name == CoincurveBackend.name and coincurve is None:
+        raise ValueError('coincurve backend requested but coincurve is not installed')
+    backend = BACKENDS[name]
+
+
+# SECP256K1_BACKEND=python forces the pure-Python backend even when coincurve is installed
+backend = PythonBackend
+set_backend(os.environ.get('SECP256K1_BACKEND', CoincurveBackend.name if coincurve is not None else PythonBackend.name))
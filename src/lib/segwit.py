@@ -0,0 +1,108 @@
+# Segwit address codec: bech32 for witness v0 (BIP 173) and bech32m for witness v1+ (BIP 350)
+# https://github.com/bitcoin/bips/blob/master/bip-0173.mediawiki
+# https://github.com/bitcoin/bips/blob/master/bip-0350.mediawiki
+
+_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+_DECODE = {c: value for value, c in enumerate(_CHARSET)}
+_GENERATOR = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+# XOR of the generators selected by each 5-bit value shifted out of the checksum, so a polymod step is one lookup
+_POLYMOD_TABLE = tuple(
+    _GENERATOR[0] * (b & 1) ^ _GENERATOR[1] * (b >> 1 & 1) ^ _GENERATOR[2] * (b >> 2 & 1) ^
+    _GENERATOR[3] * (b >> 3 & 1) ^ _GENERATOR[4] * (b >> 4 & 1)
+    for b in range(32)
+)
+
+
+class SegwitAddress:
+
+    MAINNET = 'bc'
+    TESTNET = 'tb'
+    REGTEST = 'bcrt'
+
+    BECH32_CONST = 1
+    BECH32M_CONST = 0x2bc830a3
+
+    # Checksum state after the human-readable part, computed once per HRP
+    _hrp_states = {}
+
+    @staticmethod
+    def polymod(values, chk: int = 1) -> int:
+        table = _POLYMOD_TABLE
+        for value in values:
+            chk = (chk & 0x1ffffff) << 5 ^ value ^ table[chk >> 25]
+        return chk
+
+    @staticmethod
+    def hrp_state(hrp: str) -> int:
+        state = SegwitAddress._hrp_states.get(hrp)
+        if state is None:
+            expanded = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+            state = SegwitAddress._hrp_states[hrp] = SegwitAddress.polymod(expanded)
+        return state
+
+    @staticmethod
+    def check_program(witness_version: int, witness_program: bytes):
+        if not (0 <= witness_version <= 16):
+            raise ValueError(f'Invalid witness version {witness_version}')
+        if not (2 <= len(witness_program) <= 40):
+            raise ValueError(f'Invalid witness program length {len(witness_program)}')
+        if witness_version == 0 and len(witness_program) not in (20, 32):
+            raise ValueError(f'Invalid witness v0 program length {len(witness_program)}')
+
+    @staticmethod
+    def encode(hrp: str, witness_version: int, witness_program: bytes) -> str:
+        SegwitAddress.check_program(witness_version, witness_program)
+        # 8-bit to 5-bit regrouping through one integer, zero padded on the right
+        bits = 8 * len(witness_program)
+        groups = (bits + 4) // 5
+        n = int.from_bytes(witness_program, 'big') << (5 * groups - bits)
+        data = [witness_version]
+        data += [n >> shift & 31 for shift in range(5 * groups - 5, -5, -5)]
+        const = SegwitAddress.BECH32_CONST if witness_version == 0 else SegwitAddress.BECH32M_CONST
+        chk = SegwitAddress.polymod((0, 0, 0, 0, 0, 0), SegwitAddress.polymod(data, SegwitAddress.hrp_state(hrp)))
+        chk ^= const
+        data += [chk >> shift & 31 for shift in (25, 20, 15, 10, 5, 0)]
+        charset = _CHARSET
+        return hrp + '1' + ''.join([charset[value] for value in data])
+
+    @staticmethod
+    def decode(hrp: str, address: str):
+        # Returns (witness_version, witness_program) or raises ValueError
+        if len(address) > 90 or (address.lower() != address and address.upper() != address):
+            raise ValueError(f'Invalid segwit address {address}')
+        address = address.lower()
+        separator = address.rfind('1')
+        if address[:separator] != hrp:
+            raise ValueError(f'Invalid segwit address {address}, expected prefix {hrp}1')
+        try:
+            data = [_DECODE[c] for c in address[separator + 1:]]
+        except KeyError:
+            raise ValueError(f'Invalid segwit address {address}')
+        if len(data) < 7:
+            raise ValueError(f'Invalid segwit address {address}')
+        witness_version = data[0]
+        const = SegwitAddress.BECH32_CONST if witness_version == 0 else SegwitAddress.BECH32M_CONST
+        if SegwitAddress.polymod(data, SegwitAddress.hrp_state(hrp)) != const:
+            raise ValueError(f'Invalid segwit address checksum {address}')
+        n = 0
+        for value in data[1:-6]:
+            n = n << 5 | value
+        bits = 5 * (len(data) - 7)
+        padding = bits % 8
+        if padding > 4 or n & ((1 << padding) - 1):
+            raise ValueError(f'Invalid segwit address padding {address}')
+        witness_program = (n >> padding).to_bytes(bits // 8, 'big')
+        SegwitAddress.check_program(witness_version, witness_program)
+        return witness_version, witness_program
+
+    @staticmethod
+    def encode_batch(hrp: str, witness_version: int, witness_programs) -> list:
+        return [SegwitAddress.encode(hrp, witness_version, program) for program in witness_programs]
+
+    @staticmethod
+    def decode_batch(hrp: str, addresses) -> list:
+        return [SegwitAddress.decode(hrp, address) for address in addresses]
+
+
+for _hrp in (SegwitAddress.MAINNET, SegwitAddress.TESTNET, SegwitAddress.REGTEST):
+    SegwitAddress.hrp_state(_hrp)
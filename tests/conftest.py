@@ -0,0 +1,12 @@
+import pytest
+
+from lib import secp256k1
+
+
+@pytest.fixture(params=list(secp256k1.BACKENDS))
+def secp256k1_backend(request, monkeypatch):
+    # Runs a test once per secp256k1 backend, so known vectors are checked to come out identical on each
+    if request.param == 'coincurve' and secp256k1.coincurve is None:
+        pytest.skip('coincurve is not installed')
+    monkeypatch.setattr(secp256k1, 'backend', secp256k1.BACKENDS[request.param])
+    return secp256k1.backend
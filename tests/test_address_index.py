@@ -0,0 +1,102 @@
+import pytest
+
+from lib.address_index import AddressIndex
+from lib.address_range import AddressRange
+from lib.bip32 import ExtendedKey
+
+
+XPUB = 'xpub6BgBgsespWvERF3LHQu6CnqdvfEvtMcQjYrcRzx53QJjSxarj2afYWcLteoGVky7D3UKDP9QyrLprQ3VCECoY49yfdDEHGCtMMj92pReUsQ'
+
+
+class TestAddressIndex:
+
+    @pytest.mark.parametrize('bloom_bits_per_key', [0, 10])
+    def test_build_and_lookup(self, tmp_path, bloom_bits_per_key):
+        other = ExtendedKey.from_seed(bytes(32)).derive("m/84'/0'/0'").neuter().serialize_xpub()
+        path = str(tmp_path / 'index.bin')
+        kinds = ('p2pkh', 'p2sh-p2wpkh', 'p2wpkh', 'p2tr')
+        index = AddressIndex.build(path, {'alice': XPUB, 'bob': other}, {0: 20, 1: 5}, kinds=kinds,
+                                   bloom_bits_per_key=bloom_bits_per_key)
+        assert len(index) == 2 * 25 * len(kinds)
+
+        for wallet_id, xpub in [('alice', XPUB), ('bob', other)]:
+            for chain, i in [(0, 0), (0, 19), (1, 4)]:
+                _, _, _, addresses = next(AddressRange.derive_address_range(xpub, chain, i, 1, kinds=kinds))
+                for kind, address in zip(kinds, addresses):
+                    assert index.lookup(address) == (wallet_id, chain, i, kind)
+
+        # Not indexed (beyond the range) and malformed addresses
+        _, _, _, addresses = next(AddressRange.derive_address_range(XPUB, 0, 20, 1))
+        assert index.lookup(addresses[0]) is None
+        assert index.lookup('bc1qnotanaddress') is None
+        index.close()
+
+    def test_extend(self, tmp_path):
+        path = str(tmp_path / 'index.bin')
+        index = AddressIndex.build(path, {'alice': XPUB}, {0: 10})
+        _, _, _, (address,) = next(AddressRange.derive_address_range(XPUB, 0, 15, 1))
+        assert index.lookup(address) is None
+
+        other = ExtendedKey.from_seed(bytes(32)).derive("m/84'/0'/0'").neuter().serialize_xpub()
+        index = index.extend({('alice', 0): 20, ('bob', 1): 3}, wallets={'bob': other})
+        assert index.counts == {('alice', 0): 20, ('bob', 1): 3}
+        assert len(index) == 23
+        assert index.lookup(address) == ('alice', 0, 15, 'p2wpkh')
+        _, _, _, (address,) = next(AddressRange.derive_address_range(other, 1, 2, 1))
+        assert index.lookup(address) == ('bob', 1, 2, 'p2wpkh')
+
+        # Reopened from the file
+        index.close()
+        index = AddressIndex(path)
+        assert index.lookup(address) == ('bob', 1, 2, 'p2wpkh')
+        with pytest.raises(ValueError):
+            index.extend({('carol', 0): 5})
+        index.close()
+
+    def test_extend_empty(self, tmp_path):
+        # The Bloom filter setting survives an index without records
+        path = str(tmp_path / 'index.bin')
+        index = AddressIndex.build(path, {'alice': XPUB}, {0: 0}, bloom_bits_per_key=12)
+        assert len(index) == 0 and index._bloom is None
+        index = index.extend({('alice', 0): 5})
+        assert index.bloom_bits_per_key == 12
+        assert index._bloom is not None
+        _, _, _, (address,) = next(AddressRange.derive_address_range(XPUB, 0, 4, 1))
+        assert index.lookup(address) == ('alice', 0, 4, 'p2wpkh')
+        index.close()
+
+    def test_public_keys_and_kind_numbers(self, tmp_path):
+        path = str(tmp_path / 'index.bin')
+        account = ExtendedKey.from_seed(bytes(32)).derive("m/84'/0'/0'")
+        kinds = ('p2tr', 'p2pkh-compressed')
+        index = AddressIndex.build(path, {'alice': account.serialize_xprv(), 'bob': account}, {0: 3}, kinds=kinds)
+        # Private keys never reach the file
+        xpub = account.neuter().serialize_xpub()
+        assert index.wallets == {'alice': xpub, 'bob': xpub}
+        with open(path, 'rb') as f:
+            assert b'prv' not in f.read()
+        # Kind numbers index the kinds of the file, not AddressRange.KINDS
+        assert sorted({record[4] for record in index.records()}) == [0, 1]
+        _, _, _, addresses = next(AddressRange.derive_address_range(xpub, 0, 2, 1, kinds=kinds))
+        assert [index.lookup(address)[1:] for address in addresses] == [(0, 2, 'p2tr'), (0, 2, 'p2pkh-compressed')]
+        index = index.extend({}, wallets={'alice': account})
+        with pytest.raises(ValueError):
+            index.extend({}, wallets={'alice': XPUB})
+        index.close()
+
+    def test_kinds_sharing_a_hash(self, tmp_path):
+        # p2pkh-compressed and p2wpkh addresses of a key share its hash160
+        path = str(tmp_path / 'index.bin')
+        kinds = ('p2pkh-compressed', 'p2wpkh')
+        index = AddressIndex.build(path, {'alice': XPUB}, {0: 3}, kinds=kinds)
+        _, _, _, (legacy, segwit) = next(AddressRange.derive_address_range(XPUB, 0, 1, 1, kinds=kinds))
+        assert index.lookup(legacy) == ('alice', 0, 1, 'p2pkh-compressed')
+        assert index.lookup(segwit) == ('alice', 0, 1, 'p2wpkh')
+        index.close()
+
+        # Only p2wpkh indexed: the legacy address of the same key is not owned
+        index = AddressIndex.build(path, {'alice': XPUB}, {0: 3})
+        assert index.lookup(segwit) == ('alice', 0, 1, 'p2wpkh')
+        assert index.lookup(legacy) is None
+        assert index.lookup_hash(AddressIndex.lookup_key(legacy)[1]) == ('alice', 0, 1, 'p2wpkh')
+        index.close()
@@ -0,0 +1,72 @@
+import pytest
+
+from lib.address_range import AddressRange
+from lib.bip32 import Bip32, ExtendedKey
+from lib.bip39 import Bip39
+from lib.btc_address import BtcAddress
+
+
+class TestAddressRange:
+
+    def test_derive_address_range_from_xprv(self):
+        # https://youtu.be/3ZKc6rY4hJc?si=QxKw4vQlHtEwkxfd&t=309 using Sparrow wallet
+        mnemonic = 'diagram limit wink whip primary year ill multiply affair cycle slow captain indicate crouch brick auction happy envelope major mechanic illness lounge verify guide'
+        seed_bytes = Bip39.mnemonic_and_passphrase_to_seed(mnemonic, 'test')
+        xprv = ExtendedKey.from_seed(seed_bytes).derive("m/84'/0'/0'").serialize_xprv()
+
+        addresses = [addresses[0] for _, _, _, addresses in AddressRange.derive_address_range(xprv, 0, 0, 4)]
+        assert addresses == [
+            'bc1qvqznc77qtyvksh59hl36d4mu4ayflycntvgjj9',
+            'bc1q6gq8tcnglc0za25rd5e0w52vxjsycpr2gf5xm8',
+            'bc1qqxn454afkctsmxxl64umx8vfrjma6vw9cz09ss',
+            'bc1q7mlgmlq0qt3s09kurt8ae43nl0gdawuxyt2chl',
+        ]
+
+        results = list(AddressRange.derive_address_range(xprv, 1, 13, 1))
+        assert results[0][0] == 13
+        assert results[0][3] == ('bc1qtd4hndqrp9rhg4rnc98chen3pwfwu0q9df8j32',)
+
+    def test_derive_address_range_from_xpub(self):
+        mnemonic = 'abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about'
+        seed_bytes = Bip39.mnemonic_and_passphrase_to_seed(mnemonic, 'TREZOR')
+        account = ExtendedKey.from_seed(seed_bytes).derive("m/44'/0'/0'")
+        xpub = account.serialize_xpub()
+
+        kinds = ('p2pkh', 'p2sh-p2wpkh', 'p2wpkh')
+        from_xpub = list(AddressRange.derive_address_range(xpub, 0, 0, 5, kinds=kinds, batch_size=2))
+        from_xprv = list(AddressRange.derive_address_range(account, 0, 0, 5, kinds=kinds))
+        assert from_xpub == from_xprv
+        assert [addresses[0] for _, _, _, addresses in from_xpub[:4]] == [
+            '18unGcBDaY7Ciy9UbUCkAE8hV1wbDoMnm7',
+            '1AvFP97jqURXDMt7Jp2HUMpxrAg5HCF3Bs',
+            '17iRiiA8haXYSpyPajoCwdsSz3DqDw6aX6',
+            '12o9FAS1JEbHYmcbxd811HqKTeSKTHX51E',
+        ]
+
+        # Same keys as the per-index path
+        for index, public_bytes, hashed_pubkey, addresses in from_xpub:
+            node = account.derive([0, index])
+            assert public_bytes == node.public_bytes
+            assert hashed_pubkey == node.identifier
+            private_key_bytes = Bip32.int_to_bytes(node.private_int, 32)
+            assert addresses == BtcAddress.derive_public_addresses(private_key_bytes)
+
+    def test_derive_address_range_invalid(self):
+        xpub = 'xpub661MyMwAqRbcFW31YEwpkMuc5THy2PSt5bDMsktWQcFF8syAmRUapSCGu8ED9W6oDMSgv6Zz8idoc4a6mr8BDzTJY47LJhkJ8UB7WEGuduB'
+        with pytest.raises(ValueError):
+            list(AddressRange.derive_address_range(xpub, 0, 0, 1, kinds=('p2wsh',)))
+        with pytest.raises(ValueError):
+            list(AddressRange.derive_address_range(xpub, 0, 0x7fffffff, 2))
+        assert list(AddressRange.derive_address_range(xpub, 0, 0, 0)) == []
+
+    @pytest.mark.usefixtures('secp256k1_backend')
+    def test_derive_address_range_p2tr(self):
+        # Ref: https://github.com/bitcoin/bips/blob/master/bip-0086.mediawiki
+        xpub = 'xpub6BgBgsespWvERF3LHQu6CnqdvfEvtMcQjYrcRzx53QJjSxarj2afYWcLteoGVky7D3UKDP9QyrLprQ3VCECoY49yfdDEHGCtMMj92pReUsQ'
+        addresses = [addresses[0] for _, _, _, addresses in AddressRange.derive_address_range(xpub, 0, 0, 2, kinds=('p2tr',))]
+        assert addresses == [
+            'bc1p5cyxnuxmeuwuvkwfem96lqzszd02n6xdcjrs20cac6yqjjwudpxqkedrcr',
+            'bc1p4qhjn9zdvkux4e44uhx8tc55attvtyu358kutcqkudyccelu0was9fqzwh',
+        ]
+        results = list(AddressRange.derive_address_range(xpub, 1, 0, 1, kinds=('p2wpkh', 'p2tr')))
+        assert results[0][3][1] == 'bc1p3qkhfews2uk44qtvauqyr2ttdsw7svhkl9nkm9s9c3x4ax5h60wqwruhk7'
@@ -0,0 +1,75 @@
+import asyncio
+import concurrent.futures
+
+import pytest
+
+from lib.address_range import AddressRange
+from lib.async_derivation import AsyncDerivation
+from lib.bip32 import Bip32, ExtendedKey
+from lib.bip39 import Bip39
+
+
+class TestAsyncDerivation:
+
+    MNEMONIC = 'abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about'
+
+    @staticmethod
+    def account_xpub() -> str:
+        master = ExtendedKey.from_seed(Bip39.mnemonic_and_passphrase_to_seed(TestAsyncDerivation.MNEMONIC, ''))
+        return master.derive("m/84'/0'/0'").neuter().serialize_xpub()
+
+    def test_index_runs(self):
+        assert AsyncDerivation.index_runs([], 8) == []
+        assert AsyncDerivation.index_runs([5, 3, 4, 20, 30], 0) == [(3, 3), (20, 1), (30, 1)]
+        assert AsyncDerivation.index_runs([5, 3, 4, 20, 30], 10) == [(3, 3), (20, 11)]
+
+    def test_seed_and_path(self):
+        async def main():
+            async with AsyncDerivation(workers=2) as derivation:
+                seeds = await asyncio.gather(*[derivation.seed(TestAsyncDerivation.MNEMONIC, 'TREZOR')
+                                               for _ in range(5)])
+                nodes = await asyncio.gather(*[derivation.derive_from_path(seeds[0], "m/84'/0'/0'")
+                                               for _ in range(3)])
+                return derivation, seeds, nodes
+
+        derivation, seeds, nodes = asyncio.run(main())
+        assert seeds == [Bip39.mnemonic_and_passphrase_to_seed(TestAsyncDerivation.MNEMONIC, 'TREZOR')] * 5
+        assert nodes == [Bip32.derive_from_path(seeds[0], "m/84'/0'/0'")] * 3
+        assert (derivation.computations, derivation.coalesced) == (2, 6)
+
+    def test_address_batching(self):
+        xpub = TestAsyncDerivation.account_xpub()
+        expected = [addresses[0] for _, _, _, addresses in AddressRange.derive_address_range(xpub, 0, 0, 40)]
+
+        async def main():
+            async with AsyncDerivation(max_gap=0) as derivation:
+                # A burst for the same next unused address, plus neighbours and a far index
+                indexes = [5] * 10 + [6, 7, 3, 4] + [30]
+                results = await asyncio.gather(*[derivation.address(xpub, 0, index) for index in indexes])
+                # Resolved requests are not kept
+                again = await derivation.address(xpub, 0, 5)
+                return derivation, indexes, results, again
+
+        derivation, indexes, results, again = asyncio.run(main())
+        assert results == [expected[index] for index in indexes]
+        assert again == expected[5]
+        # 3..7 and 30, then the repeated request
+        assert (derivation.computations, derivation.coalesced) == (3, 9)
+        assert derivation._in_flight == {}
+
+    def test_address_errors(self):
+        xpub = TestAsyncDerivation.account_xpub()
+
+        async def main():
+            with concurrent.futures.ThreadPoolExecutor(1) as executor:
+                derivation = AsyncDerivation(executor, batch_delay=0.01)
+                with pytest.raises(ValueError):
+                    await derivation.address(xpub, 0, 0, 'p2wsh')
+                results = await asyncio.gather(derivation.address('xpub-invalid', 0, 1),
+                                               derivation.address(xpub, 1, 0, 'p2tr'), return_exceptions=True)
+                await derivation.close()
+                return results
+
+        error, address = asyncio.run(main())
+        assert isinstance(error, ValueError)
+        assert address == next(AddressRange.derive_address_range(xpub, 1, 0, 1, ('p2tr',)))[3][0]
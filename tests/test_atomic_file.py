@@ -0,0 +1,35 @@
+import os
+import stat
+
+import pytest
+
+from lib.atomic_file import AtomicFile
+
+
+class TestAtomicFile:
+
+    def test_write(self, tmp_path):
+        path = str(tmp_path / 'sub' / 'file.bin')
+        AtomicFile.write(path, b'one')
+        with open(path, 'rb') as f:
+            assert f.read() == b'one'
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+        AtomicFile.write(path, [b'tw', memoryview(b'o')], mode=0o600, fsync=True)
+        with open(path, 'rb') as f:
+            assert f.read() == b'two'
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    def test_failed_write(self, tmp_path):
+        # The target is untouched and no temporary file is left behind
+        path = str(tmp_path / 'file.bin')
+        AtomicFile.write(path, b'one')
+
+        def chunks():
+            yield b'partial'
+            raise RuntimeError('interrupted')
+        with pytest.raises(RuntimeError):
+            AtomicFile.write(path, chunks())
+        with open(path, 'rb') as f:
+            assert f.read() == b'one'
+        assert os.listdir(tmp_path) == ['file.bin']
@@ -0,0 +1,44 @@
+import pytest
+
+from lib.base58check import Base58Check
+
+
+class TestBase58Check:
+
+    def test_encode_decode(self):
+        # Ref: https://github.com/bitcoin/bitcoin/blob/master/src/test/data/base58_encode_decode.json
+        vectors = [
+            ('', ''),
+            ('61', '2g'),
+            ('626262', 'a3gV'),
+            ('636363', 'aPEr'),
+            ('73696d706c792061206c6f6e6720737472696e67', '2cFupjhnEsSn59qHXstmK2ffpLv2'),
+            ('00eb15231dfceb60925886b67d065299925915aeb172c06647', '1NS17iag9jJgTHD1VXjvLCEnZuQ3rJDE9L'),
+            ('516b6fcd0f', 'ABnLTmg'),
+            ('bf4f89001e670274dd', '3SEo3LWLoPntC'),
+            ('572e4794', '3EFU7m'),
+            ('ecac89cad93923c02321', 'EJDM8drfXA6uyA'),
+            ('10c8511e', 'Rt5zm'),
+            ('00000000000000000000', '1111111111'),
+        ]
+        for data_hex, encoded in vectors:
+            assert Base58Check.encode(bytes.fromhex(data_hex)) == encoded
+            assert Base58Check.decode(encoded) == bytes.fromhex(data_hex)
+        with pytest.raises(ValueError):
+            Base58Check.decode('0OIl')
+
+    def test_encode_decode_check(self):
+        address = '1Bu6YxH64nfvhdDsYNEP8PftoBMqgusdPS'
+        payload = Base58Check.decode_check(address, Base58Check.ADDRESS_LENGTH)
+        assert payload[0] == 0x00 and len(payload) == 21
+        assert Base58Check.encode_check(payload) == address
+        with pytest.raises(ValueError):
+            Base58Check.decode_check('1Bu6YxH64nfvhdDsYNEP8PftoBMqgusdPT')
+        with pytest.raises(ValueError):
+            Base58Check.decode_check(address, Base58Check.WIF_LENGTH)
+
+    def test_batch(self):
+        payloads = [bytes([0, i]) + bytes(19) for i in range(20)]
+        encoded = Base58Check.encode_batch(payloads)
+        assert encoded == [Base58Check.encode_check(payload) for payload in payloads]
+        assert Base58Check.decode_batch(encoded, Base58Check.ADDRESS_LENGTH) == payloads
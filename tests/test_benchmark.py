@@ -0,0 +1,68 @@
+import io
+import json
+import os
+
+import pytest
+
+from lib import secp256k1
+from lib.benchmark import Benchmark
+
+
+class TestBenchmark:
+
+    def test_compare(self):
+        baseline = {'a': {'ops_per_sec': 1000.0, 'peak_bytes_per_op': 1000.0}}
+        assert Benchmark.compare({'a': {'ops_per_sec': 800.0, 'peak_bytes_per_op': 1200.0}}, baseline, 0.25) == []
+        assert len(Benchmark.compare({'a': {'ops_per_sec': 700.0, 'peak_bytes_per_op': 1000.0}}, baseline, 0.25)) == 1
+        assert len(Benchmark.compare({'a': {'ops_per_sec': 700.0, 'peak_bytes_per_op': 2000.0}}, baseline, 0.25)) == 2
+        # Not in the baseline
+        assert Benchmark.compare({'b': {'ops_per_sec': 1.0, 'peak_bytes_per_op': 1e9}}, baseline) == []
+
+    def test_main(self, tmp_path):
+        path = str(tmp_path / 'baseline.json')
+        argv = ['bip32.serialize_xpub', '--baseline', path, '--min-time', '0.01', '--rounds', '1']
+        assert Benchmark.main(argv + ['--save'], stdout=io.StringIO()) == 0
+        baseline = Benchmark.load_baseline(path)
+        assert list(baseline) == ['bip32.serialize_xpub']
+        assert baseline['bip32.serialize_xpub']['ops_per_sec'] > 0
+        # Set the baseline out of reach
+        baseline['bip32.serialize_xpub']['ops_per_sec'] *= 1000
+        Benchmark.save_baseline(path, baseline)
+        stdout = io.StringIO()
+        assert Benchmark.main(argv, stdout=stdout) == 1
+        assert 'REGRESSION bip32.serialize_xpub' in stdout.getvalue()
+        with pytest.raises(SystemExit):
+            Benchmark.main(['no.such.benchmark', '--baseline', path], stdout=io.StringIO())
+
+    def test_baseline_per_backend(self, tmp_path):
+        path = str(tmp_path / 'baseline.json')
+        results = {'a': {'ops_per_sec': 1000.0, 'peak_bytes_per_op': 1000.0}}
+        Benchmark.save_baseline(path, results, backend='python')
+        Benchmark.save_baseline(path, {}, backend='coincurve')
+        assert Benchmark.load_baseline(path, backend='python') == results
+        assert Benchmark.load_baseline(path, backend='coincurve') == {}
+        with open(path, 'r', encoding='utf-8') as f:
+            assert set(json.load(f)['backends']) == {'python', 'coincurve'}
+
+        # Results of another backend are never compared
+        other = 'python' if secp256k1.backend.name == 'coincurve' else 'coincurve'
+        Benchmark.save_baseline(path, {'bip32.serialize_xpub': {'ops_per_sec': 1e12, 'peak_bytes_per_op': 0.0}},
+                                backend=other)
+        Benchmark.save_baseline(path, {}, backend=secp256k1.backend.name)
+        stdout = io.StringIO()
+        argv = ['bip32.serialize_xpub', '--baseline', path, '--min-time', '0.01', '--rounds', '1']
+        assert Benchmark.main(argv, stdout=stdout) == 0
+        assert f'No baseline for the {secp256k1.backend.name} secp256k1 backend' in stdout.getvalue()
+
+
+@pytest.mark.benchmark
+class TestBenchmarkBaseline:
+    # pytest -m benchmark; BENCHMARK_THRESHOLD overrides the allowed slowdown
+
+    @pytest.mark.parametrize('name', list(Benchmark.cases()))
+    def test_benchmark(self, name):
+        results = Benchmark.run([name])
+        if not os.path.exists(Benchmark.DEFAULT_BASELINE):
+            pytest.skip(f'No baseline at {Benchmark.DEFAULT_BASELINE}, save one with python -m lib.benchmark --save')
+        threshold = float(os.environ.get('BENCHMARK_THRESHOLD', Benchmark.DEFAULT_THRESHOLD))
+        assert Benchmark.compare(results, Benchmark.load_baseline(Benchmark.DEFAULT_BASELINE), threshold) == []
@@ -1,6 +1,11 @@
-from lib.bip32 import Bip32
+import itertools
 
+import pytest
 
+from lib.bip32 import Bip32, DerivationCache, ExtendedKey
+
+
+@pytest.mark.usefixtures('secp256k1_backend')
 class TestBip32:
     # https://github.com/bitcoin/bips/blob/master/bip-0032.mediawiki#test-vectors
 
@@ -134,3 +139,157 @@ class TestBip32:
         xpub = Bip32.serialize_xpub(last_depth, parent_fingerprint, last_index, chain_code, private_int)
         assert xprv == 'xprv9xJocDuwtYCMNAo3Zw76WENQeAS6WGXQ55RCy7tDJ8oALr4FWkuVoHJeHVAcAqiZLE7Je3vZJHxspZdFHfnBEjHqU5hG1Jaj32dVoS6XLT1'
         assert xpub == 'xpub6BJA1jSqiukeaesWfxe6sNK9CCGaujFFSJLomWHprUL9DePQ4JDkM5d88n49sMGJxrhpjazuXYWdMf17C9T5XnxkopaeS7jGk1GyyVziaMt'
+
+    def test_extended_key(self):
+        seed_bytes = b'\x00\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0a\x0b\x0c\x0d\x0e\x0f'
+
+        master = ExtendedKey.from_seed(seed_bytes)
+        node = master.child(0x80000000).child(1)
+        assert node.serialize_xprv() == 'xprv9wTYmMFdV23N2TdNG573QoEsfRrWKQgWeibmLntzniatZvR9BmLnvSxqu53Kw1UmYPxLgboyZQaXwTCg8MSY3H2EU4pWcQDnRnrVA1xe8fs'
+        assert node.serialize_xpub() == 'xpub6ASuArnXKPbfEwhqN6e3mwBcDTgzisQN1wXN9BJcM47sSikHjJf3UFHKkNAWbWMiGj7Wf5uMash7SyYq527Hqck2AxYysAA7xmALppuCkwQ'
+
+        node = master.derive("m/0'/1/2'/2/1000000000")
+        assert node.depth == 5
+        assert node.index == 1000000000
+        assert node.to_tuple() == Bip32.derive_from_path(seed_bytes, "m/0'/1/2'/2/1000000000")
+        assert node.serialize_xpub() == 'xpub6H1LXWLaKsWFhvm6RVpEL9P4KfRZSW7abD2ttkWP3SSQvnyA8FSVqNTEcYFgJS2UaFcxupHiYkro49S8yGasTvXEYBVPamhGW6cFJodrTHy'
+
+        # Fingerprint of the master key from BIP32 test vector 1
+        assert master.fingerprint.hex() == '3442193e'
+        assert master.child(0x80000000).parent_fingerprint == master.fingerprint
+
+    def test_extended_key_neuter(self):
+        seed_bytes = b'\x00\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0a\x0b\x0c\x0d\x0e\x0f'
+        node = ExtendedKey.from_seed(seed_bytes).derive("m/0'")
+        public_node = node.neuter()
+        assert not public_node.is_private
+        assert public_node.serialize_xpub() == node.serialize_xpub()
+        with pytest.raises(ValueError):
+            public_node.serialize_xprv()
+
+    def test_derivation_cache(self):
+        seed_bytes = b'\x00\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0a\x0b\x0c\x0d\x0e\x0f'
+        cache = DerivationCache(max_size=8)
+
+        for i in range(5):
+            path = f"m/84'/0'/0'/0/{i}"
+            assert Bip32.derive_from_path(seed_bytes, path, cache) == Bip32.derive_from_path(seed_bytes, path)
+        assert cache.misses == 1
+        assert cache.hits == 4
+        # m, m/84', m/84'/0', m/84'/0'/0', m/84'/0'/0'/0
+        assert len(cache) == 5
+
+        path = "m/0'/1/2'/2/1000000000"
+        last_depth, parent_fingerprint, last_index, chain_code, private_int = Bip32.derive_from_path(seed_bytes, path, cache)
+        xpub = Bip32.serialize_xpub(last_depth, parent_fingerprint, last_index, chain_code, private_int)
+        assert xpub == 'xpub6H1LXWLaKsWFhvm6RVpEL9P4KfRZSW7abD2ttkWP3SSQvnyA8FSVqNTEcYFgJS2UaFcxupHiYkro49S8yGasTvXEYBVPamhGW6cFJodrTHy'
+        assert cache.hits == 5
+        assert len(cache) == 8
+
+        cache.evict(seed_bytes)
+        assert len(cache) == 0
+        cache.clear()
+        assert cache.hits == 0 and cache.misses == 0
+
+        # The master key itself: derived once, then served from the cache
+        for _ in range(3):
+            assert cache.derive(seed_bytes, 'm').serialize_xprv() == ExtendedKey.from_seed(seed_bytes).serialize_xprv()
+        assert cache.misses == 1 and cache.hits == 2
+        assert len(cache) == 1
+
+    def test_derive_public_child(self):
+        # Public derivation must give the same key as private derivation followed by neutering
+        xpub = 'xpub6FHa3pjLCk84BayeJxFW2SP4XRrFd1JYnxeLeU8EqN3vDfZmbqBqaGJAyiLjTAwm6ZLRQUMv1ZACTj37sR62cfN7fe5JnJ7dh8zL4fiyLHV'
+        last_depth, parent_fingerprint, last_index, chain_code, public_bytes = Bip32.deserialize_xpub(xpub)
+        assert last_depth == 4
+        assert last_index == 2
+        child_public_bytes, child_chain_code = Bip32.derive_public_child(public_bytes, chain_code, 1000000000)
+        assert child_public_bytes.hex() == '022a471424da5e657499d1ff51cb43c47481a03b1e77f951fe64cec9f5a48f7011'
+        assert child_chain_code.hex() == 'c783e67b921d2beb8f6b389cc646d7263b4145701dadd2161548a8b078e65e9e'
+
+        node = ExtendedKey.from_xpub(xpub).child(1000000000)
+        assert node.serialize_xpub() == 'xpub6H1LXWLaKsWFhvm6RVpEL9P4KfRZSW7abD2ttkWP3SSQvnyA8FSVqNTEcYFgJS2UaFcxupHiYkro49S8yGasTvXEYBVPamhGW6cFJodrTHy'
+
+        node = ExtendedKey.from_xpub('xpub661MyMwAqRbcFW31YEwpkMuc5THy2PSt5bDMsktWQcFF8syAmRUapSCGu8ED9W6oDMSgv6Zz8idoc4a6mr8BDzTJY47LJhkJ8UB7WEGuduB').derive([0])
+        assert node.serialize_xpub() == 'xpub69H7F5d8KSRgmmdJg2KhpAK8SR3DjMwAdkxj3ZuxV27CprR9LgpeyGmXUbC6wb7ERfvrnKZjXoUmmDznezpbZb7ap6r1D3tgFxHmwMkQTPH'
+
+        with pytest.raises(ValueError):
+            Bip32.derive_public_child(public_bytes, chain_code, 0x80000000)
+        with pytest.raises(ValueError):
+            Bip32.deserialize_xpub('xprvA2JDeKCSNNZky6uBCviVfJSKyQ1mDYahRjijr5idH2WwLsEd4Hsb2Tyh8RfQMuPh7f7RtyzTtdrbdqqsunu5Mm3wDvUAKRHSC34sJ7in334')
+
+    def test_deserialize(self):
+        xprv = 'xprv9s21ZrQH143K3QTDL4LXw2F7HEK3wJUD2nW2nRk4stbPy6cq3jPPqjiChkVvvNKmPGJxWUtg6LnF5kejMRNNU3TGtRBeJgk33yuGBxrMPHi'
+        node = Bip32.deserialize(xprv)
+        assert node.is_private and node.depth == 0 and node.key_type == 'x' and node.network == 'mainnet'
+        assert node.serialize() == xprv
+        assert node.derive("m/0'/1").serialize_xprv() == 'xprv9wTYmMFdV23N2TdNG573QoEsfRrWKQgWeibmLntzniatZvR9BmLnvSxqu53Kw1UmYPxLgboyZQaXwTCg8MSY3H2EU4pWcQDnRnrVA1xe8fs'
+
+        # Ref: https://github.com/bitcoin/bips/blob/master/bip-0084.mediawiki, account m/84'/0'/0'
+        zprv = 'zprvAdG4iTXWBoARxkkzNpNh8r6Qag3irQB8PzEMkAFeTRXxHpbF9z4QgEvBRmfvqWvGp42t42nvgGpNgYSJA9iefm1yYNZKEm7z6qUWCroSQnE'
+        zpub = 'zpub6rFR7y4Q2AijBEqTUquhVz398htDFrtymD9xYYfG1m4wAcvPhXNfE3EfH1r1ADqtfSdVCToUG868RvUUkgDKf31mGDtKsAYz2oz2AGutZYs'
+        account = Bip32.deserialize(zprv)
+        assert account.key_type == 'z' and account.depth == 3
+        assert account.neuter().serialize() == zpub
+        assert account.derive([0, 0]).neuter().serialize_xpub() == Bip32.deserialize(zpub).derive([0, 0]).serialize()
+        assert account.derive([0, 0]).public_bytes.hex() == '0330d54fd0dd420a6e5f8d3624f5f3482cae350f79d5f0753bf5beef9c2d91af3c'
+
+        tpub = ExtendedKey(0, b'\x00\x00\x00\x00', 0, node.chain_code, public_bytes=node.public_bytes, key_type='t')
+        assert tpub.serialize().startswith('tpub')
+        assert Bip32.deserialize(tpub.serialize()).network == 'testnet'
+
+        with pytest.raises(ValueError):
+            ExtendedKey.from_xpub(xprv)
+        with pytest.raises(ValueError):
+            ExtendedKey.from_xprv(zpub)
+
+    def test_deserialize_invalid(self):
+        # https://github.com/bitcoin/bips/blob/master/bip-0032.mediawiki#test-vector-5
+        invalid = [
+            'xpub661MyMwAqRbcEYS8w7XLSVeEsBXy79zSzH1J8vCdxAZningWLdN3zgtU6LBpB85b3D2yc8sfvZU521AAwdZafEz7mnzBBsz4wKY5fTtTQBm',
+            'xprv9s21ZrQH143K24Mfq5zL5MhWK9hUhhGbd45hLXo2Pq2oqzMMo63oStZzFGTQQD3dC4H2D5GBj7vWvSQaaBv5cxi9gafk7NF3pnBju6dwKvH',
+            'xpub661MyMwAqRbcEYS8w7XLSVeEsBXy79zSzH1J8vCdxAZningWLdN3zgtU6Txnt3siSujt9RCVYsx4qHZGc62TG4McvMGcAUjeuwZdduYEvFn',
+            'xprv9s21ZrQH143K24Mfq5zL5MhWK9hUhhGbd45hLXo2Pq2oqzMMo63oStZzFGpWnsj83BHtEy5Zt8CcDr1UiRXuWCmTQLxEK9vbz5gPstX92JQ',
+            'xprv9s2SPatNQ9Vc6GTbVMFPFo7jsaZySyzk7L8n2uqKXJen3KUmvQNTuLh3fhZMBoG3G4ZW1N2kZuHEPY53qmbZzCHshoQnNf4GvELZfqTUrcv',
+            'xpub661no6RGEX3uJkY4bNnPcw4URcQTrSibUZ4NqJEw5eBkv7ovTwgiT91XX27VbEXGENhYRCf7hyEbWrR3FewATdCEebj6znwMfQkhRYHRLpJ',
+            'xprv9s21ZrQH4r4TsiLvyLXqM9P7k1K3EYhA1kkD6xuquB5i39AU8KF42acDyL3qsDbU9NmZn6MsGSUYZEsuoePmjzsB3eFKSUEh3Gu1N3cqVUN',
+            'xprv9s21ZrQH143K24Mfq5zL5MhWK9hUhhGbd45hLXo2Pq2oqzMMo63oStZzF93Y5wvzdUayhgkkFoicQZcP3y52uPPxFnfoLZB21Teqt1VvEHx',
+            'xpub661MyMwAqRbcEYS8w7XLSVeEsBXy79zSzH1J8vCdxAZningWLdN3zgtU6Q5JXayek4PRsn35jii4veMimro1xefsM58PgBMrvdYre8QyULY',
+            'DMwo58pR1QLEFihHiXPVykYB6fJmsTeHvyTp7hRThAtCX8CvYzgPcn8XnmdfHGMQzT7ayAmfo4z3gY5KfbrZWZ6St24UVf2Qgo6oujFktLHdHY4',
+        ]
+        for extended_key in invalid:
+            with pytest.raises(ValueError):
+                Bip32.deserialize(extended_key)
+
+    def test_path_template(self):
+        assert Bip32.parse_path_template("m/84'/{0,1}h/0-2/*") == [
+            (range(0x80000054, 0x80000055),),
+            (range(0x80000000, 0x80000001), range(0x80000001, 0x80000002)),
+            (range(0, 3),),
+            (range(0, 0x80000000),),
+        ]
+        assert Bip32.parse_path_template("m/{0-1,5}'") == [(range(0x80000000, 0x80000002), range(0x80000005, 0x80000006))]
+        paths = list(Bip32.expand_path_template("m/0'/{0,1}/3-4"))
+        assert [Bip32.format_path(path) for path in paths] == ["m/0'/0/3", "m/0'/0/4", "m/0'/1/3", "m/0'/1/4"]
+        for template in ['84/0', "m/5-1", 'm/{0,a}', 'm/0-2147483648']:
+            with pytest.raises(ValueError):
+                Bip32.parse_path_template(template)
+
+    def test_derive_template(self, monkeypatch):
+        seed_bytes = bytes.fromhex('000102030405060708090a0b0c0d0e0f')
+        master = ExtendedKey.from_seed(seed_bytes)
+        template = "m/84'/0'/{0,1}'/{0,1}/0-4"
+        expected = [(path, master.derive(path)) for path in Bip32.expand_path_template(template)]
+
+        derived = []
+        child = ExtendedKey.child
+        monkeypatch.setattr(ExtendedKey, 'child', lambda node, index: derived.append(index) or child(node, index))
+        results = list(master.derive_template(template))
+        assert [path for path, _ in results] == [path for path, _ in expected]
+        assert [node.serialize_xprv() for _, node in results] == [node.serialize_xprv() for _, node in expected]
+        # Internal nodes are derived once: 1 + 1 + 2 + 4 + 20
+        assert len(derived) == 28
+
+        # Open ranges are consumed lazily
+        leaves = master.derive_template("m/0/*")
+        assert [Bip32.format_path(path) for path, _ in itertools.islice(leaves, 3)] == ['m/0/0', 'm/0/1', 'm/0/2']
@@ -1,4 +1,8 @@
-from lib.bip39 import Bip39
+import hashlib
+
+import pytest
+
+from lib.bip39 import Bip39, numpy
 
 
 class TestBip39:
@@ -9,6 +13,24 @@ class TestBip39:
         wordlist = Bip39.get_wordlist()
         assert len(wordlist) == 2048
 
+    def test_wordlist_lookup(self):
+        wordlist = Bip39.wordlist()
+        assert wordlist is Bip39.wordlist()
+        assert wordlist[0] == 'abandon'
+        assert wordlist.index('zoo') == 2047
+        assert wordlist.lookup('abandon') == 0
+        assert wordlist.lookup('aban') == 0
+        assert wordlist.lookup('aband') == 0
+        assert wordlist.lookup('act') == wordlist.index('act')
+        with pytest.raises(ValueError):
+            wordlist.index('aban')
+        with pytest.raises(ValueError):
+            wordlist.lookup('abandons')
+        with pytest.raises(ValueError):
+            wordlist.lookup('aba')
+        with pytest.raises(ValueError):
+            Bip39.mnemonic_to_entropy('abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon bitcoin')
+
     def test_generate_random_mnemonic(self):
         mnemonic = Bip39.generate_random_mnemonic(128)
         words = mnemonic.strip().split()
@@ -36,6 +58,28 @@ class TestBip39:
         mnemonic = Bip39.entropy_to_mnemonic(entropy_bytes)
         assert mnemonic == 'void come effort suffer camp survey warrior heavy shoot primary clutch crush open amazing screen patrol group space point ten exist slush involve unfold'
 
+    def test_entropy_mnemonic_batch(self):
+        entropies = [hashlib.sha256(bytes([i])).digest()[:length] for i in range(40) for length in [16, 20, 24, 28, 32]]
+        mnemonics = [Bip39.entropy_to_mnemonic(entropy_bytes) for entropy_bytes in entropies]
+        assert Bip39.entropy_to_mnemonic_batch(entropies, use_numpy=False) == mnemonics
+        assert Bip39.mnemonic_to_entropy_batch(mnemonics, use_numpy=False) == entropies
+
+        invalid = ['abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon', 'abandon']
+        assert Bip39.mnemonic_to_entropy_batch(mnemonics[:2] + invalid, strict=False, use_numpy=False) == entropies[:2] + [None, None]
+        with pytest.raises(ValueError):
+            Bip39.mnemonic_to_entropy_batch(invalid, use_numpy=False)
+        assert Bip39.entropy_to_mnemonic_batch([b'\x00' * 15], strict=False, use_numpy=False) == [None]
+
+        if numpy is None:
+            pytest.skip('NumPy is not installed')
+        assert Bip39.entropy_to_mnemonic_batch(entropies, use_numpy=True) == mnemonics
+        array = numpy.frombuffer(b''.join(entropies[::5]), dtype=numpy.uint8).reshape(-1, 16)
+        assert Bip39.entropy_to_mnemonic_batch(array, use_numpy=True) == mnemonics[::5]
+        assert Bip39.mnemonic_to_entropy_batch(mnemonics, use_numpy=True) == entropies
+        assert Bip39.mnemonic_to_entropy_batch(mnemonics[:2] + invalid, strict=False, use_numpy=True) == entropies[:2] + [None, None]
+        with pytest.raises(ValueError):
+            Bip39.mnemonic_to_entropy_batch(invalid[:1], use_numpy=True)
+
     def test_mnemonic_and_passphrase_to_seed(self):
         mnemonic = 'abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about'
         seed_bytes = Bip39.mnemonic_and_passphrase_to_seed(mnemonic, TestBip39.PASSPHRASE)
@@ -44,3 +88,11 @@ class TestBip39:
         mnemonic = 'void come effort suffer camp survey warrior heavy shoot primary clutch crush open amazing screen patrol group space point ten exist slush involve unfold'
         seed_bytes = Bip39.mnemonic_and_passphrase_to_seed(mnemonic, TestBip39.PASSPHRASE)
         assert seed_bytes.hex() == '01f5bced59dec48e362f2c45b5de68b9fd6c92c6634f44d6d40aab69056506f0e35524a518034ddc1192e1dacd32c1ed3eaa3c3b131c88ed8e7e54c49a5d0998'
+
+    def test_mnemonic_and_passphrase_to_seed_batch(self):
+        pairs = [(Bip39.entropy_to_mnemonic(bytes([i]) * 16), passphrase) for i in range(10) for passphrase in ['', 'TREZOR']]
+        expected = [Bip39.mnemonic_and_passphrase_to_seed(mnemonic, passphrase) for mnemonic, passphrase in pairs]
+        assert list(Bip39.mnemonic_and_passphrase_to_seed_batch(pairs, workers=1)) == expected
+        assert list(Bip39.mnemonic_and_passphrase_to_seed_batch(pairs, workers=2, chunk_size=3)) == expected
+        assert list(Bip39.mnemonic_and_passphrase_to_seed_batch(iter(pairs), workers=2, executor='process', chunk_size=7)) == expected
+        assert list(Bip39.mnemonic_and_passphrase_to_seed_batch([])) == []
@@ -1,10 +1,13 @@
 import hashlib
 
 import ecdsa
+import pytest
 
-from lib.btc_address import BtcAddress
+from lib.base58check import Base58Check
+from lib.btc_address import BtcAddress, PublicAddresses
 
 
+@pytest.mark.usefixtures('secp256k1_backend')
 class TestBtcAddress:
 
     def test_convert_private_key_into_wif(self):
@@ -26,6 +29,17 @@ class TestBtcAddress:
         private_key_bytes = BtcAddress.convert_wif_into_private_key(wif_str)
         assert private_key_bytes == bytes.fromhex('7da2fdb47a93e15c8ff65315e4b9786a49b3fe69bd38a2cea3e82fae0ae5cc5f')
 
+        # Uncompressed WIF. Ref: https://en.bitcoin.it/wiki/Wallet_import_format
+        wif_str = '5HueCGU8rMjxEXxiPuD5BDku4MkFqeZyd4dZ1jvhTVqvbTLvyTJ'
+        private_key_bytes = BtcAddress.convert_wif_into_private_key(wif_str)
+        assert private_key_bytes == bytes.fromhex('0c28fca386c7a227600b2fe50b7cae11ec86d3bf1fbe471be89827e19d72aa1d')
+
+        # Wrong suffix, wrong length, wrong version
+        for payload in (b'\x80' + bytes(31) + b'\x01' + b'\x02', b'\x80' + bytes(31),
+                        b'\x80' + bytes(31) + b'\x01' + b'\x01\x01', b'\xef' + bytes(31) + b'\x01' + b'\x01'):
+            with pytest.raises(ValueError):
+                BtcAddress.convert_wif_into_private_key(Base58Check.encode_check(payload))
+
     def test_derive_public_addresses_01(self):
         # Ref: https://www.palkeo.com/en/blog/stealing-bitcoin.html
         private_key_bytes = bytes.fromhex('0000000000000000000000000000000000000000000000000000000000000001')
@@ -76,3 +90,54 @@ class TestBtcAddress:
         assert btc_address_1 == '1JPbzbsAx1HyaDQoLMapWGoqf9pD5uha5m'
         assert btc_address_3 == '38Kw57SDszoUEikRwJNBpypPSdpbAhToeD'
         assert btc_address_bc1q == 'bc1q4h0ycu78h88wzldxc7e79vhw5xsde0n8jk4wl5'
+
+    def test_decode_address(self):
+        kind, hashed = BtcAddress.decode_address('1Bu6YxH64nfvhdDsYNEP8PftoBMqgusdPS')
+        assert kind == 'p2pkh'
+        assert BtcAddress.p2pkh_address(hashed) == '1Bu6YxH64nfvhdDsYNEP8PftoBMqgusdPS'
+        kind, hashed = BtcAddress.decode_address('38dRrGx5YbrnRWuWcJv5i2XHjYUnHE2wvv')
+        assert kind == 'p2sh'
+        kind, hashed = BtcAddress.decode_address('bc1q2jxe5azr6zmhk3258av7ul6cqtu4eu4mps8f4p')
+        assert kind == 'p2wpkh'
+        assert BtcAddress.p2wpkh_address(hashed) == 'bc1q2jxe5azr6zmhk3258av7ul6cqtu4eu4mps8f4p'
+        assert BtcAddress.p2sh_p2wpkh_address(hashed) == '38dRrGx5YbrnRWuWcJv5i2XHjYUnHE2wvv'
+        for address in ['1Bu6YxH64nfvhdDsYNEP8PftoBMqgusdPs', 'bc1q2jxe5azr6zmhk3258av7ul6cqtu4eu4mps8f4q', 'hello']:
+            with pytest.raises(ValueError):
+                BtcAddress.decode_address(address)
+
+    def test_derive_addresses(self, capsys):
+        private_key_bytes = bytes.fromhex('03902e4f09664bc177fe4e090dcd9906b432b50f15fb6151984475c1c75c35b6')
+        assert BtcAddress.derive_addresses(private_key_bytes, ('p2wpkh',)) == ('bc1q2jxe5azr6zmhk3258av7ul6cqtu4eu4mps8f4p',)
+        assert BtcAddress.derive_addresses(private_key_bytes)[:3] == BtcAddress.derive_public_addresses(private_key_bytes)
+        BtcAddress.convert_private_key_into_wif(private_key_bytes)
+        assert capsys.readouterr().out == ''
+
+        BtcAddress.derive_public_addresses(private_key_bytes, verbose=True)
+        assert '1Bu6YxH64nfvhdDsYNEP8PftoBMqgusdPS' in capsys.readouterr().out
+
+    def test_public_addresses(self):
+        private_key_bytes = bytes.fromhex('03902e4f09664bc177fe4e090dcd9906b432b50f15fb6151984475c1c75c35b6')
+        addresses = PublicAddresses(private_key_bytes=private_key_bytes)
+        assert addresses.p2wpkh == 'bc1q2jxe5azr6zmhk3258av7ul6cqtu4eu4mps8f4p'
+        # Only what p2wpkh needs was computed
+        assert addresses._public_key is None
+        assert addresses.p2sh_p2wpkh == '38dRrGx5YbrnRWuWcJv5i2XHjYUnHE2wvv'
+        assert addresses.get('p2pkh') == '1Bu6YxH64nfvhdDsYNEP8PftoBMqgusdPS'
+        assert addresses.redeem_script == b'\x00\x14' + addresses.hash160
+        assert addresses.get('p2pkh-compressed') == BtcAddress.p2pkh_address(addresses.hash160)
+
+        from_public = PublicAddresses(public_key_bytes=addresses.compressed_public_key)
+        assert from_public.p2pkh == addresses.p2pkh
+        assert from_public.public_key == addresses.public_key
+        with pytest.raises(ValueError):
+            addresses.get('p2wsh')
+
+    def test_p2tr_address(self):
+        # Ref: https://github.com/bitcoin/bips/blob/master/bip-0086.mediawiki (m/86'/0'/0'/0/0)
+        internal_key = bytes.fromhex('03cc8a4bc64d897bddc5fbc2f670f7a8ba0b386779106cf1223c6fc5d7cd6fc115')
+        output_key = BtcAddress.taproot_output_key(internal_key)
+        assert output_key.hex() == 'a60869f0dbcf1dc659c9cecbaf8050135ea9e8cdc487053f1dc6880949dc684c'
+        address = BtcAddress.p2tr_address(output_key)
+        assert address == 'bc1p5cyxnuxmeuwuvkwfem96lqzszd02n6xdcjrs20cac6yqjjwudpxqkedrcr'
+        assert BtcAddress.decode_address(address) == ('p2tr', output_key)
+        assert PublicAddresses(public_key_bytes=internal_key).p2tr == address
@@ -0,0 +1,99 @@
+import io
+import json
+
+import pytest
+
+from lib.bip32 import ExtendedKey
+from lib.bip39 import Bip39
+from lib.btc_address import BtcAddress
+from lib.cli import Cli
+
+
+class TestCli:
+
+    MNEMONIC = 'abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about'
+
+    @staticmethod
+    def run(argv, text):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        code = Cli.main(argv, stdin=io.StringIO(text), stdout=stdout, stderr=stderr)
+        return code, stdout.getvalue(), stderr.getvalue()
+
+    def test_detect_input_type(self):
+        assert Cli.detect_input_type(TestCli.MNEMONIC) == 'mnemonic'
+        assert Cli.detect_input_type('000102030405060708090a0b0c0d0e0f') == 'seed'
+        master = ExtendedKey.from_seed(bytes(16))
+        assert Cli.detect_input_type(master.serialize_xprv()) == 'xprv'
+        assert Cli.detect_input_type(master.serialize_xpub()) == 'xpub'
+
+    @pytest.mark.parametrize('workers,executor', [(1, 'process'), (2, 'thread'), (2, 'process')])
+    def test_jsonl(self, workers, executor):
+        text = '\n'.join([TestCli.MNEMONIC, '# comment', '', '000102030405060708090a0b0c0d0e0f'] * 3) + '\n'
+        code, out, err = self.run(['--path', "m/84'/0'/0'/{0,1}/0-2", '--kinds', 'p2wpkh,p2pkh', '--workers',
+                                   str(workers), '--executor', executor, '--chunk-size', '1'], text)
+        assert (code, err) == (0, '')
+        rows = [json.loads(line) for line in out.splitlines()]
+        assert rows[0] == {'line': 1, 'path': "m/84'/0'/0'/0/0", 'p2wpkh': 'bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu',
+                           'p2pkh': '1B7CowYzgw4PV2LjcHkKzVAzrsfF7uacfV'}
+        assert [row['path'] for row in rows[:6]] == [f"m/84'/0'/0'/{chain}/{index}" for chain in (0, 1)
+                                                     for index in range(3)]
+        # Input order is kept
+        assert [row['line'] for row in rows[::6]] == [1, 4, 5, 8, 9, 12]
+
+    def test_xpub_relative_path(self):
+        master = ExtendedKey.from_seed(Bip39.mnemonic_and_passphrase_to_seed(TestCli.MNEMONIC, ''))
+        account = master.derive("m/84'/0'/0'")
+        code, out, _ = self.run(['--path', 'm/0/0-1', '--public-key', '--workers', '1'],
+                                account.neuter().serialize_xpub() + '\n' + account.serialize_xprv() + '\n')
+        rows = [json.loads(line) for line in out.splitlines()]
+        assert code == 0
+        assert rows[0]['p2wpkh'] == 'bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu'
+        assert rows[0]['public_key'] == account.derive('m/0/0').public_bytes.hex()
+        assert [row['p2wpkh'] for row in rows[:2]] == [row['p2wpkh'] for row in rows[2:]]
+
+    def test_csv_wif(self):
+        code, out, _ = self.run(['--format', 'csv', '--path', 'm/0/0', '--wif', '--workers', '1'],
+                                '000102030405060708090a0b0c0d0e0f\n')
+        child = ExtendedKey.from_seed(bytes.fromhex('000102030405060708090a0b0c0d0e0f')).derive('m/0/0')
+        header, row = out.splitlines()
+        assert code == 0
+        assert header == 'line,path,p2wpkh,wif'
+        assert row.split(',')[3] == BtcAddress.convert_private_key_into_wif(child.private_int.to_bytes(32, 'big'))
+        code, _, err = self.run(['--path', 'm/0/0', '--wif', '--workers', '1'], child.neuter().serialize_xpub())
+        assert code == 1
+        assert err == 'line 1: --wif needs a private input\n'
+
+    def test_invalid(self):
+        text = TestCli.MNEMONIC + '\nnot a mnemonic\n' + TestCli.MNEMONIC + '\n'
+        code, out, err = self.run(['--path', 'm/0', '--workers', '1'], text)
+        assert code == 1
+        assert len(out.splitlines()) == 1
+        assert err.startswith('line 2: ')
+        code, out, err = self.run(['--path', 'm/0', '--workers', '1', '--skip-invalid'], text)
+        assert code == 0
+        assert [json.loads(line)['line'] for line in out.splitlines()] == [1, 3]
+        with pytest.raises(SystemExit):
+            self.run(['--kinds', 'p2wsh'], '')
+        with pytest.raises(SystemExit):
+            self.run(['--path', 'm/x'], '')
+        # Open ranges would derive until memory runs out
+        with pytest.raises(SystemExit):
+            self.run(['--path', 'm/0/*'], '')
+
+    def test_passphrase(self, monkeypatch):
+        argv = ['--path', "m/84'/0'/0'/0/0", '--workers', '1']
+        # m/84'/0'/0'/0/0 of MNEMONIC with passphrase TREZOR, see test_hd_wallets.py
+        expected = 'bc1qv5rmq0kt9yz3pm36wvzct7p3x6mtgehjul0feu'
+        _, out, _ = self.run(argv + ['--passphrase', 'TREZOR'], TestCli.MNEMONIC)
+        assert json.loads(out)['p2wpkh'] == expected
+        monkeypatch.setenv('BIP39_PASSPHRASE', 'TREZOR')
+        _, out, _ = self.run(argv + ['--passphrase-env', 'BIP39_PASSPHRASE'], TestCli.MNEMONIC)
+        assert json.loads(out)['p2wpkh'] == expected
+        monkeypatch.setattr('getpass.getpass', lambda prompt: 'TREZOR')
+        _, out, _ = self.run(argv + ['--passphrase-prompt'], TestCli.MNEMONIC)
+        assert json.loads(out)['p2wpkh'] == expected
+        with pytest.raises(SystemExit):
+            self.run(argv + ['--passphrase-env', 'NO_SUCH_VARIABLE_SET'], TestCli.MNEMONIC)
+        with pytest.raises(SystemExit):
+            self.run(argv + ['--passphrase', 'x', '--passphrase-prompt'], TestCli.MNEMONIC)
@@ -0,0 +1,64 @@
+import pytest
+
+from lib.address_range import AddressRange
+from lib.bip32 import ExtendedKey
+from lib.bip39 import Bip39
+from lib.discovery import AccountDiscovery, MemoryHistory, SqliteHistory
+
+
+class TestAccountDiscovery:
+
+    MNEMONIC = 'abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about'
+
+    @staticmethod
+    def address(master: ExtendedKey, path: str, chain: int, index: int, kind: str = 'p2wpkh') -> str:
+        _, _, _, (address,) = next(AddressRange.derive_address_range(master.derive(path), chain, index, 1, (kind,)))
+        return address
+
+    @pytest.mark.parametrize('workers', [1, 4])
+    def test_discover(self, workers):
+        master = ExtendedKey.from_seed(Bip39.mnemonic_and_passphrase_to_seed(TestAccountDiscovery.MNEMONIC, ''))
+        # First receive address of m/84'/0'/0'
+        assert self.address(master, "m/84'/0'/0'", 0, 0) == 'bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu'
+        history = MemoryHistory([
+            self.address(master, "m/84'/0'/0'", 0, 0),
+            self.address(master, "m/84'/0'/0'", 0, 15),
+            self.address(master, "m/84'/0'/0'", 0, 34),        # within the gap limit of index 15
+            self.address(master, "m/84'/0'/0'", 0, 60),        # beyond the gap limit of index 34
+            self.address(master, "m/84'/0'/0'", 1, 3),
+            self.address(master, "m/84'/0'/1'", 0, 7),
+            self.address(master, "m/84'/0'/3'", 0, 0),         # after the unused account 2
+        ])
+        discovery = AccountDiscovery(history, gap_limit=20, batch_size=10, workers=workers)
+        accounts = discovery.discover(master)
+        assert [account.index for account in accounts] == [0, 1]
+        assert accounts[0].used == {0: [0, 15, 34], 1: [3]}
+        assert accounts[0].next_index == {0: 35, 1: 4}
+        assert accounts[0].xpub == master.derive("m/84'/0'/0'").neuter().serialize_xpub()
+        assert accounts[1].used == {0: [7], 1: []}
+
+        # Watch-only scan of a stored account xpub
+        account = discovery.scan_account(ExtendedKey.from_xpub(accounts[1].xpub))
+        assert account == accounts[1]
+
+    def test_sqlite_history(self, tmp_path):
+        master = ExtendedKey.from_seed(Bip39.mnemonic_and_passphrase_to_seed(TestAccountDiscovery.MNEMONIC, ''))
+        history = SqliteHistory(str(tmp_path / 'history.sqlite'))
+        # BIP 44 wallets use compressed P2PKH addresses
+        assert self.address(master, "m/44'/0'/0'", 0, 0, 'p2pkh-compressed') == '1LqBGSKuX5yYUonjxT5qGfpUsXKYYWeabA'
+        history.add([self.address(master, "m/44'/0'/0'", 0, 2, 'p2pkh-compressed'),
+                     self.address(master, "m/44'/0'/0'", 1, 0, 'p2pkh')])
+        assert history.has_history(['1BvgsfsZQVtkLS69NvGF8rw6NZW2ShJQHr', 'x']) == [False, False]
+
+        discovery = AccountDiscovery(history, purpose=44, gap_limit=5, workers=2)
+        accounts = discovery.discover(master)
+        assert len(accounts) == 1
+        assert accounts[0].used == {0: [2], 1: []}
+        # One lookup per batch of gap_limit addresses: 2 on the external and 1 on the internal chain of account 0,
+        # and one on the external chain of account 1; look-ahead scans may add a few more
+        assert discovery.lookups >= 4
+
+        with pytest.raises(ValueError):
+            AccountDiscovery(history, purpose=45)
+        with pytest.raises(ValueError):
+            discovery.discover(master.neuter())
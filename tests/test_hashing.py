@@ -0,0 +1,39 @@
+import hashlib
+import hmac
+
+from lib.hashing import Hashing, Ripemd160
+
+
+class TestHashing:
+
+    def test_ripemd160(self):
+        # Ref: https://homes.esat.kuleuven.be/~bosselae/ripemd160.html
+        vectors = [
+            (b'', '9c1185a5c5e9fc54612808977ee8f548b2258d31'),
+            (b'abc', '8eb208f7e05d987a9b044a8e98c6b087f15a0bfc'),
+            (b'message digest', '5d0689ef49d2fae572b881b123a85ffa21595f36'),
+            (b'abcdbcdecdefdefgefghfghighijhijkijkljklmklmnlmnomnopnopq', '12a053384a9c0c88e405a06c27dcf49ada62eb2b'),
+            (b'1234567890' * 8, '9b752e45573d4b39f4dbd3323cab82bf63326bfb'),
+        ]
+        for message, digest_hex in vectors:
+            assert Ripemd160.digest(message).hex() == digest_hex
+            assert Hashing.ripemd160(message).hex() == digest_hex
+
+    def test_hash160_hash256(self):
+        public_key = bytes.fromhex('0339a36013301597daef41fbe593a02cc513d0b55527ec2df1050e2e8ff49c85c2')
+        assert Hashing.hash160(public_key).hex() == '3442193e1bb70916e914552172cd4e2dbc9df811'
+        assert Hashing.hash256(b'hello').hex() == '9595c9df90075148eb06860365df33584b75bff782a510c6cd4883a419833d50'
+        assert Hashing.hash160_batch([public_key, b'']) == [Hashing.hash160(public_key), Hashing.hash160(b'')]
+        assert Hashing.hash256_batch([b'hello']) == [Hashing.hash256(b'hello')]
+
+    def test_prefixed(self):
+        payload = bytes(range(20))
+        assert Hashing.checksum_prefixed(b'\x05', payload) == Hashing.checksum(b'\x05' + payload)
+        assert Hashing.checksum(payload) == Hashing.hash256(payload)[:4]
+        assert Hashing.hash160_prefixed(b'\x00\x14', payload) == Hashing.hash160(b'\x00\x14' + payload)
+        assert Hashing.sha256_prefixed(b'\x00', payload).digest() == hashlib.sha256(b'\x00' + payload).digest()
+
+    def test_hmac_sha512(self):
+        seed = bytes.fromhex('000102030405060708090a0b0c0d0e0f')
+        for key in [b'Bitcoin seed', b'not cached']:
+            assert Hashing.hmac_sha512(key, seed) == hmac.new(key, seed, hashlib.sha512).digest()
@@ -1,8 +1,11 @@
+import pytest
+
 from lib.bip32 import Bip32
 from lib.bip39 import Bip39
 from lib.btc_address import BtcAddress
 
 
+@pytest.mark.usefixtures('secp256k1_backend')
 class TestHDWallets:
     PASSPHRASE = 'TREZOR'
 
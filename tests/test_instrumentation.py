@@ -0,0 +1,84 @@
+import importlib
+import sys
+
+import pytest
+
+from lib import secp256k1
+from lib.address_range import AddressRange
+from lib.bip32 import Bip32, ExtendedKey
+from lib.bip39 import Bip39
+from lib.btc_address import BtcAddress
+from lib.hashing import Hashing
+from lib.instrumentation import Instrumentation
+
+
+class TestInstrumentation:
+
+    SEED = bytes.fromhex('000102030405060708090a0b0c0d0e0f')
+
+    @pytest.mark.parametrize('backend', ['python', 'coincurve'])
+    def test_record(self, backend, monkeypatch):
+        if backend not in secp256k1.BACKENDS or (backend == 'coincurve' and secp256k1.coincurve is None):
+            pytest.skip(f'{backend} backend unavailable')
+        monkeypatch.setattr(secp256k1, 'backend', secp256k1.BACKENDS[backend])
+        expected = Bip32.derive_from_path(TestInstrumentation.SEED, "m/0'/1")
+        with Instrumentation.record() as recording:
+            assert Instrumentation.is_enabled()
+            assert Bip32.derive_from_path(TestInstrumentation.SEED, "m/0'/1") == expected
+            BtcAddress.derive_public_addresses(bytes(31) + b'\x01')
+        stats = recording.snapshot()
+        # Master key, m/0' and m/0'/1 each take one HMAC
+        assert stats['hmac.sha512'].count == 3
+        assert stats['ec.multiply'].count >= 3
+        assert stats['hash.hash160'].count >= 1
+        # P2PKH and P2SH-P2WPKH
+        assert stats['base58.encode'].count == 2
+        assert stats['bech32.encode'].count == 1
+        assert stats['bip32.child'].count == 2
+        assert all(operation_stats.seconds >= 0 for operation_stats in stats.values())
+
+    def test_address_range_hmac(self):
+        account = ExtendedKey.from_seed(TestInstrumentation.SEED).derive("m/84'/0'/0'").neuter()
+        with Instrumentation.record() as recording:
+            assert len(list(AddressRange.derive_address_range(account, 0, 0, 50))) == 50
+        # The chain key, then one per index from the cached chain state
+        assert recording.snapshot()['hmac.sha512'].count == 51
+
+    def test_disabled(self):
+        sha256 = Hashing.__dict__['sha256']
+        alias = BtcAddress.__dict__['sha256']
+        with Instrumentation.record() as recording:
+            assert Hashing.__dict__['sha256'] is not sha256
+            # Aliases kept by other classes are instrumented too
+            BtcAddress.sha256(b'')
+            with Instrumentation.record():
+                Hashing.sha256(b'')
+            assert Instrumentation.is_enabled()
+        assert recording.snapshot()['hash.sha256'].count == 2
+        assert not Instrumentation.is_enabled()
+        assert Hashing.__dict__['sha256'] is sha256 and BtcAddress.__dict__['sha256'] is alias
+        before = Instrumentation.snapshot()
+        Bip39.mnemonic_and_passphrase_to_seed('abandon ' * 11 + 'about')
+        assert Instrumentation.snapshot() == before
+
+    def test_module_imported_later(self, monkeypatch):
+        # A lib module not loaded yet is imported by enable() and patched, so it never keeps a wrapper
+        monkeypatch.delitem(sys.modules, 'lib.btc_address')
+        sha256 = Hashing.__dict__['sha256'].__func__
+        with Instrumentation.record() as recording:
+            module = importlib.import_module('lib.btc_address')
+            assert module.BtcAddress.__dict__['sha256'].__func__ is not sha256
+            module.BtcAddress.sha256(b'')
+        assert recording.snapshot()['hash.sha256'].count == 1
+        assert module.BtcAddress.__dict__['sha256'].__func__ is sha256
+        assert Hashing.__dict__['sha256'].__func__ is sha256
+
+    def test_prometheus(self):
+        with Instrumentation.record() as recording:
+            Hashing.hash256(b'')
+        text = recording.prometheus()
+        assert '# TYPE bitcoin_operations_total counter\n' in text
+        assert 'bitcoin_operations_total{operation="hash.hash256"} 1\n' in text
+        assert 'bitcoin_operation_seconds_total{operation="hash.hash256"} ' in text
+        Instrumentation.reset()
+        assert Instrumentation.snapshot() == {}
@@ -0,0 +1,80 @@
+import pickle
+
+import pytest
+
+from lib import key_store
+from lib.address_range import AddressRange
+from lib.key_store import KeyStore
+
+
+XPUB = 'xpub6BgBgsespWvERF3LHQu6CnqdvfEvtMcQjYrcRzx53QJjSxarj2afYWcLteoGVky7D3UKDP9QyrLprQ3VCECoY49yfdDEHGCtMMj92pReUsQ'
+
+
+class TestKeyStore:
+
+    def test_append_and_save(self, tmp_path):
+        results = list(AddressRange.derive_address_range(XPUB, 0, 0, 20))
+        store = KeyStore()
+        store.extend(result[:3] for result in results)
+        assert len(store) == 20
+        assert store[3] == results[3][:3]
+        assert store[-1] == results[-1][:3]
+        assert list(store) == [result[:3] for result in results]
+        assert store.indexes() == list(range(20))
+        with pytest.raises(IndexError):
+            store[20]
+        with pytest.raises(ValueError):
+            store.append(0, b'\x02' * 32, b'\x00' * 20)
+
+        path = str(tmp_path / 'keys.bin')
+        store.save(path)
+        assert (tmp_path / 'keys.bin').stat().st_size == KeyStore.HEADER.size + 20 * 57
+        loaded = KeyStore.load(path)
+        assert loaded.read_only
+        assert list(loaded) == list(store)
+        assert loaded.hash160s() == [result[2] for result in results]
+        with pytest.raises(ValueError):
+            loaded.append(*results[0][:3])
+
+        # Pickled as its path, e.g. when sent to worker processes
+        assert list(pickle.loads(pickle.dumps(loaded))) == list(store)
+        loaded.close()
+
+        # Closed, the store is empty instead of reading a closed mmap
+        assert len(loaded) == 0
+        assert list(loaded) == []
+        assert not loaded.read_only
+        with pytest.raises(IndexError):
+            loaded[0]
+        loaded.close()
+
+    def test_chain_code(self, tmp_path):
+        store = KeyStore(with_chain_code=True)
+        store.append(7, b'\x03' * 33, b'\x01' * 20, b'\x02' * 32)
+        with pytest.raises(ValueError):
+            store.append(8, b'\x03' * 33, b'\x01' * 20)
+        path = str(tmp_path / 'keys.bin')
+        store.save(path)
+        loaded = KeyStore.load(path)
+        assert loaded.with_chain_code
+        assert loaded[0] == (7, b'\x03' * 33, b'\x01' * 20, b'\x02' * 32)
+        loaded.close()
+
+        (tmp_path / 'bad.bin').write_bytes(b'not a key store')
+        with pytest.raises(ValueError):
+            KeyStore.load(str(tmp_path / 'bad.bin'))
+
+    def test_to_numpy(self, tmp_path):
+        if key_store.numpy is None:
+            pytest.skip('NumPy is not installed')
+        store = KeyStore()
+        store.extend(result[:3] for result in AddressRange.derive_address_range(XPUB, 0, 0, 5))
+        path = str(tmp_path / 'keys.bin')
+        store.save(path)
+        loaded = KeyStore.load(path)
+        array = loaded.to_numpy()
+        assert list(array['index']) == [0, 1, 2, 3, 4]
+        assert bytes(array['hash160'][2]) == store[2][2]
+        assert array['public_key'].shape == (5, 33)
+        del array
+        loaded.close()
@@ -0,0 +1,32 @@
+import pytest
+
+from lib.parallel import Parallel
+
+
+def square(x):
+    return x * x
+
+
+class TestParallel:
+
+    @pytest.mark.parametrize('workers,executor', [(1, 'process'), (2, 'thread'), (2, 'process')])
+    def test_ordered_map(self, workers, executor):
+        results = Parallel.ordered_map(square, range(50), workers=workers, executor=executor, max_in_flight=3)
+        assert list(results) == [x * x for x in range(50)]
+
+    def test_ordered_map_is_lazy(self):
+        consumed = []
+
+        def items():
+            for x in range(1000):
+                consumed.append(x)
+                yield x
+
+        results = Parallel.ordered_map(square, items(), workers=2, executor='thread', max_in_flight=4)
+        assert next(results) == 0
+        assert len(consumed) <= 5
+        results.close()
+
+    def test_ordered_map_invalid_executor(self):
+        with pytest.raises(ValueError):
+            list(Parallel.ordered_map(square, range(3), workers=2, executor='gpu'))
@@ -0,0 +1,87 @@
+import json
+import os
+
+import pytest
+
+from lib.address_range import AddressRange
+from lib.bip32 import ExtendedKey
+from lib.bip39 import Bip39
+from lib.provisioning import WalletProvisioning
+
+
+class TestWalletProvisioning:
+
+    @staticmethod
+    def check(record: dict, passphrase: str = '', kind: str = 'p2wpkh'):
+        account = ExtendedKey.from_seed(Bip39.mnemonic_and_passphrase_to_seed(record['mnemonic'], passphrase)).derive(
+            record['path'])
+        assert record['xprv'] == account.serialize_xprv()
+        assert record['xpub'] == account.neuter().serialize_xpub()
+        assert record['addresses'] == [addresses[0] for _, _, _, addresses in AddressRange.derive_address_range(
+            account.neuter(), 0, 0, len(record['addresses']), (kind,))]
+
+    def test_generate_random_entropy_batch(self):
+        entropies = Bip39.generate_random_entropy_batch(5, 128)
+        assert len(entropies) == 5 and len(set(entropies)) == 5
+        assert all(len(entropy_bytes) == 16 for entropy_bytes in entropies)
+        assert [len(mnemonic.split()) for mnemonic in Bip39.generate_random_mnemonic_batch(2)] == [24, 24]
+        with pytest.raises(ValueError):
+            Bip39.generate_random_entropy_batch(1, 100)
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_run(self, tmp_path, workers):
+        provisioning = WalletProvisioning(str(tmp_path), receive_count=3, entropy_len=128, passphrase='TREZOR',
+                                          chunk_size=4, workers=workers)
+        assert provisioning.run(10) == 10
+        assert sorted(os.listdir(tmp_path)) == ['checkpoint.json', 'wallets-000000.jsonl', 'wallets-000001.jsonl',
+                                                'wallets-000002.jsonl']
+        records = list(provisioning.wallets())
+        assert [record['wallet'] for record in records] == list(range(10))
+        assert len({record['mnemonic'] for record in records}) == 10
+        assert records[0]['path'] == "m/84'/0'/0'"
+        for record in records[:2]:
+            self.check(record, 'TREZOR')
+        assert 'TREZOR' not in (tmp_path / 'checkpoint.json').read_text()
+        # Already complete
+        assert provisioning.run(10) == 0
+
+    def test_resume(self, tmp_path, monkeypatch):
+        provision_chunk = WalletProvisioning.provision_chunk
+        calls = []
+
+        def crash_on_third_chunk(task):
+            calls.append(task)
+            if len(calls) == 3:
+                raise RuntimeError('crash')
+            return provision_chunk(task)
+
+        monkeypatch.setattr(WalletProvisioning, 'provision_chunk', crash_on_third_chunk)
+        provisioning = WalletProvisioning(str(tmp_path), purpose=86, receive_count=2, chunk_size=3, workers=1)
+        with pytest.raises(RuntimeError):
+            provisioning.run(12)
+        monkeypatch.undo()
+        before = list(WalletProvisioning(str(tmp_path), purpose=86, receive_count=2, chunk_size=3).wallets())
+        assert [record['wallet'] for record in before] == list(range(6))
+        # A chunk written but not checkpointed before the crash is discarded
+        (tmp_path / 'wallets-000002.jsonl').write_text(json.dumps({'wallet': 6}) + '\n')
+
+        resumed = WalletProvisioning(str(tmp_path), purpose=86, receive_count=2, chunk_size=3, workers=1)
+        assert resumed.run(12) == 6
+        records = list(resumed.wallets())
+        assert records[:6] == before
+        assert [record['wallet'] for record in records] == list(range(12))
+        assert len({record['mnemonic'] for record in records}) == 12
+        assert records[-1]['addresses'][0].startswith('bc1p')
+        self.check(records[-1], kind='p2tr')
+
+        with pytest.raises(ValueError):
+            WalletProvisioning(str(tmp_path), purpose=84, receive_count=2, chunk_size=3)
+
+    def test_purpose_44(self, tmp_path):
+        # BIP 44 receive addresses are compressed P2PKH, as wallets restoring the mnemonic show them
+        provisioning = WalletProvisioning(str(tmp_path), purpose=44, receive_count=1)
+        record, = WalletProvisioning.provision_chunk((0, [bytes(16)], provisioning.config, '',
+                                                      provisioning.account_path))
+        assert record['mnemonic'] == 'abandon ' * 11 + 'about'
+        assert record['path'] == "m/44'/0'/0'"
+        assert record['addresses'] == ['1LqBGSKuX5yYUonjxT5qGfpUsXKYYWeabA']
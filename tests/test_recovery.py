@@ -0,0 +1,175 @@
+import json
+import os
+import pickle
+
+import pytest
+
+from lib.bip39 import Bip39
+from lib.instrumentation import Instrumentation
+from lib.recovery import MnemonicRecovery, PassphraseRecovery, RecoveryRunner, RecoveryTarget
+
+
+class TestRecovery:
+    MNEMONIC = 'abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about'
+    PASSPHRASE = 'TREZOR'
+    # m/84'/0'/0'/0/0 of MNEMONIC with PASSPHRASE, see test_hd_wallets.py
+    TARGET = RecoveryTarget(address='bc1qv5rmq0kt9yz3pm36wvzct7p3x6mtgehjul0feu', path="m/84'/0'/0'/0/0")
+
+    def test_word_candidates(self):
+        wordlist = Bip39.wordlist()
+        assert MnemonicRecovery.word_candidates('about') == [wordlist.index('about')]
+        assert wordlist.index('abandon') in MnemonicRecovery.word_candidates('abandn')
+        assert wordlist.index('abandon') in MnemonicRecovery.word_candidates('abnadon')
+        assert MnemonicRecovery.word_candidates('aban') == [wordlist.index('abandon')]
+        assert len(MnemonicRecovery.word_candidates('?')) == 2048
+        with pytest.raises(ValueError):
+            MnemonicRecovery.word_candidates('bitcoin')
+
+    def test_matches_seed(self):
+        seed_bytes = Bip39.mnemonic_and_passphrase_to_seed(TestRecovery.MNEMONIC, TestRecovery.PASSPHRASE)
+        with Instrumentation.record() as recording:
+            assert TestRecovery.TARGET.matches_seed(seed_bytes)
+        # One public key per non-hardened level (account and chain keys as parents) and one for the leaf; none
+        # for the fingerprints of the hardened levels
+        assert recording.snapshot()['ec.multiply'].count == 3
+        assert not TestRecovery.TARGET.matches_seed(bytes(64))
+
+        seed_bytes = Bip39.mnemonic_and_passphrase_to_seed(TestRecovery.MNEMONIC)
+        # Ref: https://github.com/bitcoin/bips/blob/master/bip-0086.mediawiki (m/86'/0'/0'/0/0)
+        assert RecoveryTarget(address='bc1p5cyxnuxmeuwuvkwfem96lqzszd02n6xdcjrs20cac6yqjjwudpxqkedrcr',
+                              path="m/86'/0'/0'/0/0").matches_seed(seed_bytes)
+        # Compressed BIP 44 address
+        assert RecoveryTarget(address='1LqBGSKuX5yYUonjxT5qGfpUsXKYYWeabA', path="m/44'/0'/0'/0/0").matches_seed(
+            seed_bytes)
+        assert RecoveryTarget(fingerprint='73c5da0a').matches_seed(seed_bytes)
+
+    def test_recover_unknown_word(self):
+        words = TestRecovery.MNEMONIC.split()
+        words[11] = '?'
+        recovery = MnemonicRecovery(words, TestRecovery.TARGET, TestRecovery.PASSPHRASE)
+        assert recovery.total == 2048
+        progress = []
+        found = RecoveryRunner(recovery, chunk_size=512, workers=1, progress=progress.append).run()
+        assert found == [TestRecovery.MNEMONIC]
+        # Only about 1 in 16 candidates passes the checksum and reaches PBKDF2
+        # Stopped after the chunk holding the match
+        assert progress[-1].done == progress[-1].tested == 512
+        assert progress[-1].derived < progress[-1].tested // 8
+
+    def test_recover_missing_word_and_typo(self):
+        # First word dropped and another one misspelled, matched on the master key fingerprint
+        words = TestRecovery.MNEMONIC.split()[1:]
+        words[3] = 'abandonn'
+        recovery = MnemonicRecovery(words, RecoveryTarget(fingerprint='b4e3f5ed'), TestRecovery.PASSPHRASE)
+        assert recovery.total == 2048 + 11 * 2047
+        found = RecoveryRunner(recovery, chunk_size=1024, workers=2).run()
+        assert found == [TestRecovery.MNEMONIC]
+
+    def test_candidate_count(self):
+        # Missing word: inserting 'abandon' next to an 'abandon' is tried once, not at both positions
+        words = TestRecovery.MNEMONIC.split()[1:]
+        recovery = MnemonicRecovery(words, TestRecovery.TARGET)
+        assert recovery.total == 2048 + 11 * 2047
+        assert len({tuple(recovery.candidate(n)) for n in range(recovery.total)}) == recovery.total
+        # With swaps, mnemonics reached by several insertions and swaps are still tried once
+        words = TestRecovery.MNEMONIC.split()
+        del words[5]
+        recovery = MnemonicRecovery(words, TestRecovery.TARGET, swaps=True)
+        candidates = [tuple(recovery.candidate(n)) for n in range(recovery.total)]
+        assert len(set(candidates)) == len(candidates) == 270150
+
+    def test_part(self):
+        # Chunks are sent to workers with only the templates or words they need
+        words = TestRecovery.MNEMONIC.split()
+        del words[5]
+        recovery = MnemonicRecovery(words, TestRecovery.TARGET, swaps=True)
+        part, start, end = recovery.part(5000, 9096)
+        assert len(part.templates) <= 3
+        assert len(pickle.dumps(part)) < len(pickle.dumps(recovery)) // 20
+        assert [part.candidate(n) for n in range(start, end)] == [recovery.candidate(n) for n in range(5000, 9096)]
+
+        recovery = PassphraseRecovery(TestRecovery.MNEMONIC, TestRecovery.TARGET, words=['a', 'b', 'c'],
+                                      masks=['?d', 'x?d?d'])
+        for first, last in [(0, 2), (1, 5), (4, 20), (14, 113)]:
+            part, start, end = recovery.part(first, last)
+            assert [part.candidate(n) for n in range(start, end)] == [recovery.candidate(n)
+                                                                      for n in range(first, last)]
+        assert part.words == [] and len(part.masks) == 1
+
+    def test_disjoint_templates(self):
+        templates = MnemonicRecovery.disjoint_templates([[[1, 2], [3, 4]], [[2, 5], [4]], [[1], [3]], [[6], []]])
+        candidates = [(a, b) for template in templates for a in template[0] for b in template[1]]
+        assert sorted(candidates) == [(1, 3), (1, 4), (2, 3), (2, 4), (5, 4)]
+
+    def test_recover_swapped_words(self):
+        words = TestRecovery.MNEMONIC.split()
+        words[0], words[11] = words[11], words[0]
+        recovery = MnemonicRecovery(words, TestRecovery.TARGET, TestRecovery.PASSPHRASE, swaps=True)
+        found = RecoveryRunner(recovery, workers=1).run()
+        assert found == [TestRecovery.MNEMONIC]
+
+    def test_checkpoint_resume(self, tmp_path):
+        checkpoint_path = str(tmp_path / 'checkpoint.json')
+        words = TestRecovery.MNEMONIC.split()
+        words[11] = '?'
+        recovery = MnemonicRecovery(words, TestRecovery.TARGET, TestRecovery.PASSPHRASE)
+
+        # Stop after the first chunk, before reaching 'about' (index 3)
+        runner = RecoveryRunner(recovery, chunk_size=2, workers=1, checkpoint_path=checkpoint_path)
+        runner.progress = lambda progress: runner.stop()
+        assert runner.run() == []
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        assert checkpoint['next_chunk'] == 1
+        assert checkpoint['tested'] == 2
+        # Written through a unique temporary file, none left behind
+        assert os.listdir(tmp_path) == ['checkpoint.json']
+
+        found = RecoveryRunner(recovery, chunk_size=2, workers=1, checkpoint_path=checkpoint_path).run()
+        assert found == [TestRecovery.MNEMONIC]
+        with open(checkpoint_path) as f:
+            assert json.load(f)['found'] == [TestRecovery.MNEMONIC]
+
+        other = MnemonicRecovery(words, RecoveryTarget(fingerprint='00000000'), TestRecovery.PASSPHRASE)
+        with pytest.raises(ValueError):
+            RecoveryRunner(other, chunk_size=2, workers=1, checkpoint_path=checkpoint_path).run()
+
+    def test_parse_mask(self):
+        assert PassphraseRecovery.parse_mask('ab?d') == ['a', 'b', '0123456789']
+        assert PassphraseRecovery.parse_mask('??') == ['?']
+        with pytest.raises(ValueError):
+            PassphraseRecovery.parse_mask('?x')
+        with pytest.raises(ValueError):
+            PassphraseRecovery.parse_mask('abc?')
+
+    def test_recover_passphrase_from_words(self):
+        recovery = PassphraseRecovery(TestRecovery.MNEMONIC, TestRecovery.TARGET, words=['hello', 'trezor', 'satoshi'], mutations=['case'])
+        assert recovery.variants('trezor') == ['TREZOR', 'Trezor', 'trezor']
+        progress = []
+        found = RecoveryRunner(recovery, chunk_size=1, workers=1, progress=progress.append).run()
+        assert found == [TestRecovery.PASSPHRASE]
+        assert progress[-1].done == 2
+        assert progress[-1].tested == 6
+
+    def test_recover_passphrase_from_mask(self, tmp_path):
+        checkpoint_path = str(tmp_path / 'checkpoint.json')
+        recovery = PassphraseRecovery(TestRecovery.MNEMONIC, RecoveryTarget(fingerprint='b4e3f5ed'), masks=['TRE?uOR'])
+        assert recovery.total == 26
+        assert recovery.candidate(25) == 'TREZOR'
+
+        runner = RecoveryRunner(recovery, chunk_size=10, workers=1, checkpoint_path=checkpoint_path)
+        runner.progress = lambda progress: runner.stop()
+        assert runner.run() == []
+
+        found = RecoveryRunner(recovery, chunk_size=10, workers=2, checkpoint_path=checkpoint_path).run()
+        assert found == [TestRecovery.PASSPHRASE]
+
+    def test_recover_passphrase_typo(self):
+        recovery = PassphraseRecovery(TestRecovery.MNEMONIC, TestRecovery.TARGET, mutations=['typo'])
+        assert 'TREZOR' in recovery.variants('TREZR')
+        assert 'TREZOR' in recovery.variants('TERZOR')
+        assert 'TREZOR' in recovery.variants('TREZORR')
+
+        # The empty passphrase mistyped as a single 'Q' (fingerprint of MNEMONIC with passphrase 'Q')
+        recovery = PassphraseRecovery(TestRecovery.MNEMONIC, RecoveryTarget(fingerprint='f7bd9db0'), words=[''], mutations=['typo'])
+        assert RecoveryRunner(recovery, workers=1).run() == ['Q']
@@ -0,0 +1,130 @@
+import hashlib
+
+import ecdsa
+import pytest
+
+from lib import secp256k1
+from lib.secp256k1 import Secp256k1
+
+
+class TestSecp256k1:
+    SCALARS = [
+        1,
+        2,
+        255,
+        256,
+        0x353acdd20da43ec797e9d9ce5ec2d2d4f361855d51a76504611521648c5d74b3,
+        int.from_bytes(hashlib.sha256(b'cat').digest(), 'big'),
+        Secp256k1.N - 1,
+    ]
+
+    def test_curve_parameters(self):
+        assert Secp256k1.N == ecdsa.SECP256k1.order
+        assert Secp256k1.P == ecdsa.SECP256k1.curve.p()
+        assert Secp256k1.G == (ecdsa.SECP256k1.generator.x(), ecdsa.SECP256k1.generator.y())
+
+    def test_multiply_generator(self):
+        for k in TestSecp256k1.SCALARS:
+            point = ecdsa.SECP256k1.generator * k
+            assert Secp256k1.multiply_generator(k) == (point.x(), point.y())
+
+    def test_batch_to_affine(self):
+        jacobian_points = [Secp256k1.multiply_generator_jacobian(k) for k in TestSecp256k1.SCALARS]
+        jacobian_points.append(Secp256k1.INFINITY)
+        expected = [Secp256k1.to_affine(point) for point in jacobian_points]
+        assert Secp256k1.batch_to_affine(jacobian_points) == expected
+        assert expected[-1] is None
+
+    def test_jacobian_add(self):
+        p = Secp256k1.multiply_generator_jacobian(7)
+        q = Secp256k1.multiply_generator_jacobian(11)
+        assert Secp256k1.to_affine(Secp256k1.jacobian_add(p, q)) == Secp256k1.multiply_generator(18)
+        assert Secp256k1.to_affine(Secp256k1.jacobian_add(p, p)) == Secp256k1.multiply_generator(14)
+        minus_p = Secp256k1.multiply_generator_jacobian(Secp256k1.N - 7)
+        assert Secp256k1.jacobian_add(p, minus_p)[2] == 0
+
+    @pytest.mark.parametrize('name', secp256k1.BACKENDS)
+    def test_backend(self, name):
+        if name == 'coincurve' and secp256k1.coincurve is None:
+            pytest.skip('coincurve is not installed')
+        backend = secp256k1.BACKENDS[name]
+        for k in TestSecp256k1.SCALARS:
+            vk = ecdsa.SigningKey.from_secret_exponent(k, curve=ecdsa.SECP256k1).verifying_key
+            point = backend.point_from_scalar(k)
+            assert backend.compress(point) == vk.to_string('compressed')
+            assert backend.uncompress(point) == vk.to_string('uncompressed')
+            assert backend.compress(backend.decompress(vk.to_string('compressed'))) == vk.to_string('compressed')
+            assert backend.compress(backend.decompress(vk.to_string('uncompressed'))) == vk.to_string('compressed')
+
+        point = backend.point_add(backend.point_from_scalar(5), backend.point_from_scalar(6))
+        assert backend.compress(point) == backend.compress(backend.point_from_scalar(11))
+
+        for k in [0, Secp256k1.N]:
+            with pytest.raises(ValueError):
+                backend.point_from_scalar(k)
+        with pytest.raises(ValueError):
+            backend.decompress(b'\x02' + b'\xff' * 32)
+
+    def test_set_backend(self):
+        previous = secp256k1.backend
+        try:
+            secp256k1.set_backend('python')
+            assert secp256k1.backend is secp256k1.PythonBackend
+            with pytest.raises(ValueError):
+                secp256k1.set_backend('openssl')
+        finally:
+            secp256k1.backend = previous
+
+    def test_persisted_generator_table(self, tmp_path):
+        path = str(tmp_path / 'gtable.bin')
+        Secp256k1.save_generator_table(path)
+        table = Secp256k1.load_generator_table(path)
+        assert len(table) == 32
+        for i in [0, 1, 31]:
+            assert table[i] == Secp256k1.generator_table()[i]
+
+        # Flip one byte of the last point
+        with open(path, 'r+b') as f:
+            f.seek(-1, 2)
+            last = f.read(1)
+            f.seek(-1, 2)
+            f.write(bytes([last[0] ^ 1]))
+        with pytest.raises(ValueError):
+            Secp256k1.load_generator_table(path)
+
+        with open(path, 'wb') as f:
+            f.write(b'not a table')
+        with pytest.raises(ValueError):
+            Secp256k1.load_generator_table(path)
+
+    def test_generator_table_closed_on_error(self, tmp_path, monkeypatch):
+        path = str(tmp_path / 'gtable.bin')
+        Secp256k1.save_generator_table(path)
+        # A well-formed table with a valid checksum whose first point is not the generator
+        header_len = len(Secp256k1.TABLE_MAGIC) + 1 + 32
+        with open(path, 'rb') as f:
+            data = bytearray(f.read())
+        data[header_len + 63] ^= 1
+        data[header_len - 32:header_len] = hashlib.sha256(data[header_len:]).digest()
+        with open(path, 'wb') as f:
+            f.write(data)
+        mapped = []
+        mmap_class = secp256k1.mmap.mmap
+
+        def mmap_recorded(*args, **kwargs):
+            mapped.append(mmap_class(*args, **kwargs))
+            return mapped[-1]
+        monkeypatch.setattr(secp256k1.mmap, 'mmap', mmap_recorded)
+        with pytest.raises(ValueError, match='does not start with the generator'):
+            Secp256k1.load_generator_table(path)
+        assert mapped[0].closed
+
+    def test_generator_table_fallback(self, tmp_path, monkeypatch):
+        path = tmp_path / 'gtable.bin'
+        path.write_bytes(b'corrupted')
+        monkeypatch.setenv('SECP256K1_TABLE_PATH', str(path))
+        monkeypatch.setattr(Secp256k1, '_g_table', None)
+        assert Secp256k1.multiply_generator(2) == Secp256k1.to_affine(Secp256k1.jacobian_double((*Secp256k1.G, 1)))
+        # Rebuilt in memory and persisted again
+        assert isinstance(Secp256k1._g_table, list)
+        assert isinstance(Secp256k1.load_generator_table(str(path)), secp256k1.MappedGeneratorTable)
@@ -0,0 +1,48 @@
+import pytest
+
+from lib.segwit import SegwitAddress
+
+
+class TestSegwitAddress:
+
+    def test_decode(self):
+        # Ref: https://github.com/bitcoin/bips/blob/master/bip-0350.mediawiki#test-vectors-for-v0-v16-native-segregated-witness-addresses
+        vectors = [
+            ('BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4', 'bc', 0, '751e76e8199196d454941c45d1b3a323f1433bd6'),
+            ('tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sl5k7', 'tb', 0,
+             '1863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262'),
+            ('bc1pw508d6qejxtdg4y5r3zarvary0c5xw7kw508d6qejxtdg4y5r3zarvary0c5xw7kt5nd6y', 'bc', 1,
+             '751e76e8199196d454941c45d1b3a323f1433bd6751e76e8199196d454941c45d1b3a323f1433bd6'),
+            ('BC1SW50QGDZ25J', 'bc', 16, '751e'),
+            ('bc1zw508d6qejxtdg4y5r3zarvaryvaxxpcs', 'bc', 2, '751e76e8199196d454941c45d1b3a323'),
+            ('tb1pqqqqp399et2xygdj5xreqhjjvcmzhxw4aywxecjdzew6hylgvsesf3hn0c', 'tb', 1,
+             '000000c4a5cad46221b2a187905e5266362b99d5e91c6ce24d165dab93e86433'),
+            ('bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0', 'bc', 1,
+             '79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798'),
+        ]
+        for address, hrp, witness_version, program_hex in vectors:
+            assert SegwitAddress.decode(hrp, address) == (witness_version, bytes.fromhex(program_hex))
+            assert SegwitAddress.encode(hrp, witness_version, bytes.fromhex(program_hex)) == address.lower()
+
+    def test_decode_invalid(self):
+        invalid = [
+            'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqh2y7hd',     # v1 with bech32 checksum
+            'BC1S0XLXVLHEMJA6C4DQV22UAPCTQUPFHLXM9H8Z3K2E72Q4K9HCZ7VQ54WELL',     # v16 with bech32 checksum
+            'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kemeawh',                          # v0 with bech32m checksum
+            'bc1p38j9r5y49hruaue7wxjce0updqjuyyx0kh56v8s25huc6995vvpql3jow4',     # invalid character
+            'bc1qr508d6qejxtdg4y5r3zarvaryvq5j6m3p',                               # invalid v0 program length
+            'bc1zw508d6qejxtdg4y5r3zarvaryvqyzf3du',                               # non-zero padding
+            'bc1gmk9yu',                                                           # empty data
+            'tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sl5k7',     # wrong network
+        ]
+        for address in invalid:
+            with pytest.raises(ValueError):
+                SegwitAddress.decode('bc', address)
+        with pytest.raises(ValueError):
+            SegwitAddress.encode('bc', 0, bytes(21))
+
+    def test_batch(self):
+        programs = [bytes([i]) * 32 for i in range(10)]
+        addresses = SegwitAddress.encode_batch('bc', 1, programs)
+        assert all(address.startswith('bc1p') for address in addresses)
+        assert SegwitAddress.decode_batch('bc', addresses) == [(1, program) for program in programs]